@@ -1,13 +1,224 @@
-from flask import Flask, render_template_string, request, send_file, jsonify
-import yt_dlp
+import time
+
+# Momento de inicio, para informar cuánto tarda la aplicación en estar lista
+STARTED_AT = time.perf_counter()
+
+from flask import Flask, Response, g, render_template_string, request, jsonify, url_for, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.wsgi import ClosingIterator
+import copy
+import json
+import mimetypes
 import os
 import re
+import shutil
+import sys
 import tempfile
+import threading
+
+from cache import TTLCache, extract_video_id, canonical_video_url
+from jobs import JobManager
+from singleflight import SingleFlight
+from ydl_pool import YoutubeDLPool
+from result_cache import ResultCache, result_key
+from streaming import find_format, is_streamable, iter_stream
+from batch import is_playlist_url, iter_zip, list_entries, start_entries
+from format_planner import choose_audio_mode, choose_plan, estimate_audio_size, estimate_format_size, list_plans, parse_limit
+from transcoding import TranscodePool
+from metrics import Registry, directory_size
+from connections import ConnectionLimiter
+from clips import parse_clip
+from scheduler import PRIORITY_NORMAL, PRIORITY_SMALL, BandwidthAllocator, QueueFull
+from state import SharedSemaphore, open_backend
+from delivery import FileDelivery, parse_accel_map
+from prefetch import Prefetcher
 
 app = Flask(__name__)
 
-# Usar directorio temporal para descargas
-DOWNLOAD_FOLDER = tempfile.mkdtemp()
+# Detrás de un proxy todos los clientes llegan con la dirección del proxy, y el reparto
+# por cliente dejaría de funcionar: TRUSTED_PROXIES indica cuántos proxies añaden
+# X-Forwarded-For para tomar de ahí la dirección real. Con 0 no se confía en la cabecera
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# Estado de trabajos, metadatos e índice de la caché, compartido por los procesos
+# del nodo y conservado entre reinicios; memory:// lo mantiene en cada proceso
+STATE = open_backend(os.environ.get(
+    "STATE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "youtube_downloader_state.db")))
+
+# Directorio de descargas; con estado compartido todos los procesos deben usar el mismo,
+# y uno fijo conserva los .part entre reinicios
+DOWNLOAD_FOLDER = os.environ.get("DOWNLOAD_FOLDER") or (
+    os.path.join(tempfile.gettempdir(), "youtube_downloader_downloads") if STATE.shared else tempfile.mkdtemp())
+os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+
+# Procesos de la aplicación en el nodo (gunicorn -w; WEB_CONCURRENCY es su valor por
+# defecto). Los límites de descargas y conversiones son del nodo: con estado compartido
+# se coordinan en el backend. El caudal y las conexiones al origen, que se cuentan por
+# bloque, se reparten a partes iguales entre los procesos
+APP_PROCESSES = max(1, int(os.environ.get("APP_PROCESSES") or os.environ.get("WEB_CONCURRENCY") or 1))
+
+def node_slots(name, limit):
+    """Límite común a los procesos del nodo, o None si el estado no se comparte"""
+    return SharedSemaphore(STATE, name, limit) if STATE.shared else None
+
+# Reintentos de descarga: los de yt-dlp por petición y los del trabajo completo
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", 10))
+DOWNLOAD_ATTEMPTS = int(os.environ.get("DOWNLOAD_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", 1))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", 30))
+
+# Conexiones paralelas al origen: por trabajo (1 desactiva los segmentos) y en total
+# en el nodo, repartidas entre los procesos
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", 4))
+DOWNLOAD_SEGMENT_SIZE = int(float(os.environ.get("DOWNLOAD_SEGMENT_MB", 4)) * 1024 * 1024)
+CONNECTION_LIMITER = ConnectionLimiter(max(1, int(os.environ.get("MAX_DOWNLOAD_CONNECTIONS", 16)) // APP_PROCESSES))
+
+# Errores que no se resuelven reintentando
+PERMANENT_ERRORS = (
+    "requested format is not available",
+    "private video",
+    "video unavailable",
+    "sign in",
+    "copyright",
+    "members-only",
+    "not available in your country",
+    "unsupported url",
+    # Sin FFmpeg: el mensaje de la unión y el de los postprocesadores
+    "ffmpeg is not installed",
+    "ffmpeg not found",
+    "ffprobe not found",
+)
+
+# Caché de metadatos compartida entre index() y /download
+METADATA_CACHE = TTLCache(
+    maxsize=int(os.environ.get("METADATA_CACHE_SIZE", 256)),
+    ttl=int(os.environ.get("METADATA_CACHE_TTL", 600)),
+    backend=STATE,
+)
+
+# Instancias de YoutubeDL reutilizables para extracción y peticiones HTTP
+YDL_POOL = YoutubeDLPool(
+    max_idle=int(os.environ.get("YDL_POOL_SIZE", 4)),
+    max_total_idle=int(os.environ.get("YDL_POOL_TOTAL", 16)),
+)
+
+# Extracciones en curso, compartidas entre peticiones simultáneas
+EXTRACTIONS = SingleFlight()
+
+# Cola de descargas en segundo plano; DOWNLOAD_WORKERS limita las descargas del nodo
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 2))
+JOB_MANAGER = JobManager(
+    DOWNLOAD_FOLDER,
+    max_workers=DOWNLOAD_WORKERS,
+    retention=int(os.environ.get("JOB_RETENTION", 3600)),
+    max_queued=int(os.environ.get("DOWNLOAD_QUEUE_LIMIT", 100)),
+    max_queued_per_client=int(os.environ.get("DOWNLOAD_QUEUE_PER_CLIENT", 10)),
+    state=STATE,
+    # Transmisiones directas simultáneas por cliente, dentro de DOWNLOAD_WORKERS
+    max_streams_per_client=int(os.environ.get("STREAMS_PER_CLIENT", 2)),
+    node_slots=node_slots("downloads", DOWNLOAD_WORKERS),
+)
+
+# Descarga especulativa desde la página de calidad: "video" (el formato preseleccionado),
+# "audio" o vacío para desactivarla. El presupuesto limita los bytes especulativos en curso
+PREFETCH_MODE = os.environ.get("PREFETCH_MODE", "")
+PREFETCH = Prefetcher(
+    JOB_MANAGER,
+    STATE,
+    budget_bytes=int(float(os.environ.get("PREFETCH_BUDGET_MB", 500)) * 1024 * 1024) if PREFETCH_MODE else 0,
+    ttl=int(os.environ.get("PREFETCH_TTL", 120)),
+)
+
+# Códecs de audio que acepta el formulario si el navegador no indica otros
+DEFAULT_AUDIO_ACCEPT = ["m4a", "opus", "mp3"]
+
+# Caudal total del nodo, repartido entre los procesos y en cada uno entre los trabajos
+# activos (0 = sin límite)
+BANDWIDTH = BandwidthAllocator(int(float(os.environ.get("DOWNLOAD_BANDWIDTH_MB", 0)) * 1024 * 1024) // APP_PROCESSES)
+
+# Trabajos hasta este tamaño (y los de audio) pasan delante de los grandes
+SMALL_JOB_BYTES = int(float(os.environ.get("SMALL_JOB_MB", 50)) * 1024 * 1024)
+
+# Bloques de 64 KiB que puede acumular cada transmisión antes de frenar al origen
+STREAM_BUFFER_CHUNKS = int(os.environ.get("STREAM_BUFFER_CHUNKS", 32))
+
+# Conversiones de audio limitadas al número de núcleos del nodo
+TRANSCODE_WORKERS = int(os.environ.get("TRANSCODE_WORKERS", 0)) or os.cpu_count() or 1
+TRANSCODE_POOL = TranscodePool(
+    max_workers=TRANSCODE_WORKERS,
+    ffmpeg=os.environ.get("FFMPEG_PATH", "ffmpeg"),
+    node_slots=node_slots("transcodes", TRANSCODE_WORKERS),
+)
+
+# Límites del modo lote (listas de reproducción y varias URLs)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 4))
+BATCH_MAX_ENTRIES = int(os.environ.get("BATCH_MAX_ENTRIES", 200))
+
+# Caché persistente de archivos terminados, con cuota en bytes
+RESULT_CACHE = ResultCache(
+    os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "youtube_downloader_cache")),
+    quota_bytes=int(os.environ.get("RESULT_CACHE_QUOTA", 5 * 1024 ** 3)),
+    state=STATE,
+)
+
+# Entrega de archivos: sendfile del núcleo, o x-accel-redirect / x-sendfile para que
+# el proxy sirva los bytes; python lee el archivo en el proceso como antes
+DELIVERY = FileDelivery(
+    mode=os.environ.get("DELIVERY_MODE", "sendfile"),
+    accel_map=parse_accel_map(os.environ.get("DELIVERY_ACCEL_MAP")) or [
+        (RESULT_CACHE.root, "/_downloads/cache"),
+        (DOWNLOAD_FOLDER, "/_downloads/jobs"),
+    ],
+    offload_grace=int(os.environ.get("DELIVERY_OFFLOAD_GRACE", 60)),
+)
+
+# Borrar los archivos de trabajos sin caché tras una entrega completa; si no, los
+# elimina la retención de trabajos (JOB_RETENTION)
+DELETE_AFTER_SEND = os.environ.get("DELETE_AFTER_SEND", "1") == "1"
+
+# Métricas expuestas en /metrics
+METRICS = Registry()
+PHASE_SECONDS = METRICS.histogram(
+    "ytdl_phase_seconds", "Duración de cada fase: extract, queue, download, merge, postprocess, transcode, send", ("phase",))
+HTTP_SECONDS = METRICS.histogram(
+    "ytdl_http_request_seconds", "Duración de cada petición hasta enviar el cuerpo completo, por endpoint", ("endpoint",))
+DOWNLOAD_THROUGHPUT = METRICS.histogram(
+    "ytdl_download_throughput_bytes_per_second", "Velocidad media de cada flujo descargado",
+    buckets=[2 ** n for n in range(16, 28)])
+DOWNLOADED_BYTES = METRICS.counter("ytdl_downloaded_bytes_total", "Bytes descargados del origen")
+YDL_ATTEMPTS = METRICS.counter(
+    "ytdl_ydl_attempts_total", "Extracciones y descargas según se usen cookies o no", ("operation", "cookies"))
+COOKIE_FALLBACKS = METRICS.counter(
+    "ytdl_cookie_fallbacks_total", "Reintentos sin cookies tras un fallo con cookies", ("operation",))
+ERRORS = METRICS.counter("ytdl_errors_total", "Errores por operación y clase", ("operation", "error_class"))
+REJECTIONS = METRICS.counter("ytdl_admission_rejected_total", "Descargas rechazadas con 429 por cola llena")
+METRICS.gauge("ytdl_queue_depth", "Trabajos esperando en la cola de descargas", lambda: JOB_MANAGER.stats()["queued"])
+METRICS.gauge("ytdl_jobs", "Trabajos de descarga por estado",
+              lambda: {status: JOB_MANAGER.stats()[status] for status in ("queued", "running")}, ("status",))
+METRICS.gauge("ytdl_prefetch", "Descargas especulativas por resultado",
+              lambda: {outcome: PREFETCH.stats()[outcome] for outcome in ("started", "adopted", "completed", "cancelled", "preempted")},
+              ("outcome",))
+METRICS.gauge("ytdl_transcodes", "Conversiones por estado",
+              lambda: {state: TRANSCODE_POOL.stats()[state] for state in ("queued", "active")}, ("state",))
+METRICS.gauge("ytdl_origin_connections", "Conexiones abiertas al origen por las descargas",
+              lambda: CONNECTION_LIMITER.stats()["active"])
+# Recorrer DOWNLOAD_FOLDER es costoso: como mucho una vez cada METRICS_DISK_MAX_AGE segundos
+METRICS.gauge("ytdl_download_folder_bytes", "Espacio ocupado en DOWNLOAD_FOLDER",
+              lambda: directory_size(DOWNLOAD_FOLDER), max_age=float(os.environ.get("METRICS_DISK_MAX_AGE", 10)))
+METRICS.gauge("ytdl_result_cache_bytes", "Espacio ocupado por la caché de resultados",
+              lambda: RESULT_CACHE.total_bytes)
+
+def error_class(error):
+    """Clase del error original, también cuando yt-dlp lo envuelve en DownloadError"""
+    exc_info = getattr(error, "exc_info", None)
+    if exc_info and exc_info[1] is not None:
+        return type(exc_info[1]).__name__
+    return type(error).__name__
+
+def cookies_label(ydl_opts):
+    return "yes" if "cookiefile" in ydl_opts or "cookiesfrombrowser" in ydl_opts else "no"
 
 # Configuración de cookies
 COOKIES_FILE = "cookies.txt"
@@ -15,6 +226,8 @@ BROWSER_COOKIES = "chrome"
 
 # Configurar cookies automáticamente
 def setup_cookies():
+    import yt_dlp
+    
     cookies_config = {}
     
     # 1. Primero verificar archivo de cookies tradicional
@@ -25,29 +238,123 @@ def setup_cookies():
     # 2. Si no hay archivo, intentar usar cookies del navegador
     try:
         # Testear si podemos acceder a cookies del navegador
-        test_opts = {"cookiesfrombrowser": (BROWSER_COOKIES,)}
+        test_opts = {"cookiesfrombrowser": (BROWSER_COOKIES,), "quiet": True}
         with yt_dlp.YoutubeDL(test_opts) as ydl:
-            pass
+            # yt-dlp carga las cookies de forma diferida: forzar la lectura
+            ydl.cookiejar
         cookies_config["cookiesfrombrowser"] = (BROWSER_COOKIES,)
         return cookies_config
     except:
         return {}
 
-# Configuración global de cookies
-COOKIES_CONFIG = setup_cookies()
+# Configuración de cookies, calculada en el primer uso
+_cookies_state = {"config": None, "mtime": None}
+_cookies_lock = threading.Lock()
+
+def get_cookies_config():
+    """Obtener la configuración de cookies, recargándola si cambia cookies.txt"""
+    try:
+        mtime = os.path.getmtime(COOKIES_FILE)
+    except OSError:
+        mtime = None
+    
+    with _cookies_lock:
+        if _cookies_state["config"] is None or _cookies_state["mtime"] != mtime:
+            reload = _cookies_state["config"] is not None
+            _cookies_state["config"] = setup_cookies()
+            _cookies_state["mtime"] = mtime
+            if reload:
+                # Las instancias reutilizables conservan el cookiejar anterior
+                YDL_POOL.clear()
+        return _cookies_state["config"]
 
-progress_data = {"status": "idle", "progress": 0, "filename": None}
+# Intervalo mínimo entre actualizaciones de progreso de un trabajo
+PROGRESS_INTERVAL = float(os.environ.get("PROGRESS_INTERVAL", 0.5))
 
-def progress_hook(d):
-    if d['status'] == 'downloading':
-        downloaded = d.get("downloaded_bytes", 0)
-        total = d.get("total_bytes", 0) or d.get("total_bytes_estimate", 1)
-        progress_data["status"] = "downloading"
-        progress_data["progress"] = int(downloaded / total * 100) if total > 0 else 0
-    elif d['status'] == 'finished':
-        progress_data["status"] = "finished"
-        progress_data["progress"] = 100
-        progress_data["filename"] = d["filename"]
+# Fase que se informa para cada postprocesador de yt-dlp
+POSTPROCESSOR_PHASES = {
+    "Merger": "merging",
+    "ExtractAudio": "transcoding",
+    "FFmpegExtractAudio": "transcoding",
+    "VideoConvertor": "transcoding",
+    "VideoRemuxer": "transcoding",
+}
+
+def make_progress_hook(job):
+    """Crear un hook de progreso limitado en frecuencia para un trabajo"""
+    last_update = [0.0]
+    # Archivo -> [bytes que ya había al empezar el intento, último elapsed]
+    resumed = {}
+    
+    def progress_hook(d):
+        if job.cancel_requested.is_set():
+            # Especulación abandonada: parar; los .part quedan para reanudar
+            from yt_dlp.utils import DownloadCancelled
+            raise DownloadCancelled("Descarga cancelada")
+        downloaded = d.get("downloaded_bytes") or 0
+        if d['status'] == 'downloading':
+            elapsed = d.get("elapsed") or 0
+            entry = resumed.get(d.get("filename"))
+            if entry is None or elapsed < entry[1]:
+                # Primer aviso del intento (elapsed vuelve a empezar en un reintento).
+                # La velocidad solo cuenta lo leído en este intento
+                fetched = int((d.get("speed") or 0) * elapsed)
+                entry = resumed[d.get("filename")] = [max(0, downloaded - fetched), elapsed]
+            entry[1] = elapsed
+            
+            now = time.monotonic()
+            if now - last_update[0] < PROGRESS_INTERVAL:
+                return
+            last_update[0] = now
+            
+            total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+            job.update_progress(
+                phase="downloading",
+                percent=int(downloaded / total * 100) if total > 0 else 0,
+                downloaded_bytes=downloaded,
+                total_bytes=total or None,
+                speed=d.get("speed"),
+                eta=d.get("eta"),
+            )
+        elif d['status'] == 'finished':
+            # Métricas una vez por flujo, no por bloque, para no frenar el hook. Solo
+            # los bytes de este intento: sin avisos de progreso no se descargó nada
+            entry = resumed.pop(d.get("filename"), None)
+            fetched = downloaded - entry[0] if entry else 0
+            elapsed = d.get("elapsed")
+            if elapsed:
+                PHASE_SECONDS.observe(elapsed, "download")
+                if fetched:
+                    DOWNLOAD_THROUGHPUT.observe(fetched / elapsed)
+            DOWNLOADED_BYTES.inc(amount=fetched)
+            
+            # Terminó un flujo, pero aún puede faltar la fusión o conversión
+            job.update_progress(
+                phase="downloading",
+                percent=100,
+                downloaded_bytes=downloaded,
+                total_bytes=d.get("total_bytes") or downloaded or None,
+                speed=None,
+                eta=0,
+            )
+    
+    return progress_hook
+
+def make_postprocessor_hook(job):
+    """Crear un hook que informa la fase de postprocesado de un trabajo"""
+    started = {}
+    
+    def postprocessor_hook(d):
+        name = d.get('postprocessor')
+        if d['status'] == 'started':
+            started[name] = time.perf_counter()
+            phase = POSTPROCESSOR_PHASES.get(name, "processing")
+            job.update_progress(phase=phase, speed=None, eta=None)
+        elif d['status'] == 'finished' and name in started:
+            elapsed = time.perf_counter() - started.pop(name)
+            PHASE_SECONDS.observe(elapsed, "merge" if name == "Merger" else "postprocess")
+    
+    return postprocessor_hook
 
 def get_ydl_opts_base():
     """Obtener opciones base que incluyen cookies configuradas correctamente"""
@@ -59,51 +366,89 @@ def get_ydl_opts_base():
     }
     
     # Añadir configuración de cookies si está disponible
-    if COOKIES_CONFIG:
-        base_opts.update(COOKIES_CONFIG)
+    base_opts.update(get_cookies_config())
     
     return base_opts
 
 def get_available_video_formats(info):
-    """Obtener solo formatos de video con audio"""
+    """Obtener los formatos de video con audio, incluidos los pares video+audio"""
     video_formats = []
     
-    for f in info.get("formats", []):
+    # El plan más barato de cada resolución y, si es una unión, también el progresivo
+    for plan in list_plans(info):
         try:
-            # Solo considerar formatos con video Y audio
-            if f.get('vcodec') == 'none' or f.get('acodec') == 'none':
-                continue
-                
-            # Obtener la resolución
-            height = f.get('height')
-            if not height:
-                continue
-            
             # Calcular tamaño aproximado
-            filesize = f.get('filesize', 0) or f.get('filesize_approx', 0)
-            filesize_mb = f"{filesize / (1024*1024):.1f} MB" if filesize else "N/A"
+            filesize_mb = f"{plan.size / (1024*1024):.1f} MB" if plan.size else "N/A"
             
             # Obtener FPS si está disponible
-            fps = f.get('fps', 0)
-            fps_text = f" {fps}fps" if fps > 30 else ""
+            fps_text = f" {plan.fps}fps" if plan.fps > 30 else ""
             
             video_formats.append({
-                "format_id": f["format_id"],
-                "resolution": f"{height}p{fps_text}",
-                "height": height,
+                "format_id": plan.format_id,
+                "resolution": f"{plan.height}p{fps_text}",
+                "height": plan.height,
                 "filesize": filesize_mb,
-                "ext": f.get("ext", "mp4"),
-                "quality": f.get('quality', 0),
+                "ext": plan.ext,
+                "quality": plan.video.get('quality', 0),
+                "merge": plan.merge,
+                "streamable": not plan.merge and is_streamable(plan.video),
             })
                     
         except (KeyError, TypeError):
             continue
     
-    # Ordenar por resolución (mayor primero)
-    video_formats.sort(key=lambda x: x["height"], reverse=True)
-    
     return video_formats
 
+def extract_video_info(url, ydl_opts):
+    """Obtener metadatos del video reutilizando la caché por ID de video"""
+    video_id = extract_video_id(url)
+    cache_key = video_id or url
+    
+    info = METADATA_CACHE.get(cache_key)
+    if info is not None:
+        return info
+    
+    def extract():
+        # Extraer siempre desde la URL canónica para que la clave coincida
+        target_url = canonical_video_url(video_id) if video_id else url
+        YDL_ATTEMPTS.inc("extract", cookies_label(ydl_opts))
+        started = time.perf_counter()
+        try:
+            with YDL_POOL.checkout(ydl_opts) as ydl:
+                info = ydl.extract_info(target_url, download=False)
+        except Exception as e:
+            ERRORS.inc("extract", error_class(e))
+            raise
+        PHASE_SECONDS.observe(time.perf_counter() - started, "extract")
+        
+        METADATA_CACHE.set(cache_key, info)
+        return info
+    
+    # Las peticiones simultáneas del mismo video esperan una sola extracción; con y
+    # sin cookies son distintas, para que el reintento sin cookies no herede el error
+    return EXTRACTIONS.do((cache_key, cookies_label(ydl_opts)), extract)
+
+def extraction_opts(ydl_opts):
+    """Opciones base con las mismas cookies que ydl_opts"""
+    opts = get_ydl_opts_base()
+    if cookies_label(ydl_opts) == "no":
+        opts.pop("cookiefile", None)
+        opts.pop("cookiesfrombrowser", None)
+    return opts
+
+def download_with_info(url, ydl_opts):
+    """Descargar usando los metadatos en caché en lugar de extraer de nuevo"""
+    from segmented import SegmentedYoutubeDL
+    
+    # Las opciones de la descarga llevan hooks y cuotas del trabajo: extraer con
+    # las base para compartir instancias del pool entre trabajos
+    info = extract_video_info(url, extraction_opts(ydl_opts))
+    with SegmentedYoutubeDL(ydl_opts) as ydl:
+        # yt-dlp modifica el diccionario, trabajar sobre una copia
+        info = ydl.process_ie_result(copy.deepcopy(info), download=True)
+        filename = ydl.prepare_filename(info)
+    return info, filename
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
@@ -113,57 +458,65 @@ def index():
             if not re.match(r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/', url):
                 return render_template_string(error_template, error="URL de YouTube no válida")
             
+            # Las listas de reproducción se descargan en modo lote
+            if is_playlist_url(url):
+                try:
+                    entries = list_entries([url], YDL_POOL, get_ydl_opts_base(), BATCH_MAX_ENTRIES)
+                except Exception as e:
+                    return render_template_string(error_template, error=f"Error al obtener la lista: {str(e)}")
+                return render_template_string(batch_template, urls=url, entries=entries)
+            
             ydl_opts = get_ydl_opts_base()
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    
-                    # Obtener formatos de video disponibles (con audio)
-                    video_formats = get_available_video_formats(info)
-                    
-                    if not video_formats:
-                        return render_template_string(error_template, error="No se encontraron formatos disponibles para este video")
-                    
-                    # Información del video para mostrar
-                    video_info = {
-                        "title": info.get('title', 'Video sin título'),
-                        "duration": info.get('duration', 0),
-                        "thumbnail": info.get('thumbnail', ''),
-                        "view_count": info.get('view_count', 0)
-                    }
-                    
+                info = extract_video_info(url, ydl_opts)
+                
+                # Obtener formatos de video disponibles (con audio)
+                video_formats = get_available_video_formats(info)
+                
+                if not video_formats:
+                    return render_template_string(error_template, error="No se encontraron formatos disponibles para este video")
+                
+                # Información del video para mostrar
+                video_info = {
+                    "title": info.get('title', 'Video sin título'),
+                    "duration": info.get('duration', 0),
+                    "thumbnail": info.get('thumbnail', ''),
+                    "view_count": info.get('view_count', 0)
+                }
+                
                 return render_template_string(
                     quality_template, 
                     url=url, 
                     video_formats=video_formats,
-                    video_info=video_info
+                    video_info=video_info,
+                    prefetch=start_prefetch(url, info, video_formats),
                 )
             except Exception as e:
                 error_message = f"Error al obtener información: {str(e)}"
                 # Intentar sin cookies si falla con cookies
-                if COOKIES_CONFIG:
+                if get_cookies_config():
+                    COOKIE_FALLBACKS.inc("extract")
                     try:
                         ydl_opts_no_cookies = {
                             "quiet": True,
                             "no_warnings": False,
                         }
-                        with yt_dlp.YoutubeDL(ydl_opts_no_cookies) as ydl:
-                            info = ydl.extract_info(url, download=False)
-                            video_formats = get_available_video_formats(info)
-                            
-                            if video_formats:
-                                video_info = {
-                                    "title": info.get('title', 'Video sin título'),
-                                    "duration": info.get('duration', 0),
-                                    "thumbnail": info.get('thumbnail', ''),
-                                    "view_count": info.get('view_count', 0)
-                                }
-                                return render_template_string(
-                                    quality_template, 
-                                    url=url, 
-                                    video_formats=video_formats,
-                                    video_info=video_info
-                                )
+                        info = extract_video_info(url, ydl_opts_no_cookies)
+                        video_formats = get_available_video_formats(info)
+                        
+                        if video_formats:
+                            video_info = {
+                                "title": info.get('title', 'Video sin título'),
+                                "duration": info.get('duration', 0),
+                                "thumbnail": info.get('thumbnail', ''),
+                                "view_count": info.get('view_count', 0)
+                            }
+                            return render_template_string(
+                                quality_template, 
+                                url=url, 
+                                video_formats=video_formats,
+                                video_info=video_info
+                            )
                     except:
                         pass
                 
@@ -171,112 +524,626 @@ def index():
 
     return render_template_string(index_template)
 
-@app.route("/download", methods=["POST"])
-def download():
-    url = request.form.get("url")
-    format_id = request.form.get("format_id")
-
-    if not url:
-        return render_template_string(error_template, error="URL no proporcionada")
-
-    progress_data.update({"status": "starting", "progress": 0, "filename": None})
+# Modos de audio: copia del flujo original o conversión a MP3 en el pool
+AUDIO_MODES = {
+    # Para MP3, convertir a alta calidad (320kbps) fuera de yt-dlp
+    "mp3": {"format": "bestaudio/best", "transcode": ["-c:a", "libmp3lame", "-b:a", "320k"], "ext": ".mp3"},
+    "m4a": {"format": "bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]", "codec": "m4a", "ext": ".m4a"},
+    "opus": {"format": "bestaudio[acodec=opus]", "codec": "opus", "ext": ".opus"},
+}
 
+def build_download_opts(format_id, output_dir, use_cookies=True, clip=None):
+    """Construir las opciones de yt-dlp para el formato seleccionado"""
     # Obtener opciones base con cookies
     ydl_opts = get_ydl_opts_base()
+    if not use_cookies:
+        ydl_opts.pop("cookiefile", None)
+        ydl_opts.pop("cookiesfrombrowser", None)
+    
+    # Cada trabajo descarga en su propio directorio
+    ydl_opts["outtmpl"] = os.path.join(output_dir, "%(title)s.%(ext)s")
+    
+    # Fragmento: FFmpeg lee solo el intervalo pedido
+    if clip is not None:
+        clip.apply(ydl_opts)
+        ydl_opts["outtmpl"] = os.path.join(output_dir, f"%(title)s [{clip.label()}].%(ext)s")
     
-    # Usar directorio temporal para evitar problemas de permisos
-    ydl_opts["outtmpl"] = os.path.join(DOWNLOAD_FOLDER, "%(title)s.%(ext)s")
-    ydl_opts["progress_hooks"] = [progress_hook]
+    # Reintentos internos de yt-dlp; los .part se reanudan en lugar de empezar de cero
+    ydl_opts["continuedl"] = True
+    ydl_opts["retries"] = DOWNLOAD_RETRIES
+    ydl_opts["fragment_retries"] = DOWNLOAD_RETRIES
+    ydl_opts["retry_sleep_functions"] = {"http": retry_backoff, "fragment": retry_backoff}
+    
+    # Segmentos Range o fragmentos DASH/HLS en paralelo, dentro del límite global
+    ydl_opts["segmented_connections"] = DOWNLOAD_CONNECTIONS
+    ydl_opts["segment_size"] = DOWNLOAD_SEGMENT_SIZE
+    ydl_opts["concurrent_fragment_downloads"] = DOWNLOAD_CONNECTIONS
+    ydl_opts["connection_limiter"] = CONNECTION_LIMITER
 
     # Configurar formato seleccionado
-    if format_id == "mp3":
-        # Para audio, convertir a MP3 de alta calidad (320kbps)
-        ydl_opts["format"] = "bestaudio/best"
-        ydl_opts["postprocessors"] = [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "320"
-        }]
+    if format_id in AUDIO_MODES:
+        mode = AUDIO_MODES[format_id]
+        ydl_opts["format"] = mode["format"]
+        if "codec" in mode:
+            # Mismo códec de origen y destino: yt-dlp solo cambia el contenedor
+            ydl_opts["postprocessors"] = [{
+                "key": "FFmpegExtractAudio",
+                "preferredcodec": mode["codec"],
+            }]
     else:
         # Para video, usar el formato seleccionado
         ydl_opts["format"] = format_id
         ydl_opts["merge_output_format"] = "mp4"
+    
+    return ydl_opts
 
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-
-            # Asegurar extensión correcta
-            if format_id == "mp3":
-                filename = os.path.splitext(filename)[0] + ".mp3"
-            elif not filename.endswith('.mp4'):
-                filename = os.path.splitext(filename)[0] + ".mp4"
-
-            # Verificar que el archivo existe antes de enviarlo
-            if not os.path.exists(filename):
-                # Buscar el archivo en el directorio de descargas
-                download_dir = os.path.dirname(filename)
-                actual_files = [f for f in os.listdir(download_dir) if os.path.isfile(os.path.join(download_dir, f))]
-                
-                if actual_files:
-                    # Usar el primer archivo encontrado
-                    filename = os.path.join(download_dir, actual_files[0])
-                else:
-                    raise FileNotFoundError(f"No se encontró ningún archivo descargado en {download_dir}")
-
-        # Enviar el archivo como descarga
-        response = send_file(
-            filename, 
-            as_attachment=True,
-            download_name=os.path.basename(filename)
-        )
+def resolve_output_filename(filename, format_id):
+    """Obtener la ruta real del archivo descargado"""
+    # Asegurar extensión correcta (el MP3 se genera después, en el pool)
+    if format_id in AUDIO_MODES:
+        if "codec" in AUDIO_MODES[format_id]:
+            filename = os.path.splitext(filename)[0] + AUDIO_MODES[format_id]["ext"]
+    elif not filename.endswith('.mp4'):
+        filename = os.path.splitext(filename)[0] + ".mp4"
+
+    # Verificar que el archivo existe antes de enviarlo
+    if not os.path.exists(filename):
+        # Buscar el archivo en el directorio de descargas
+        download_dir = os.path.dirname(filename)
+        actual_files = [f for f in os.listdir(download_dir)
+                        if os.path.isfile(os.path.join(download_dir, f)) and not f.endswith((".part", ".ytdl"))]
         
-        return response
+        if actual_files:
+            # Usar el primer archivo encontrado
+            filename = os.path.join(download_dir, actual_files[0])
+        else:
+            raise FileNotFoundError(f"No se encontró ningún archivo descargado en {download_dir}")
+    
+    return filename
+
+def retry_backoff(attempt):
+    """Espera exponencial entre reintentos, con un máximo"""
+    return min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+
+def is_retryable_error(message):
+    message = message.lower()
+    return not any(marker in message for marker in PERMANENT_ERRORS)
+
+def download_with_retries(job, hooks):
+    """Descargar reintentando con espera exponencial; los .part se reanudan"""
+    # Cuota del caudal compartido mientras dura la descarga
+    bandwidth = BANDWIDTH.register()
+    try:
+        return _download_with_retries(job, hooks, bandwidth)
+    finally:
+        bandwidth.close()
+
+def _download_with_retries(job, hooks, bandwidth):
+    use_cookies = True
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        ydl_opts = build_download_opts(job.format_id, job.work_dir, use_cookies=use_cookies, clip=job.clip)
+        ydl_opts.update(hooks)
+        ydl_opts["bandwidth"] = bandwidth
+        YDL_ATTEMPTS.inc("download", cookies_label(ydl_opts))
+        try:
+            return download_with_info(job.url, ydl_opts)
+        except Exception as e:
+            if job.cancel_requested.is_set():
+                raise
+            message = str(e).lower()
+            if use_cookies and get_cookies_config() and "cookies" in message:
+                # Continuar sin cookies en lugar de abandonar la descarga
+                COOKIE_FALLBACKS.inc("download")
+                use_cookies = False
+                continue
+            if attempt == DOWNLOAD_ATTEMPTS - 1 or not is_retryable_error(message):
+                raise
+            if "http error 403" in message:
+                # Las URLs de los formatos caducan: extraer de nuevo
+                METADATA_CACHE.pop(extract_video_id(job.url) or job.url)
+            
+            delay = retry_backoff(attempt)
+            job.update_progress(phase="retrying", attempt=attempt + 1, retry_in=delay, speed=None, eta=None)
+            time.sleep(delay)
     
+    raise RuntimeError("No se pudo completar la descarga")
+
+def run_download_job(job):
+    """Ejecutar la descarga de un trabajo en segundo plano"""
+    PHASE_SECONDS.observe(job.started_at - job.created_at, "queue")
+    try:
+        return perform_download(job)
     except Exception as e:
-        error_message = f"Error al descargar: {str(e)}"
-        # Intentar sin cookies si falla con cookies
-        if COOKIES_CONFIG and "cookies" in str(e).lower():
-            try:
-                ydl_opts_no_cookies = get_ydl_opts_base().copy()
-                if "cookiefile" in ydl_opts_no_cookies:
-                    del ydl_opts_no_cookies["cookiefile"]
-                if "cookiesfrombrowser" in ydl_opts_no_cookies:
-                    del ydl_opts_no_cookies["cookiesfrombrowser"]
-                
-                ydl_opts_no_cookies["outtmpl"] = os.path.join(DOWNLOAD_FOLDER, "%(title)s.%(ext)s")
-                ydl_opts_no_cookies["progress_hooks"] = [progress_hook]
-                
-                if format_id == "mp3":
-                    ydl_opts_no_cookies["format"] = "bestaudio/best"
-                    ydl_opts_no_cookies["postprocessors"] = [{
-                        "key": "FFmpegExtractAudio",
-                        "preferredcodec": "mp3",
-                        "preferredquality": "320"
-                    }]
-                else:
-                    ydl_opts_no_cookies["format"] = format_id
-                    ydl_opts_no_cookies["merge_output_format"] = "mp4"
-                
-                with yt_dlp.YoutubeDL(ydl_opts_no_cookies) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    filename = ydl.prepare_filename(info)
-                    
-                    if format_id == "mp3":
-                        filename = os.path.splitext(filename)[0] + ".mp3"
-                    elif not filename.endswith('.mp4'):
-                        filename = os.path.splitext(filename)[0] + ".mp4"
-                
-                return send_file(filename, as_attachment=True, download_name=os.path.basename(filename))
-            except:
-                pass
-                
-        return render_template_string(error_template, error=error_message)
+        ERRORS.inc("download", error_class(e))
+        raise
+
+def perform_download(job):
+    # Otro trabajo pudo publicar el resultado mientras este esperaba en cola
+    if job.cache_key:
+        cached = RESULT_CACHE.lookup(job.cache_key)
+        if cached:
+            return cached
+    
+    hooks = {
+        "progress_hooks": [make_progress_hook(job)],
+        "postprocessor_hooks": [make_postprocessor_hook(job)],
+    }
+    
+    info, filename = download_with_retries(job, hooks)
+    filename = resolve_output_filename(filename, job.format_id)
+    
+    transcode_args = AUDIO_MODES.get(job.format_id, {}).get("transcode")
+    if transcode_args:
+        filename = transcode_job_file(job, filename, transcode_args)
+    
+    # Publicar el resultado para servir las siguientes peticiones desde disco
+    if job.cache_key:
+        filename = RESULT_CACHE.publish(job.cache_key, filename)
+    return filename
+
+def transcode_job_file(job, filename, codec_args):
+    """Convertir el audio descargado esperando turno en el pool de FFmpeg"""
+    target = os.path.splitext(filename)[0] + AUDIO_MODES[job.format_id]["ext"]
+    job.update_progress(phase="transcode_queued", speed=None, eta=None)
+    result = TRANSCODE_POOL.transcode(
+        filename,
+        target,
+        codec_args,
+        on_start=lambda: job.update_progress(phase="transcoding"),
+    )
+    job.update_progress(
+        cpu_seconds=round(result.cpu_seconds, 3),
+        transcode_wait_seconds=round(result.wait_seconds, 3),
+    )
+    PHASE_SECONDS.observe(result.wait_seconds, "transcode_queue")
+    PHASE_SECONDS.observe(result.wall_seconds, "transcode")
+    os.remove(filename)
+    return result.path
+
+def download_cache_key(url, format_id, clip=None):
+    """Clave del resultado en caché, o None si la URL no tiene ID de video"""
+    video_id = extract_video_id(url)
+    if not video_id:
+        return None
+    transcode = AUDIO_MODES.get(format_id, {}).get("transcode")
+    return result_key(
+        video_id,
+        build_download_opts(format_id, DOWNLOAD_FOLDER),
+        transcode=transcode,
+        clip=clip.key() if clip else None,
+    )
+
+def close_with_response(response, callback):
+    """Ejecutar callback cuando el servidor cierre el cuerpo de la respuesta"""
+    # send_file usa direct_passthrough, por lo que call_on_close no se ejecuta
+    response.response = ClosingIterator(response.response, callback)
+    return response
+
+def job_response(job):
+    """Representación JSON de un trabajo con sus URLs asociadas"""
+    data = job.to_dict()
+    data["status_url"] = url_for("job_status", job_id=job.id)
+    if job.cache_key and job.status == "finished":
+        # URL estable por contenido: permite reanudar aunque caduque el trabajo
+        data["file_url"] = url_for("cached_file", key=job.cache_key)
+    else:
+        data["file_url"] = url_for("job_file", job_id=job.id)
+    data["events_url"] = url_for("job_events", job_id=job.id)
+    return data
+
+def pending_job_response(job):
+    """202 para un trabajo en curso: el navegador recibe una página que sigue el
+    progreso y pide el archivo al terminar; los demás clientes, el JSON del trabajo"""
+    data = job_response(job)
+    if request.accept_mimetypes.best_match(["application/json", "text/html"]) == "text/html":
+        response = app.make_response(render_template_string(waiting_template, job=data))
+    else:
+        response = jsonify(data)
+    response.status_code = 202
+    response.headers["Location"] = data["status_url"]
+    return response
+
+def client_id():
+    """Identificador del cliente para repartir la cola por turnos; detrás de un
+    proxy, la dirección de X-Forwarded-For si TRUSTED_PROXIES lo permite"""
+    return request.remote_addr or "unknown"
+
+def job_priority(url, format_id, clip=None):
+    """Los trabajos de audio y los pequeños pasan delante de los videos grandes"""
+    if format_id in AUDIO_MODES:
+        return PRIORITY_SMALL
+    # Solo con metadatos ya en caché: no extraer para decidir la prioridad
+    info = METADATA_CACHE.get(extract_video_id(url) or url)
+    size = estimate_format_size(info, format_id) if info else None
+    if size is not None and clip is not None and info.get('duration'):
+        size = size * clip.duration / info['duration']
+    if size is not None and size <= SMALL_JOB_BYTES:
+        return PRIORITY_SMALL
+    return PRIORITY_NORMAL
+
+def enqueue_download(url, format_id, client=None, clip=None):
+    """Crear el trabajo de descarga, resuelto al instante si está en caché.
+
+    Si hay una descarga especulativa del mismo resultado, se adopta.
+    Lanza QueueFull si la cola de descargas (o la del cliente) está llena.
+    """
+    cache_key = download_cache_key(url, format_id, clip)
+    if client:
+        # El cliente ya eligió: sus otras especulaciones sobran
+        PREFETCH.abandon(client, keep=cache_key)
+    if cache_key:
+        cached = RESULT_CACHE.lookup(cache_key)
+        if cached:
+            PREFETCH.adopt_result(cache_key)
+            return JOB_MANAGER.add_finished(url, format_id, cached, cache_key, clip=clip)
+
+    priority = job_priority(url, format_id, clip)
+    job = JOB_MANAGER.submit(
+        url, format_id, run_download_job,
+        cache_key=cache_key, client=client, priority=priority, clip=clip,
+    )
+    if job.speculative:
+        PREFETCH.adopt(job, priority)
+        if job.cancel_requested.is_set():
+            # Se canceló justo antes de adoptarla: esperar a que pare y
+            # descargar de nuevo, reanudando sus .part
+            job.wait()
+            return enqueue_download(url, format_id, client, clip)
+    return job
+
+def start_prefetch(url, info, video_formats):
+    """Adelantar la descarga del formato que probablemente se elija; devuelve su format_id o None"""
+    if PREFETCH_MODE == "video":
+        format_id = video_formats[0]["format_id"]
+        size = estimate_format_size(info, format_id)
+    elif PREFETCH_MODE == "audio":
+        format_id = choose_audio_mode(info, DEFAULT_AUDIO_ACCEPT)
+        size = estimate_audio_size(info)
+    else:
+        return None
+    cache_key = download_cache_key(url, format_id)
+    job = PREFETCH.start(client_id(), url, format_id, cache_key, size, run_download_job)
+    return format_id if job is not None else None
+
+def queue_full_response(error, body):
+    REJECTIONS.inc()
+    response = app.make_response(body)
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+def open_job_result(job):
+    """Obtener el archivo de un trabajo terminado y la función que lo libera"""
+    if not job.cache_key:
+        if not job.filename or not os.path.exists(job.filename):
+            # Ya entregado y borrado, o eliminado por la retención
+            return None, lambda: None
+        return job.filename, lambda: None
+    
+    # Reservar la entrada para que no se expulse durante la lectura
+    filename = RESULT_CACHE.acquire(job.cache_key)
+    if filename is None:
+        return None, lambda: None
+    return filename, lambda: RESULT_CACHE.release(job.cache_key)
+
+def send_job_file(job):
+    """Enviar el archivo de un trabajo terminado"""
+    if job.status == "error":
+        return render_template_string(error_template, error=f"Error al descargar: {job.error}"), 500
+    if not job.finished:
+        return jsonify(job_response(job)), 409
+
+    filename, release = open_job_result(job)
+    if filename is None:
+        return render_template_string(error_template, error="El archivo ya no está disponible, vuelve a descargarlo"), 410
+
+    # Sin caché nadie más puede pedir este archivo: borrarlo al entregarlo entero
+    cleanup = None
+    if DELETE_AFTER_SEND and not job.cache_key:
+        cleanup = lambda: shutil.rmtree(job.work_dir, ignore_errors=True)
+    return send_download(filename, release, cleanup)
+
+def send_download(filename, release, cleanup=None):
+    """Enviar un archivo admitiendo Range, If-Range y ETag para reanudar"""
+    started = time.perf_counter()
+    def finish():
+        PHASE_SECONDS.observe(time.perf_counter() - started, "send")
+        release()
+    
+    # sendfile o el proxy copian los bytes; cleanup solo tras una entrega completa
+    response = DELIVERY.send(request.environ, filename, release=finish, cleanup=cleanup, on_close=request_timer())
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+def plan_format(url, params, clip=None):
+    """Resolver el formato automático según altura, fps y tamaño máximos"""
+    info = extract_video_info(url, get_ydl_opts_base())
+    max_bytes = parse_limit(params.get("max_size_mb"), scale=1024 * 1024)
+    if max_bytes and clip is not None and info.get('duration'):
+        # El límite se aplica al fragmento, no al video completo
+        max_bytes = int(max_bytes * info['duration'] / clip.duration)
+    plan = choose_plan(
+        info,
+        max_height=parse_limit(params.get("max_height")),
+        max_fps=parse_limit(params.get("max_fps")),
+        max_bytes=max_bytes,
+    )
+    return plan.format_id if plan else None
+
+def request_clip(url, params):
+    """Fragmento pedido con start/end, validado contra la duración del video"""
+    if not (params.get("start") or params.get("end")):
+        return None
+    info = extract_video_info(url, get_ydl_opts_base())
+    return parse_clip(params.get("start"), params.get("end"), params.get("precise"), info.get('duration'))
+
+@app.route("/download", methods=["POST"])
+def download():
+    url = request.form.get("url")
+    format_id = request.form.get("format_id")
+
+    if not url:
+        return jsonify({"error": "URL no proporcionada"}), 400
+
+    try:
+        clip = request_clip(url, request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener información: {str(e)}"}), 502
+
+    if not format_id or format_id == "auto":
+        # Elegir el formato más barato que cumple los límites pedidos
+        try:
+            format_id = plan_format(url, request.form, clip)
+        except Exception as e:
+            return jsonify({"error": f"Error al obtener información: {str(e)}"}), 502
+        if format_id is None:
+            return jsonify({"error": "Ningún formato cumple los límites indicados"}), 422
+    elif format_id == "audio":
+        # Copiar el audio original si el cliente admite su códec; si no, MP3
+        accepted = request.form.get("accept_audio", ",".join(DEFAULT_AUDIO_ACCEPT)).split(",")
+        try:
+            info = extract_video_info(url, get_ydl_opts_base())
+        except Exception as e:
+            return jsonify({"error": f"Error al obtener información: {str(e)}"}), 502
+        format_id = choose_audio_mode(info, [codec.strip() for codec in accepted])
+
+    # Encolar la descarga y responder inmediatamente con el ID del trabajo
+    try:
+        job = enqueue_download(url, format_id, client_id(), clip)
+    except QueueFull as e:
+        return queue_full_response(e, jsonify({"error": str(e), "retry_after": e.retry_after}))
+    return jsonify(job_response(job)), 200 if job.finished else 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(job_response(job))
+
+@app.route("/jobs/<job_id>/file")
+def job_file(job_id):
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return render_template_string(error_template, error="Trabajo no encontrado"), 404
+    return send_job_file(job)
+
+@app.route("/files/<key>")
+def cached_file(key):
+    # Reservar la entrada para que no se expulse durante el envío
+    filename = RESULT_CACHE.acquire(key)
+    if filename is None:
+        return render_template_string(error_template, error="El archivo ya no está disponible, vuelve a descargarlo"), 404
+    return send_download(filename, lambda: RESULT_CACHE.release(key))
+
+@app.route("/stream", methods=["GET", "POST"])
+def stream():
+    url = request.values.get("url")
+    format_id = request.values.get("format_id")
+
+    if not url:
+        return render_template_string(error_template, error="URL no proporcionada"), 400
+
+    ydl_opts = get_ydl_opts_base()
+    try:
+        info = extract_video_info(url, ydl_opts)
+    except Exception as e:
+        return render_template_string(error_template, error=f"Error al obtener información: {str(e)}"), 502
+
+    try:
+        clip = parse_clip(request.values.get("start"), request.values.get("end"),
+                          request.values.get("precise"), info.get('duration'))
+    except ValueError as e:
+        return render_template_string(error_template, error=str(e)), 400
+
+    fmt = find_format(info, format_id)
+    cache_key = download_cache_key(url, format_id, clip)
+    cached = RESULT_CACHE.lookup(cache_key) if cache_key else None
+
+    if cached:
+        return send_job_file(JOB_MANAGER.add_finished(url, format_id, cached, cache_key, clip=clip))
+
+    # Con una descarga ya en curso (por ejemplo, especulativa) se espera a esa
+    in_flight = cache_key is not None and JOB_MANAGER.active(cache_key) is not None
+    streamable = fmt is not None and is_streamable(fmt) and clip is None and not in_flight
+    # Transmitir ocupa un trabajador como una descarga; sin uno libre, o si el
+    # cliente ya transmite demasiado, la descarga pasa por la cola por turnos
+    release_slot = JOB_MANAGER.reserve_slot(client_id()) if streamable else None
+    if release_slot is None:
+        # Fusión, conversión, fragmento o servidor ocupado: descarga completa en
+        # segundo plano, sin ocupar esta petición mientras dura
+        try:
+            job = enqueue_download(url, format_id, client_id(), clip)
+        except QueueFull as e:
+            return queue_full_response(e, render_template_string(error_template, error=str(e)))
+        if job.finished:
+            return send_job_file(job)
+        return pending_job_response(job)
+
+    try:
+        # Guardar una copia mientras se transmite para poblar la caché de resultados
+        from yt_dlp.utils import sanitize_filename
+        filename = f"{sanitize_filename(info.get('title', 'video'))}.{fmt.get('ext', 'mp4')}"
+        spool_dir = tempfile.mkdtemp(dir=DOWNLOAD_FOLDER)
+    except BaseException:
+        release_slot()
+        raise
+    on_complete = (lambda path: RESULT_CACHE.publish(cache_key, path)) if cache_key else None
+
+    # Con la cuota de caudal y el límite de conexiones de las demás descargas
+    chunks = iter_stream(
+        YDL_POOL,
+        ydl_opts,
+        fmt,
+        spool_path=os.path.join(spool_dir, filename),
+        on_complete=on_complete,
+        buffer_chunks=STREAM_BUFFER_CHUNKS,
+        bandwidth=BANDWIDTH,
+        connections=CONNECTION_LIMITER,
+    )
+    response = Response(
+        chunks,
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        direct_passthrough=True,
+    )
+    response.headers.set("Content-Disposition", "attachment", filename=filename)
+    if fmt.get("filesize"):
+        response.content_length = fmt["filesize"]
+    def finish():
+        release_slot()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return close_with_response(response, finish)
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    urls = [line.strip() for line in request.form.get("urls", "").splitlines() if line.strip()]
+    format_id = request.form.get("format_id") or "mp3"
+
+    if not urls:
+        return render_template_string(error_template, error="URL no proporcionada"), 400
+    for url in urls:
+        if not re.match(r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/', url):
+            return render_template_string(error_template, error=f"URL de YouTube no válida: {url}"), 400
+
+    try:
+        entries = list_entries(urls, YDL_POOL, get_ydl_opts_base(), BATCH_MAX_ENTRIES)
+    except Exception as e:
+        return render_template_string(error_template, error=f"Error al obtener la lista: {str(e)}"), 502
+    if not entries:
+        return render_template_string(error_template, error="La lista no contiene videos"), 404
+
+    # Las primeras descargas se encolan antes de responder: con la cola llena, 429
+    client = client_id()
+    start_job = lambda entry_url: enqueue_download(entry_url, format_id, client)
+    try:
+        start_entries(entries, start_job, BATCH_CONCURRENCY)
+    except QueueFull as e:
+        return queue_full_response(e, render_template_string(error_template, error=str(e)))
+
+    # El ZIP se envía a medida que terminan las descargas, sin montarlo antes
+    chunks = iter_zip(
+        entries,
+        start_job=start_job,
+        open_result=open_job_result,
+        max_parallel=BATCH_CONCURRENCY,
+    )
+    response = Response(chunks, mimetype="application/zip")
+    response.headers.set("Content-Disposition", "attachment", filename="youtube_downloader.zip")
+    return response
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    
+    def stream():
+        version = -1
+        while True:
+            new_version, progress = job.wait_for_update(version, timeout=15)
+            if new_version == version:
+                # Mantener viva la conexión a través de proxies
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            
+            data = job_response(job)
+            yield f"data: {json.dumps(data)}\n\n"
+            if job.finished:
+                break
+    
+    # Conservar el contexto de la petición para url_for
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/progress")
 def progress():
-    return jsonify(progress_data)
+    # Sin job_id se informa el trabajo más reciente, como antes
+    job_id = request.args.get("job_id")
+    job = JOB_MANAGER.get(job_id) if job_id else JOB_MANAGER.latest()
+    if job is None:
+        if job_id:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        return jsonify({"status": "idle", "progress": 0, "filename": None})
+    
+    return jsonify({
+        "status": job.progress["phase"],
+        "progress": job.progress["percent"],
+        "filename": os.path.basename(job.filename) if job.filename else None,
+        **job.progress,
+    })
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def request_timer():
+    """Función que registra la duración de la petición en curso, o None si ya la
+    registra otro (send_download la entrega a FileDelivery)"""
+    started = g.pop("request_started", None)
+    if started is None:
+        return None
+    endpoint = request.endpoint or "unknown"
+    return lambda: HTTP_SECONDS.observe(time.perf_counter() - started, endpoint)
+
+@app.after_request
+def observe_request_time(response):
+    observe = request_timer()
+    if observe is None:
+        return response
+    # Al cerrar la respuesta, no al devolverla: las transmisiones, el ZIP y los
+    # eventos envían el cuerpo después de after_request
+    if response.direct_passthrough:
+        close_with_response(response, observe)
+    else:
+        response.call_on_close(observe)
+    return response
+
+@app.route("/metrics")
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/stats")
+def stats():
+    return jsonify({
+        "startup_seconds": round(STARTUP_SECONDS, 4),
+        "metadata_cache": METADATA_CACHE.stats(),
+        "extractions": EXTRACTIONS.stats(),
+        "transcoding": TRANSCODE_POOL.stats(),
+        "ydl_pool": YDL_POOL.stats(),
+        "jobs": JOB_MANAGER.stats(),
+        "connections": CONNECTION_LIMITER.stats(),
+        "bandwidth": BANDWIDTH.stats(),
+        "result_cache": RESULT_CACHE.stats(),
+        "state": STATE.stats(),
+        "delivery": DELIVERY.stats(),
+        "prefetch": PREFETCH.stats(),
+    })
 
 # Templates sin mensajes de cookies
 error_template = """
@@ -369,8 +1236,9 @@ quality_template = """
       
       <h2 class="text-xl font-semibold text-gray-200 mb-6 text-center border-b border-gray-700 pb-3">Seleccionar Formato de Descarga</h2>
       
-      <form method="POST" action="/download" onsubmit="startProgress()">
+      <form method="POST" action="/download" onsubmit="return startDownload(event)">
         <input type="hidden" name="url" value="{{ url }}">
+        <input type="hidden" name="accept_audio" value="m4a,opus,mp3">
         
         <div class="mb-6">
           <h3 class="text-lg font-medium text-gray-300 mb-3 flex items-center">
@@ -383,18 +1251,41 @@ quality_template = """
             {% for video in video_formats %}
             <label class="quality-option block bg-gray-700 p-4 rounded-lg border border-gray-600 hover:bg-gray-650 cursor-pointer">
               <div class="flex items-center">
-                <input type="radio" name="format_id" value="{{ video.format_id }}" 
+                <input type="radio" name="format_id" value="{{ video.format_id }}" data-streamable="{{ '1' if video.streamable else '0' }}"
                        class="h-4 w-4 text-gray-400 border-gray-500 focus:ring-gray-400" {{ 'checked' if loop.first }}>
                 <div class="ml-3 flex-1">
                   <div class="flex justify-between items-center">
                     <span class="text-gray-200 font-medium">{{ video.resolution }}</span>
                     <span class="text-sm text-gray-400">{{ video.filesize }}</span>
                   </div>
-                  <span class="text-xs text-gray-500 block mt-1">Formato: MP4 con audio</span>
+                  <span class="text-xs text-gray-500 block mt-1">Formato: MP4 con audio{{ ' (video y audio unidos)' if video.merge }}</span>
                 </div>
               </div>
             </label>
             {% endfor %}
+            <label class="quality-option block bg-gray-700 p-4 rounded-lg border border-gray-600 hover:bg-gray-650 cursor-pointer">
+              <div class="flex items-center">
+                <input type="radio" name="format_id" value="auto" data-streamable="0"
+                       class="h-4 w-4 text-gray-400 border-gray-500 focus:ring-gray-400">
+                <div class="ml-3 flex-1">
+                  <span class="text-gray-200 font-medium">Automático - el archivo más pequeño que cumpla</span>
+                  <div class="flex flex-wrap gap-2 mt-2 text-sm">
+                    <select name="max_height" class="bg-gray-800 border border-gray-600 rounded px-2 py-1 text-gray-200">
+                      <option value="">Cualquier resolución</option>
+                      {% for height in [2160, 1440, 1080, 720, 480, 360] %}
+                      <option value="{{ height }}">Hasta {{ height }}p</option>
+                      {% endfor %}
+                    </select>
+                    <select name="max_fps" class="bg-gray-800 border border-gray-600 rounded px-2 py-1 text-gray-200">
+                      <option value="">Cualquier fps</option>
+                      <option value="30">Hasta 30fps</option>
+                    </select>
+                    <input type="number" name="max_size_mb" min="1" placeholder="Máx. MB"
+                           class="w-28 bg-gray-800 border border-gray-600 rounded px-2 py-1 text-gray-200">
+                  </div>
+                </div>
+              </div>
+            </label>
           </div>
         </div>
         
@@ -406,6 +1297,19 @@ quality_template = """
             Formato de Audio
           </h3>
           <div class="space-y-3">
+            <label class="quality-option block bg-gray-700 p-4 rounded-lg border border-gray-600 hover:bg-gray-650 cursor-pointer">
+              <div class="flex items-center">
+                <input type="radio" name="format_id" value="audio" data-streamable="0"
+                       class="h-4 w-4 text-gray-400 border-gray-500 focus:ring-gray-400">
+                <div class="ml-3 flex-1">
+                  <div class="flex justify-between items-center">
+                    <span class="text-gray-200 font-medium">Audio original (M4A/Opus)</span>
+                    <span class="text-sm text-gray-400">Sin conversión</span>
+                  </div>
+                  <span class="text-xs text-gray-500 block mt-1">Audio copiado tal cual, listo al instante</span>
+                </div>
+              </div>
+            </label>
             <label class="quality-option block bg-gray-700 p-4 rounded-lg border border-gray-600 hover:bg-gray-650 cursor-pointer">
               <div class="flex items-center">
                 <input type="radio" name="format_id" value="mp3" 
@@ -422,6 +1326,21 @@ quality_template = """
           </div>
         </div>
         
+        <div class="mb-6">
+          <h3 class="text-lg font-medium text-gray-300 mb-3">Fragmento (opcional)</h3>
+          <div class="flex flex-wrap items-center gap-2 text-sm">
+            <input type="text" name="start" placeholder="Desde 0:00" pattern="[0-9:.]*"
+                   class="w-28 bg-gray-800 border border-gray-600 rounded px-2 py-1 text-gray-200">
+            <input type="text" name="end" placeholder="Hasta {% if video_info.duration %}{{ (video_info.duration // 60)|int }}:{{ '%02d' % (video_info.duration % 60) }}{% else %}fin{% endif %}" pattern="[0-9:.]*"
+                   class="w-28 bg-gray-800 border border-gray-600 rounded px-2 py-1 text-gray-200">
+            <label class="flex items-center text-gray-400">
+              <input type="checkbox" name="precise" value="1" class="mr-2">
+              Corte exacto (recodifica, más lento)
+            </label>
+          </div>
+          <span class="text-xs text-gray-500 block mt-1">Solo se descarga el intervalo indicado; sin corte exacto empieza en el fotograma clave más cercano</span>
+        </div>
+        
         <button type="submit" class="w-full bg-gray-700 hover:bg-gray-600 text-gray-200 py-3 px-4 rounded-lg font-medium transition-colors duration-200 flex items-center justify-center">
           <svg class="w-5 h-5 mr-2" fill="none" stroke="currentColor" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
             <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"></path>
@@ -439,31 +1358,210 @@ quality_template = """
   </div>
 
   <script>
-    async function checkProgress() {
-      try {
-        const res = await fetch('/progress');
-        const data = await res.json();
-        document.getElementById("status").innerText = data.status;
-        document.getElementById("bar").value = data.progress;
-        document.getElementById("percent").innerText = data.progress + "%";
+    function showStatus(text, value) {
+      document.getElementById("status").innerText = text;
+      document.getElementById("bar").value = value;
+      document.getElementById("percent").innerText = value + "%";
+    }
+    
+    const PHASES = {
+      queued: "En cola...",
+      running: "Iniciando...",
+      downloading: "Descargando",
+      merging: "Uniendo video y audio...",
+      retrying: "Reintentando...",
+      transcode_queued: "En cola para convertir...",
+      transcoding: "Convirtiendo...",
+      processing: "Procesando...",
+    };
+    
+    function formatSpeed(bytesPerSecond) {
+      if (!bytesPerSecond) return "";
+      return " - " + (bytesPerSecond / (1024 * 1024)).toFixed(1) + " MB/s";
+    }
+    
+    function followProgress(job, retry) {
+      const events = new EventSource(job.events_url);
+      events.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        const progress = data.progress;
         
-        if(data.status !== "finished"){
-          setTimeout(checkProgress, 1000);
+        if (data.status === "finished") {
+          events.close();
+          showStatus("Descarga lista", 100);
+          window.location = data.file_url;
+        } else if (data.status === "error") {
+          events.close();
+          showStatus("Error: " + data.error, 0);
+        } else if (data.status === "cancelled") {
+          // Una descarga especulativa cancelada al adoptarla: pedirla de nuevo
+          events.close();
+          retry();
+        } else {
+          let text = PHASES[progress.phase] || progress.phase;
+          if (progress.phase === "downloading") {
+            text += formatSpeed(progress.speed);
+            if (progress.eta) text += " - " + progress.eta + "s restantes";
+          }
+          showStatus(text, progress.percent);
         }
-      } catch (error) {
-        console.error('Error checking progress:', error);
-      }
+      };
+      events.onerror = () => console.error('Error en el flujo de progreso');
     }
     
-    function startProgress(){
+    async function startDownload(event){
+      event.preventDefault();
+      const form = event.target;
       document.getElementById("progress-container").classList.remove("hidden");
-      setTimeout(checkProgress, 1000);
+      
+      // Los formatos con video y audio se transmiten mientras se descargan
+      const selected = form.querySelector('input[name="format_id"]:checked');
+      
+      // Indicar qué códecs de audio reproduce este navegador
+      const audio = document.createElement("audio");
+      const accepted = [];
+      if (audio.canPlayType('audio/mp4; codecs="mp4a.40.2"')) accepted.push("m4a");
+      if (audio.canPlayType('audio/ogg; codecs="opus"')) accepted.push("opus");
+      accepted.push("mp3");
+      form.elements["accept_audio"].value = accepted.join(",");
+      // Los fragmentos se recortan en el servidor: no se transmiten
+      const isClip = form.elements["start"].value || form.elements["end"].value;
+      // El formato que el servidor ya está descargando se sigue como trabajo
+      const prefetched = selected && selected.value === "{{ prefetch or '' }}";
+      if (selected && selected.dataset.streamable === "1" && !isClip && !prefetched) {
+        form.action = "/stream";
+        form.submit();
+        form.action = "/download";
+        showStatus("La descarga comenzó en el navegador", 100);
+        return false;
+      }
+      
+      showStatus("Preparando descarga...", 0);
+      try {
+        const res = await fetch(form.action, {method: 'POST', body: new FormData(form)});
+        const job = await res.json();
+        if (res.status === 429) {
+          // Servidor ocupado: volver a intentarlo cuando indique Retry-After
+          showStatus("Servidor ocupado, reintentando en " + job.retry_after + " s...", 0);
+          setTimeout(() => startDownload({preventDefault() {}, target: form}), job.retry_after * 1000);
+          return false;
+        }
+        if (!res.ok) {
+          showStatus("Error: " + job.error, 0);
+          return false;
+        }
+        followProgress(job, () => startDownload({preventDefault() {}, target: form}));
+      } catch (error) {
+        console.error('Error starting download:', error);
+      }
+      return false;
+    }
+  </script>
+</body>
+</html>
+"""
+
+waiting_template = """
+<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>Preparando descarga - YouTube Downloader</title>
+  <script src="https://cdn.tailwindcss.com"></script>
+  <style>
+    body {
+      background: linear-gradient(135deg, #0f0f0f 0%, #1a1a1a 100%);
+      min-height: 100vh;
     }
+  </style>
+</head>
+<body class="text-gray-100 font-sans antialiased">
+  <div class="min-h-screen flex items-center justify-center px-4 py-8">
+    <div class="bg-gray-800 p-6 rounded-xl shadow-xl w-full max-w-md border border-gray-700 text-center">
+      <h2 class="text-xl font-semibold text-gray-200 mb-4">Preparando descarga</h2>
+      <p id="status" class="text-gray-300 mb-2">En cola...</p>
+      <progress id="bar" value="0" max="100" class="w-full h-2"></progress>
+      <a href="/" class="inline-block mt-6 bg-gray-700 hover:bg-gray-600 text-gray-200 px-4 py-2 rounded-lg transition-colors duration-200">
+        Volver al inicio
+      </a>
+    </div>
+  </div>
+  <script>
+    // El archivo se pide cuando el trabajo termina
+    const events = new EventSource({{ job.events_url|tojson }});
+    events.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.status === "finished") {
+        events.close();
+        document.getElementById("status").innerText = "Descarga lista";
+        document.getElementById("bar").value = 100;
+        window.location = data.file_url;
+      } else if (data.status === "error" || data.status === "cancelled") {
+        events.close();
+        document.getElementById("status").innerText = "Error: " + data.error;
+      } else {
+        const phase = data.progress.phase;
+        document.getElementById("status").innerText = phase === "downloading"
+          ? "Descargando " + data.progress.percent + "%" : phase === "queued" ? "En cola..." : "Procesando...";
+        document.getElementById("bar").value = data.progress.percent;
+      }
+    };
   </script>
 </body>
 </html>
 """
 
+batch_template = """
+<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>Descarga por Lotes - YouTube Downloader</title>
+  <script src="https://cdn.tailwindcss.com"></script>
+  <style>
+    body {
+      background: linear-gradient(135deg, #0f0f0f 0%, #1a1a1a 100%);
+      min-height: 100vh;
+    }
+  </style>
+</head>
+<body class="text-gray-100 font-sans antialiased">
+  <div class="min-h-screen flex items-center justify-center px-4 py-8">
+    <div class="bg-gray-800 p-6 rounded-xl shadow-xl w-full max-w-2xl border border-gray-700">
+      <h2 class="text-xl font-semibold text-gray-200 mb-2 text-center">Descarga por Lotes</h2>
+      <p class="text-gray-400 text-sm text-center mb-6 border-b border-gray-700 pb-3">{{ entries|length }} videos encontrados</p>
+      
+      <ol class="mb-6 max-h-64 overflow-y-auto space-y-1 text-sm text-gray-300">
+        {% for entry in entries %}
+        <li class="bg-gray-700 px-3 py-2 rounded-lg border border-gray-600">{{ '%03d' % entry.index }} - {{ (entry.title or entry.url)|truncate(70) }}</li>
+        {% endfor %}
+      </ol>
+      
+      <form method="POST" action="/batch">
+        <input type="hidden" name="urls" value="{{ urls }}">
+        <div class="space-y-3 mb-6">
+          <label class="block bg-gray-700 p-4 rounded-lg border border-gray-600 cursor-pointer">
+            <input type="radio" name="format_id" value="mp3" class="h-4 w-4 text-gray-400 border-gray-500" checked>
+            <span class="ml-3 text-gray-200 font-medium">MP3 - Alta Calidad (320kbps)</span>
+          </label>
+          <label class="block bg-gray-700 p-4 rounded-lg border border-gray-600 cursor-pointer">
+            <input type="radio" name="format_id" value="best" class="h-4 w-4 text-gray-400 border-gray-500">
+            <span class="ml-3 text-gray-200 font-medium">Video MP4 - Mejor calidad con audio</span>
+          </label>
+        </div>
+        <button type="submit" class="w-full bg-gray-700 hover:bg-gray-600 text-gray-200 py-3 px-4 rounded-lg font-medium transition-colors duration-200">
+          Descargar ZIP
+        </button>
+      </form>
+      <p class="text-gray-500 text-xs text-center mt-4">Los videos que fallen se indican en errores.txt dentro del ZIP</p>
+    </div>
+  </div>
+</body>
+</html>
+"""
+
 index_template = """
 <!DOCTYPE html>
 <html lang="es">
@@ -512,11 +1610,30 @@ index_template = """
           Ver formatos disponibles
         </button>
       </form>
+      
+      <details class="mt-6 border-t border-gray-700 pt-4">
+        <summary class="text-sm text-gray-400 cursor-pointer">Descargar varias URLs en un ZIP</summary>
+        <form method="POST" action="/batch" class="mt-4">
+          <textarea name="urls" rows="4" placeholder="Una URL por línea (videos o listas)"
+                    class="w-full px-4 py-3 bg-gray-700 border border-gray-600 rounded-lg text-gray-100 placeholder-gray-400 focus:outline-none focus:border-gray-500 mb-3" required></textarea>
+          <select name="format_id" class="w-full px-4 py-2 bg-gray-700 border border-gray-600 rounded-lg text-gray-200 mb-3">
+            <option value="mp3">MP3 - Alta Calidad (320kbps)</option>
+            <option value="best">Video MP4 - Mejor calidad con audio</option>
+          </select>
+          <button type="submit" class="w-full bg-gray-700 hover:bg-gray-600 text-gray-200 py-3 px-4 rounded-lg font-medium transition-colors duration-200">
+            Descargar ZIP
+          </button>
+        </form>
+      </details>
     </div>
   </div>
 </body>
 </html>
 """
 
+# Tiempo hasta que la aplicación puede servir "/" (yt-dlp se importa en el primer uso)
+STARTUP_SECONDS = time.perf_counter() - STARTED_AT
+print(f"Aplicación lista en {STARTUP_SECONDS:.3f}s", file=sys.stderr)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
@@ -0,0 +1,163 @@
+import io
+import os
+import zipfile
+from collections import deque
+
+from cache import extract_video_id, canonical_video_url
+from scheduler import QueueFull
+
+class BatchEntry:
+    def __init__(self, index, url, title=None):
+        self.index = index
+        self.url = url
+        self.title = title
+        self.job = None
+        self.error = None
+
+def is_playlist_url(url):
+    """Una URL de lista sin video concreto se procesa en modo lote"""
+    return "list=" in url and extract_video_id(url) is None
+
+def list_entries(urls, pool, ydl_opts, max_entries=200):
+    """Obtener las entradas de listas y URLs sueltas sin extraer cada video"""
+    entries = []
+    for url in urls:
+        video_id = extract_video_id(url)
+        if video_id and not is_playlist_url(url):
+            entries.append(BatchEntry(len(entries) + 1, canonical_video_url(video_id)))
+        else:
+            # Listado plano: una sola petición, sin pedir más entradas de las que se usan
+            opts = dict(ydl_opts, extract_flat="in_playlist", playlistend=max_entries)
+            with pool.checkout(opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+
+            for item in info.get("entries") or [info]:
+                if not item:
+                    continue
+                item_url = item.get("url") or item.get("webpage_url")
+                if item.get("id") and (not item_url or not item_url.startswith("http")):
+                    item_url = canonical_video_url(item["id"])
+                entries.append(BatchEntry(len(entries) + 1, item_url, item.get("title")))
+
+        if len(entries) >= max_entries:
+            break
+
+    return entries[:max_entries]
+
+class _ZipOutput(io.RawIOBase):
+    """Destino de solo escritura que acumula los bytes del ZIP hasta enviarlos"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def start_entries(entries, start_job, max_parallel=4):
+    """Iniciar las primeras entradas antes de responder.
+
+    Se detiene en la primera que la cola no admite; si no admite ninguna,
+    propaga QueueFull para rechazar el lote entero.
+    """
+    started = 0
+    for entry in entries:
+        if started >= max_parallel:
+            break
+        try:
+            entry.job = start_job(entry.url)
+        except QueueFull:
+            if not started:
+                raise
+            break
+        except Exception as e:
+            entry.error = str(e)
+            continue
+        started += 1
+
+def iter_zip(entries, start_job, open_result, max_parallel=4, chunk_size=1024 * 1024):
+    """Generar un ZIP de forma incremental a medida que terminan las descargas.
+
+    start_job(url) inicia la descarga de una entrada y devuelve su trabajo;
+    open_result(job) devuelve (ruta, liberar) para leer el archivo terminado.
+    Las entradas ya iniciadas con start_entries() cuentan como en curso. Si la
+    cola no admite una entrada, se reintenta al terminar otra del lote, sin
+    esperar aquí; si no queda ninguna en curso, la entrada falla. Los fallos
+    de cada entrada se recogen en un informe al final del ZIP.
+    """
+    output = _ZipOutput()
+    archive = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    pending = deque(entry for entry in entries if entry.job is None and entry.error is None)
+    active = [entry for entry in entries if entry.job is not None]
+    failures = [(entry, entry.error) for entry in entries if entry.error is not None]
+
+    while pending or active:
+        # Mantener como máximo max_parallel descargas del lote en curso
+        while pending and len(active) < max_parallel:
+            entry = pending[0]
+            try:
+                entry.job = start_job(entry.url)
+            except QueueFull as e:
+                if active:
+                    break
+                failures.append((entry, str(e)))
+            except Exception as e:
+                failures.append((entry, str(e)))
+            else:
+                active.append(entry)
+            pending.popleft()
+
+        finished = [entry for entry in active if entry.job.wait(0)]
+        if not finished:
+            if active:
+                active[0].job.wait(0.2)
+            continue
+
+        for entry in finished:
+            active.remove(entry)
+            job = entry.job
+            if job.status != "finished":
+                failures.append((entry, job.error))
+                continue
+
+            path, release = open_result(job)
+            if path is None:
+                failures.append((entry, "El archivo ya no está disponible"))
+                continue
+            try:
+                arcname = f"{entry.index:03d} - {os.path.basename(path)}"
+                with open(path, "rb") as src, archive.open(arcname, "w", force_zip64=True) as dest:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = output.drain()
+                        if data:
+                            yield data
+            finally:
+                release()
+            data = output.drain()
+            if data:
+                yield data
+
+    if failures:
+        report = "\n".join(f"{entry.index:03d} {entry.title or entry.url}: {error}"
+                           for entry, error in failures)
+        archive.writestr("errores.txt", report + "\n")
+
+    archive.close()
+    yield output.drain()
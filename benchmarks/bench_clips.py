@@ -0,0 +1,130 @@
+"""Benchmark: bytes y tiempo de descargar fragmentos frente al video completo.
+
+Genera con FFmpeg un MP4 de prueba (fotograma clave cada 2 s, moov al
+principio), lo sirve con el origen local de fake_origin y lo descarga con
+las mismas opciones que usa la aplicación (build_download_opts) para
+fragmentos de varias duraciones, con corte en fotograma clave y exacto.
+Informa los bytes leídos del origen, el tiempo total y la CPU consumida
+(incluida la de FFmpeg), que deben crecer con el fragmento y no con el video.
+
+    python benchmarks/bench_clips.py [--media-duration 600] [--clips 15,60,240]
+
+Requiere ffmpeg en el PATH.
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_origin import MediaOrigin
+
+def make_media(duration):
+    """MP4 H.264/AAC de prueba; se reutiliza entre ejecuciones"""
+    path = os.path.join(tempfile.gettempdir(), f"bench_clips_{duration}s.mp4")
+    if os.path.exists(path):
+        return path
+    print(f"Generando {duration} s de video de prueba...", file=sys.stderr)
+    subprocess.run([
+        "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", "800k", "-g", "60",
+        "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart",
+        path + ".tmp.mp4",
+    ], check=True)
+    os.replace(path + ".tmp.mp4", path)
+    return path
+
+def media_info(url, path, duration):
+    return {
+        "id": "benchclip01",
+        "title": "clip",
+        "duration": duration,
+        "extractor": "generic",
+        "extractor_key": "Generic",
+        "webpage_url": url,
+        "formats": [{
+            "format_id": "18",
+            "url": url,
+            "ext": "mp4",
+            "protocol": "http",
+            "vcodec": "avc1.64001e",
+            "acodec": "mp4a.40.2",
+            "height": 360,
+            "width": 640,
+            "filesize": os.path.getsize(path),
+        }],
+    }
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def run_case(app, origin, info, clip):
+    from segmented import SegmentedYoutubeDL
+
+    work_dir = tempfile.mkdtemp(prefix="bench_clips_")
+    ydl_opts = app.build_download_opts("18", work_dir, use_cookies=False, clip=clip)
+    ydl_opts.update(quiet=True, noprogress=True)
+
+    sent, cpu, started = origin.bytes_sent, cpu_seconds(), time.perf_counter()
+    with SegmentedYoutubeDL(ydl_opts) as ydl:
+        ydl.process_ie_result(dict(info, formats=[dict(f) for f in info["formats"]]), download=True)
+    elapsed = time.perf_counter() - started
+
+    output = sum(os.path.getsize(os.path.join(work_dir, name)) for name in os.listdir(work_dir))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "origin_bytes": origin.bytes_sent - sent,
+        "output_bytes": output,
+        "seconds": elapsed,
+        "cpu_seconds": cpu_seconds() - cpu,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--media-duration", type=int, default=600, help="duración del video de prueba en segundos")
+    parser.add_argument("--clips", default="15,60,240", help="duraciones de los fragmentos en segundos")
+    parser.add_argument("--rate", type=int, default=0, help="límite del origen en bytes/s por conexión")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        sys.exit("Este benchmark necesita ffmpeg en el PATH")
+
+    path = make_media(args.media_duration)
+    origin = MediaOrigin(rate=args.rate).start()
+    url = origin.add_file(path)
+    info = media_info(url, path, args.media_duration)
+
+    import app
+    from clips import Clip
+
+    # Fragmentos centrados en el video para que la búsqueda no empiece en 0
+    cases = [("completo", None)]
+    for length in (int(value) for value in args.clips.split(",")):
+        start = max(0, (args.media_duration - length) // 2)
+        end = min(args.media_duration, start + length)
+        cases.append((f"{length} s clave", Clip(start, end)))
+        cases.append((f"{length} s exacto", Clip(start, end, precise=True)))
+
+    print(f"video de {args.media_duration} s, {os.path.getsize(path) / 1024 ** 2:.1f} MiB")
+    print(f"{'caso':<16} {'origen MiB':>10} {'salida MiB':>10} {'tiempo s':>9} {'CPU s':>7}")
+    try:
+        for name, clip in cases:
+            result = run_case(app, origin, info, clip)
+            print(f"{name:<16} {result['origin_bytes'] / 1024 ** 2:>10.2f} {result['output_bytes'] / 1024 ** 2:>10.2f}"
+                  f" {result['seconds']:>9.2f} {result['cpu_seconds']:>7.2f}")
+    finally:
+        origin.stop()
+
+if __name__ == "__main__":
+    main()
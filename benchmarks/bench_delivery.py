@@ -0,0 +1,137 @@
+"""Benchmark: CPU del proceso de la aplicación por GB entregado según DELIVERY_MODE.
+
+Publica un archivo en la caché de resultados, arranca la aplicación en un
+subproceso (servidor de Werkzeug con hilos) para cada modo de entrega y lo
+descarga varias veces en paralelo desde /files/<clave>. Mide la CPU de
+usuario y de sistema del servidor durante la carga (en /proc) y la divide
+por los bytes servidos. En los modos de proxy la respuesta solo lleva la
+cabecera, así que mide lo que le queda a la aplicación.
+
+    python benchmarks/bench_delivery.py [--size-mb 512] [--requests 8] [--concurrency 4]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+MODES = ("python", "sendfile", "x-accel-redirect")
+CACHE_KEY = "0" * 64
+READ_SIZE = 1024 * 1024
+
+def serve():
+    """Proceso hijo: la aplicación en un puerto libre"""
+    from werkzeug.serving import make_server
+
+    import app as application
+
+    server = make_server("127.0.0.1", 0, application.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+def cpu_seconds(pid):
+    """CPU de usuario y de sistema consumida por un proceso, en segundos"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def fetch(url):
+    buffer = bytearray(READ_SIZE)
+    total = 0
+    with urllib.request.urlopen(url) as response:
+        while True:
+            read = response.readinto(buffer)
+            if not read:
+                break
+            total += read
+    return total
+
+def run_mode(mode, cache_dir, args):
+    work_dir = tempfile.mkdtemp(prefix="bench_delivery_")
+    env = dict(
+        os.environ,
+        DELIVERY_MODE=mode,
+        RESULT_CACHE_DIR=cache_dir,
+        DOWNLOAD_FOLDER=os.path.join(work_dir, "downloads"),
+        STATE_URL="sqlite:///" + os.path.join(work_dir, "state.db"),
+        PYTHONUNBUFFERED="1",
+    )
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+    try:
+        url = f"http://127.0.0.1:{int(proc.stdout.readline())}/files/{CACHE_KEY}"
+        fetch(url)
+
+        cpu, started = cpu_seconds(proc.pid), time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            served = sum(pool.map(fetch, [url] * args.requests))
+        wall = time.perf_counter() - started
+        cpu = cpu_seconds(proc.pid) - cpu
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # En los modos de proxy se cuentan los bytes que serviría el proxy
+    delivered = served if served else args.requests * args.size_mb * 1024 ** 2
+    gigabytes = delivered / 1024 ** 3
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "body_bytes": served,
+        "wall_seconds": round(wall, 3),
+        "server_cpu_seconds": round(cpu, 3),
+        "cpu_seconds_per_gb": round(cpu / gigabytes, 3),
+        "mib_per_second": round(served / 1024 ** 2 / wall, 1) if served else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512, help="tamaño del archivo servido")
+    parser.add_argument("--requests", type=int, default=8, help="descargas por modo")
+    parser.add_argument("--concurrency", type=int, default=4, help="descargas simultáneas")
+    parser.add_argument("--modes", default=",".join(MODES), help="modos a comparar")
+    parser.add_argument("--json", action="store_true", help="imprimir los resultados en JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+
+    # Entrada de caché publicada a mano: la aplicación la encuentra al arrancar
+    cache_dir = tempfile.mkdtemp(prefix="bench_delivery_cache_")
+    entry_dir = os.path.join(cache_dir, CACHE_KEY)
+    os.makedirs(entry_dir)
+    with open(os.path.join(entry_dir, "video.mp4"), "wb") as f:
+        block = os.urandom(READ_SIZE)
+        for _ in range(args.size_mb):
+            f.write(block)
+
+    results = []
+    try:
+        for mode in args.modes.split(","):
+            results.append(run_mode(mode, cache_dir, args))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.requests} descargas de {args.size_mb} MiB, {args.concurrency} simultáneas")
+    print(f"{'modo':<18} {'CPU s':>7} {'CPU s/GB':>9} {'tiempo s':>9} {'MiB/s':>8}")
+    for result in results:
+        speed = result["mib_per_second"]
+        print(f"{result['mode']:<18} {result['server_cpu_seconds']:>7.2f} {result['cpu_seconds_per_gb']:>9.3f}"
+              f" {result['wall_seconds']:>9.2f} {speed if speed is not None else '-':>8}")
+
+if __name__ == "__main__":
+    main()
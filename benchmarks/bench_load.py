@@ -0,0 +1,259 @@
+"""Prueba de carga sin red: /, /download y /progress contra un origen local.
+
+Cada escenario arranca la aplicación en un proceso propio con el extractor
+simulado de fake_origin (los formatos apuntan a un servidor HTTP local con
+medios sintéticos) y la somete a peticiones concurrentes. Informa latencias
+p50/p95/p99, peticiones por segundo, bytes por segundo y el pico de memoria
+(RSS) del servidor, para comparar cambios de una ejecución a otra.
+
+    python benchmarks/bench_load.py [--scenario index|download|progress|all]
+                                    [--concurrency 8] [--requests 200]
+                                    [--duration 30] [--rate 0] [--json salida.json]
+
+Escenarios:
+  index     POST / con --videos vídeos distintos (el primero de cada uno extrae)
+  download  POST /download, espera al trabajo y descarga el archivo completo
+  progress  consultas a /progress?job_id= mientras hay descargas en curso
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_origin import MediaOrigin, install_stub_extractor, video_id
+
+POLL_INTERVAL = 0.05
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def serve(origin_url, duration, delay):
+    """Proceso hijo: la aplicación con el extractor simulado en un puerto libre"""
+    install_stub_extractor(origin_url, duration, delay)
+    from werkzeug.serving import make_server
+
+    import app as application
+
+    server = make_server("127.0.0.1", 0, application.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+class AppServer:
+    """La aplicación en un subproceso; al pararla se obtiene su pico de RSS con wait4()"""
+
+    def __init__(self, origin, args):
+        self.work_dir = tempfile.mkdtemp(prefix="bench_load_")
+        env = dict(
+            os.environ,
+            DOWNLOAD_FOLDER=os.path.join(self.work_dir, "downloads"),
+            RESULT_CACHE_DIR=os.path.join(self.work_dir, "cache"),
+            STATE_URL="sqlite:///" + os.path.join(self.work_dir, "state.db"),
+            DOWNLOAD_WORKERS=str(args.workers),
+            PYTHONUNBUFFERED="1",
+        )
+        os.makedirs(env["DOWNLOAD_FOLDER"])
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", origin.base_url,
+               "--duration", str(args.duration), "--extract-delay", str(args.extract_delay)]
+        self.proc = subprocess.Popen(
+            cmd, env=env, stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL, text=True)
+        self.base_url = f"http://127.0.0.1:{int(self.proc.stdout.readline())}"
+
+    def stop(self):
+        self.proc.terminate()
+        _, _, usage = os.wait4(self.proc.pid, 0)
+        self.proc.returncode = 0
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        # ru_maxrss está en KiB en Linux
+        return usage.ru_maxrss * 1024
+
+def request(base_url, path, data=None, timeout=120):
+    """Petición HTTP; devuelve (estado, cuerpo)"""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    try:
+        with urllib.request.urlopen(base_url + path, data=body, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def watch_url(n):
+    return f"https://www.youtube.com/watch?v={video_id(n)}"
+
+def start_download(base_url, n, format_id):
+    status, body = request(base_url, "/download", {"url": watch_url(n), "format_id": format_id})
+    if status not in (200, 202):
+        raise RuntimeError(f"/download respondió {status}")
+    return json.loads(body)
+
+def wait_for_job(base_url, job):
+    while job["status"] not in ("finished", "error"):
+        time.sleep(POLL_INTERVAL)
+        _, body = request(base_url, f"/jobs/{job['job_id']}")
+        job = json.loads(body)
+    if job["status"] == "error":
+        raise RuntimeError(job.get("error"))
+    return job
+
+def scenario_index(base_url, n, args):
+    status, body = request(base_url, "/", {"url": watch_url(n % args.videos)})
+    # La página de error también responde 200: comprobar que hay selector de formato
+    if status != 200 or b"format_id" not in body:
+        raise RuntimeError(f"/ respondió {status}")
+    return len(body)
+
+def scenario_download(base_url, n, args):
+    # Sin --videos cada petición es un vídeo distinto y no acierta en la caché
+    index = n % args.videos if args.videos else n
+    job = wait_for_job(base_url, start_download(base_url, index, args.format))
+    status, body = request(base_url, urllib.parse.urlparse(job["file_url"]).path)
+    if status != 200:
+        raise RuntimeError(f"archivo respondió {status}")
+    return len(body)
+
+def scenario_progress(base_url, n, args):
+    job_id = args.active_jobs[n % len(args.active_jobs)]
+    status, body = request(base_url, f"/progress?job_id={job_id}")
+    if status != 200:
+        raise RuntimeError(f"/progress respondió {status}")
+    return len(body)
+
+SCENARIOS = {
+    "index": scenario_index,
+    "download": scenario_download,
+    "progress": scenario_progress,
+}
+
+def prepare_progress(base_url, args):
+    """Lanzar descargas lentas para que /progress informe trabajos en curso"""
+    jobs = [start_download(base_url, 900000 + i, args.format) for i in range(args.workers)]
+    args.active_jobs = [job["job_id"] for job in jobs]
+    return jobs
+
+def run_load(base_url, func, args):
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, errors, total_bytes = [], [], [0]
+
+    def worker():
+        while True:
+            n = next(counter)
+            if n >= args.requests:
+                return
+            started = time.perf_counter()
+            try:
+                size = func(base_url, n, args)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                total_bytes[0] += size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(worker)
+    wall = time.perf_counter() - started
+    return latencies, errors, total_bytes[0], wall
+
+def run_scenario(name, args):
+    origin = MediaOrigin(rate=args.rate).start()
+    server = AppServer(origin, args)
+    try:
+        if name == "progress":
+            # Descargas limitadas a 256 KiB/s para que sigan activas durante la carga
+            origin.server.rate = args.rate or 256 * 1024
+            prepare_progress(server.base_url, args)
+        latencies, errors, total_bytes, wall = run_load(server.base_url, SCENARIOS[name], args)
+    finally:
+        if name == "progress":
+            origin.server.rate = 0
+        peak_rss = server.stop()
+        origin_bytes = origin.bytes_sent
+        origin.stop()
+
+    return {
+        "scenario": name,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(latencies) / wall, 2) if wall else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+        "response_mb_per_second": round(total_bytes / wall / 1024 ** 2, 2) if wall else 0,
+        "origin_bytes": origin_bytes,
+        "server_peak_rss_mb": round(peak_rss / 1024 ** 2, 1),
+    }
+
+def print_result(result):
+    print(f"== {result['scenario']} (concurrencia {result['concurrency']})")
+    print(f"  peticiones:  {result['requests']} correctas, {result['errors']} errores"
+          f" en {result['wall_seconds']} s ({result['requests_per_second']} pet/s)")
+    print(f"  latencia:    p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms"
+          f"  p99 {result['p99_ms']} ms  máx {result['max_ms']} ms")
+    print(f"  respuestas:  {result['response_mb_per_second']} MiB/s"
+          f"  (origen: {result['origin_bytes'] / 1024 ** 2:.1f} MiB)")
+    print(f"  RSS máximo:  {result['server_peak_rss_mb']} MiB")
+    if result["first_error"]:
+        print(f"  primer error: {result['first_error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--videos", type=int, default=0,
+                        help="vídeos distintos (index usa 20 si es 0; download, uno por petición)")
+    parser.add_argument("--format", default="18", help="formato que pide el escenario download")
+    parser.add_argument("--duration", type=int, default=30, help="duración simulada; fija el tamaño de los formatos")
+    parser.add_argument("--rate", type=int, default=0, help="límite del origen en bytes/s por conexión")
+    parser.add_argument("--extract-delay", type=float, default=0.0, help="latencia simulada de la extracción")
+    parser.add_argument("--workers", type=int, default=2, help="DOWNLOAD_WORKERS de la aplicación")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    parser.add_argument("--verbose", action="store_true", help="mostrar la salida de la aplicación")
+    parser.add_argument("--serve", metavar="ORIGIN", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.duration, args.extract_delay)
+        return
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in names:
+        scenario_args = argparse.Namespace(**vars(args))
+        if name == "index" and not scenario_args.videos:
+            scenario_args.videos = 20
+        result = run_scenario(name, scenario_args)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Micro-benchmark: coste por petición de crear un YoutubeDL frente al pool.
+
+Mide, sin acceso a la red, lo que cada petición pagaba antes (construir la
+instancia, su cliente HTTP y el extractor de YouTube) y lo que paga ahora al
+tomar una instancia ya inicializada del pool.
+
+    python benchmarks/bench_ydl_pool.py [iteraciones]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+from ydl_pool import YoutubeDLPool
+
+OPTS = {"quiet": True, "no_warnings": False, "socket_timeout": 30, "extract_flat": False}
+
+def warm_up(ydl):
+    """Inicializar lo que una extracción real construye en su primer uso"""
+    ydl._request_director
+    ydl.get_info_extractor("Youtube")
+
+def bench_fresh(iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with yt_dlp.YoutubeDL(dict(OPTS)) as ydl:
+            warm_up(ydl)
+    return (time.perf_counter() - start) / iterations
+
+def bench_pool(iterations):
+    pool = YoutubeDLPool(max_idle=1)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with pool.checkout(OPTS) as ydl:
+            warm_up(ydl)
+    elapsed = (time.perf_counter() - start) / iterations
+    pool.clear()
+    return elapsed, pool.stats()
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    fresh = bench_fresh(iterations)
+    pooled, stats = bench_pool(iterations)
+
+    print(f"iteraciones:            {iterations}")
+    print(f"YoutubeDL por petición: {fresh * 1000:.3f} ms")
+    print(f"Pool (checkout):        {pooled * 1000:.3f} ms")
+    print(f"Aceleración:            {fresh / pooled:.1f}x")
+    print(f"Pool: {stats}")
+
+if __name__ == "__main__":
+    main()
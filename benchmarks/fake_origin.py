@@ -0,0 +1,201 @@
+"""Origen de medios local y extractor simulado para medir sin acceso a la red.
+
+MediaOrigin sirve archivos sintéticos del tamaño pedido en la URL, con
+soporte de Range y un límite opcional de velocidad por conexión. El
+extractor simulado sustituye a YoutubeIE._real_extract y devuelve una lista
+de formatos como la de YouTube (progresivo, video DASH, audio y storyboard)
+apuntando a ese origen, así que yt-dlp recorre su camino real: selección de
+formato, HttpFD, archivos .part y hooks de progreso.
+"""
+import http.server
+import os
+import re
+import socket
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+SEND_BUFFER = 128 * 1024
+
+# Formatos habituales de YouTube: (format_id, ext, vcodec, acodec, height, fps, tbr en kbit/s)
+YOUTUBE_FORMATS = [
+    ("sb0", "mhtml", "none", "none", 0, 0, 0),
+    ("139", "m4a", "none", "mp4a.40.5", 0, 0, 49),
+    ("140", "m4a", "none", "mp4a.40.2", 0, 0, 129),
+    ("251", "webm", "none", "opus", 0, 0, 135),
+    ("18", "mp4", "avc1.42001E", "mp4a.40.2", 360, 30, 496),
+    ("134", "mp4", "avc1.4d401e", "none", 360, 30, 370),
+    ("243", "webm", "vp9", "none", 360, 30, 290),
+    ("135", "mp4", "avc1.4d401f", "none", 480, 30, 690),
+    ("244", "webm", "vp9", "none", 480, 30, 540),
+    ("136", "mp4", "avc1.4d401f", "none", 720, 30, 1340),
+    ("247", "webm", "vp9", "none", 720, 30, 1060),
+    ("298", "mp4", "avc1.4d4020", "none", 720, 60, 2100),
+    ("137", "mp4", "avc1.640028", "none", 1080, 30, 2600),
+    ("248", "webm", "vp9", "none", 1080, 30, 2000),
+    ("299", "mp4", "avc1.64002a", "none", 1080, 60, 4200),
+]
+
+def synthetic_bytes(start, length):
+    """Contenido determinista: el byte en la posición n vale n % 251"""
+    pattern = bytes(range(251))
+    offset = start % len(pattern)
+    repeated = pattern * (length // len(pattern) + 2)
+    return repeated[offset:offset + length]
+
+class _MediaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Búfer de envío pequeño: bytes_sent se acerca a lo que el cliente lee de verdad
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+
+    def do_GET(self):
+        # /media/<bytes>/<nombre> es sintético; /file/<nombre>, un archivo registrado
+        match = re.match(r"^/media/(\d+)/", self.path)
+        if match:
+            self._send_range(int(match.group(1)), synthetic_bytes)
+            return
+        path = self.server.files.get(self.path[len("/file/"):]) if self.path.startswith("/file/") else None
+        if path is None:
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            def read(position, length):
+                f.seek(position)
+                return f.read(length)
+            self._send_range(os.path.getsize(path), read)
+
+    def _send_range(self, size, read):
+        start, end = 0, size - 1
+
+        range_header = self.headers.get("Range")
+        if range_header:
+            range_match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+            if not range_match or int(range_match.group(1)) >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start = int(range_match.group(1))
+            if range_match.group(2):
+                end = min(int(range_match.group(2)), size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        rate = self.server.rate
+        position = start
+        try:
+            while position <= end:
+                length = min(CHUNK_SIZE, end - position + 1)
+                self.wfile.write(read(position, length))
+                position += length
+                if rate:
+                    time.sleep(length / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        with self.server.lock:
+            self.server.bytes_sent += position - start
+
+class MediaOrigin:
+    """Servidor HTTP local con medios sintéticos; rate limita bytes/s por conexión"""
+
+    def __init__(self, rate=0, host="127.0.0.1"):
+        self.server = http.server.ThreadingHTTPServer((host, 0), _MediaHandler)
+        self.server.daemon_threads = True
+        self.server.rate = rate
+        self.server.lock = threading.Lock()
+        self.server.bytes_sent = 0
+        self.server.files = {}
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def bytes_sent(self):
+        with self.server.lock:
+            return self.server.bytes_sent
+
+    def add_file(self, path):
+        """Servir un archivo local con Range; devuelve su URL"""
+        name = os.path.basename(path)
+        self.server.files[name] = path
+        return f"{self.base_url}/file/{name}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def fake_info(video_id, origin_url, duration=30):
+    """Resultado de extracción con formatos realistas servidos por el origen local"""
+    formats = []
+    for format_id, ext, vcodec, acodec, height, fps, tbr in YOUTUBE_FORMATS:
+        fmt = {
+            "format_id": format_id,
+            "ext": ext,
+            "vcodec": vcodec,
+            "acodec": acodec,
+            "protocol": "https" if format_id != "sb0" else "mhtml",
+        }
+        if height:
+            fmt.update(height=height, width=height * 16 // 9, fps=fps)
+        if tbr:
+            size = int(tbr * 1000 / 8 * duration)
+            fmt.update(tbr=tbr, filesize=size, url=f"{origin_url}/media/{size}/{video_id}.{format_id}.{ext}")
+            if vcodec == "none":
+                fmt["abr"] = tbr
+            elif acodec == "none":
+                fmt["vbr"] = tbr
+        else:
+            fmt["url"] = f"{origin_url}/media/1024/{video_id}.{format_id}.{ext}"
+        formats.append(fmt)
+
+    return {
+        "id": video_id,
+        "title": f"Video de prueba {video_id}",
+        "duration": duration,
+        "thumbnail": f"{origin_url}/media/2048/{video_id}.jpg",
+        "view_count": 12345,
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "formats": formats,
+    }
+
+def install_stub_extractor(origin_url, duration=30, delay=0.0, info_factory=None):
+    """Sustituir la extracción de YouTube por fake_info; delay simula la latencia de la API.
+
+    info_factory(video_id), si se indica, construye el resultado en lugar de fake_info.
+    """
+    from yt_dlp.extractor.youtube import YoutubeIE
+
+    def _real_extract(self, url):
+        if delay:
+            time.sleep(delay)
+        if info_factory is not None:
+            return info_factory(self._match_id(url))
+        return fake_info(self._match_id(url), origin_url, duration)
+
+    YoutubeIE._real_initialize = lambda self: None
+    YoutubeIE._real_extract = _real_extract
+
+def video_id(n):
+    """Identificador de 11 caracteres válido para YoutubeIE"""
+    return f"bench{n:06d}"
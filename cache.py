@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Patrones de URL de YouTube que contienen el ID del video (11 caracteres)
+VIDEO_ID_PATTERNS = [
+    re.compile(r'youtu\.be/([A-Za-z0-9_-]{11})'),
+    re.compile(r'[?&]v=([A-Za-z0-9_-]{11})'),
+    re.compile(r'/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})'),
+]
+
+def extract_video_id(url):
+    """Obtener el ID normalizado del video a partir de una URL de YouTube"""
+    if not url:
+        return None
+    for pattern in VIDEO_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return None
+
+def canonical_video_url(video_id):
+    """Construir la URL canónica de un video a partir de su ID"""
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+class TTLCache:
+    """Caché en memoria con tiempo de vida, tamaño máximo y expulsión LRU.
+
+    Con backend, los fallos se consultan en el estado compartido antes de
+    darse por perdidos y cada set() se publica allí, de modo que otros
+    procesos (y este tras un reinicio) reutilizan los valores sin recalcularlos.
+    """
+
+    def __init__(self, maxsize=256, ttl=600, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    # Marcar como usada recientemente
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # Entrada caducada: eliminarla y buscarla en el backend
+                del self._data[key]
+                self.expirations += 1
+
+        shared = self.backend.get_metadata(key) if self.backend is not None else None
+        with self._lock:
+            if shared is None:
+                self.misses += 1
+                return None
+            value, expires_at = shared
+            # La copia local no sobrevive a la compartida
+            self._store(key, value, time.monotonic() + min(self.ttl, expires_at - time.time()))
+            self.shared_hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic() + self.ttl)
+        if self.backend is not None:
+            self.backend.set_metadata(key, value, time.time() + self.ttl)
+
+    def _store(self, key, value, expires_at):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        # Expulsar las entradas menos usadas si se supera el tamaño
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        if self.backend is not None:
+            self.backend.pop_metadata(key)
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """Obtener contadores de aciertos, fallos y expulsiones"""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,84 @@
+import re
+
+_TIMESTAMP = re.compile(r"^(?:(?:(\d+):)?(\d{1,2}):)?(\d+(?:\.\d+)?)$")
+
+def parse_timestamp(value):
+    """Convertir "90", "1:30" o "1:02:03.5" en segundos; vacío es None"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    match = _TIMESTAMP.match(value)
+    if not match:
+        raise ValueError(f"Tiempo no válido: {value}")
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+
+def format_timestamp(seconds):
+    """Etiqueta corta para nombres de archivo: 1h02m03s, 1m30s, 45s"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+class Clip:
+    """Fragmento [start, end) de un video que se descarga en lugar del archivo completo.
+
+    yt-dlp pasa el intervalo a FFmpeg, que busca en el origen y solo lee los
+    bytes del fragmento. Por defecto los cortes caen en el fotograma clave
+    más cercano (copia sin recodificar); con precise se fuerzan fotogramas
+    clave en los puntos de corte, lo que obliga a recodificar.
+    """
+
+    def __init__(self, start, end, precise=False):
+        self.start = start
+        self.end = end
+        self.precise = precise
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def key(self):
+        """Parte de la clave de caché: mismos cortes, mismo archivo"""
+        return [self.start, self.end, self.precise]
+
+    def label(self):
+        return f"{format_timestamp(self.start)}-{format_timestamp(self.end)}"
+
+    def apply(self, ydl_opts):
+        """Añadir a las opciones de yt-dlp la descarga del intervalo"""
+        from yt_dlp.utils import download_range_func
+
+        ydl_opts["download_ranges"] = download_range_func(None, [(self.start, self.end)])
+        ydl_opts["force_keyframes_at_cuts"] = self.precise
+        return ydl_opts
+
+    def to_dict(self):
+        return {"start": self.start, "end": self.end, "precise": self.precise}
+
+def parse_clip(start, end, precise=False, duration=None):
+    """Crear el Clip pedido en el formulario; None si no se indica inicio ni fin"""
+    start = parse_timestamp(start)
+    end = parse_timestamp(end)
+    if start is None and end is None:
+        return None
+
+    start = start or 0
+    if duration and start >= duration:
+        raise ValueError("El inicio del fragmento supera la duración del video")
+    if end is None:
+        if not duration:
+            raise ValueError("Indica el final del fragmento")
+        end = duration
+    if end <= start:
+        raise ValueError("El final del fragmento debe ser posterior al inicio")
+    if duration:
+        end = min(end, duration)
+    if start == 0 and duration and end >= duration:
+        # El video completo: no es un fragmento
+        return None
+    return Clip(start, end, bool(precise))
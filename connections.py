@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager
+
+class ConnectionLimiter:
+    """Límite global de conexiones al origen compartido por todos los trabajos"""
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self._cond = threading.Condition()
+        self.active = 0
+        self.peak = 0
+        self.waits = 0
+
+    def acquire(self, count=1, blocking=True):
+        """Reservar count conexiones; sin blocking devuelve False si no hay hueco"""
+        with self._cond:
+            if self.active + count > self.max_connections:
+                if not blocking:
+                    return False
+                self.waits += 1
+                self._cond.wait_for(lambda: self.active + count <= self.max_connections)
+            self.active += count
+            self.peak = max(self.peak, self.active)
+            return True
+
+    def release(self, count=1):
+        with self._cond:
+            self.active -= count
+            self._cond.notify_all()
+
+    @contextmanager
+    def connection(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def reserve(self, wanted):
+        """Reservar hasta wanted conexiones: al menos una, más solo si están libres"""
+        self.acquire()
+        granted = 1
+        while granted < wanted and self.acquire(blocking=False):
+            granted += 1
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_connections": self.max_connections,
+                "active": self.active,
+                "peak": self.peak,
+                "waits": self.waits,
+            }
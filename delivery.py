@@ -0,0 +1,279 @@
+import heapq
+import io
+import os
+import ssl
+import threading
+import time
+import zlib
+from urllib.parse import quote
+
+from werkzeug.utils import send_file
+from werkzeug.wsgi import ClosingIterator
+
+MODES = ("sendfile", "x-accel-redirect", "x-sendfile", "python")
+
+class _TrackedFile(io.FileIO):
+    """Archivo que al cerrarse informa de hasta dónde se leyó o se envió.
+
+    Tanto la lectura en Python como socket.sendfile() (el de Werkzeug y el de
+    gunicorn) dejan la posición del archivo al final de lo entregado.
+    """
+
+    def __init__(self, path, on_close):
+        super().__init__(path, "rb")
+        self._on_close = on_close
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            position = self.tell()
+        except (OSError, ValueError):
+            position = 0
+        super().close()
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close(position)
+
+class _SendfileBody:
+    """Cuerpo WSGI que copia el archivo al socket del cliente con sendfile(2).
+
+    El primer bloque vacío hace que el servidor escriba la cabecera; después
+    el núcleo copia los bytes sin pasar por el proceso.
+    """
+
+    def __init__(self, sock, file, offset, count):
+        self.sock = sock
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+    def __iter__(self):
+        yield b""
+        try:
+            self.sock.sendfile(self.file, self.offset, self.count)
+        except OSError:
+            # Cliente desconectado; la posición del archivo indica lo enviado
+            pass
+
+    def close(self):
+        self.file.close()
+
+class _DeferredTasks:
+    """Tareas diferidas (liberar o borrar archivos) en un único hilo"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, func):
+        with self._changed:
+            self._counter += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._counter, func))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="delivery-cleanup", daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def __len__(self):
+        with self._changed:
+            return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._changed.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, func = heapq.heappop(self._heap)
+            try:
+                func()
+            except Exception:
+                pass
+
+def file_etag(path, stat):
+    """El mismo ETag que send_file para una ruta, para no invalidar reanudaciones"""
+    check = zlib.adler32(os.path.abspath(path).encode()) & 0xFFFFFFFF
+    return f"{stat.st_mtime}-{stat.st_size}-{check}"
+
+def parse_accel_map(value):
+    """Convertir "ruta=/uri,ruta=/uri" en [(directorio local, prefijo interno)]"""
+    mapping = []
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        local, _, uri = item.partition("=")
+        mapping.append((os.path.abspath(local), "/" + uri.strip("/")))
+    return mapping
+
+class FileDelivery:
+    """Envío de archivos terminados sin copiar los bytes en Python.
+
+    Modos:
+      - sendfile: el núcleo copia el archivo al socket. Se usa el
+        wsgi.file_wrapper del servidor si lo ofrece (gunicorn, uWSGI) y, con
+        el servidor de Werkzeug, socket.sendfile() sobre su conexión.
+      - x-accel-redirect / x-sendfile: la respuesta solo lleva la cabecera y el
+        proxy (nginx, Apache, lighttpd) sirve el archivo. Para nginx,
+        accel_map traduce cada directorio a una location interna:
+            location /_downloads/cache/ { internal; alias /ruta/a/la/cache/; }
+      - python: lectura por bloques en el proceso, como antes.
+
+    Al terminar la transferencia se llama a release() y, si se leyó el archivo
+    completo, a cleanup() (por ejemplo, para borrarlo). Con el proxy no se sabe
+    cuándo termina: ambos se difieren offload_grace segundos, tiempo de sobra
+    para que el proxy abra el archivo; en POSIX lo sigue leyendo aunque se borre.
+    on_close() se llama sin demora cuando el servidor cierra la respuesta.
+    """
+
+    def __init__(self, mode="sendfile", accel_map=None, offload_grace=60):
+        if mode not in MODES:
+            raise ValueError(f"Modo de entrega no soportado: {mode}")
+        self.mode = mode
+        self.accel_map = sorted(accel_map or [], key=lambda item: len(item[0]), reverse=True)
+        self.offload_grace = offload_grace
+        self._deferred = _DeferredTasks()
+        self._lock = threading.Lock()
+        self.counts = {"sendfile": 0, "file_wrapper": 0, "python": 0, "offloaded": 0}
+        self.completed = 0
+        self.incomplete = 0
+        self.cleaned = 0
+        self.bytes_sent = 0
+
+    def send(self, environ, path, download_name=None, release=None, cleanup=None, on_close=None):
+        """Respuesta que entrega path como descarga; release, cleanup y on_close sin argumentos"""
+        download_name = download_name or os.path.basename(path)
+        release = release or (lambda: None)
+        on_close = on_close or (lambda: None)
+        if self.mode in ("x-accel-redirect", "x-sendfile"):
+            response = self._offload(environ, path, download_name, release, cleanup)
+            if response is not None:
+                # Solo lleva la cabecera: termina al cerrarse la respuesta
+                response.response = ClosingIterator(response.response, on_close)
+                return response
+        return self._send_local(environ, path, download_name, release, cleanup, on_close)
+
+    def _accel_uri(self, path):
+        path = os.path.abspath(path)
+        for local, uri in self.accel_map:
+            if path.startswith(local + os.sep):
+                return uri + "/" + quote(os.path.relpath(path, local))
+        return None
+
+    def _offload(self, environ, path, download_name, release, cleanup):
+        """Delegar el envío en el proxy; None si el archivo no se puede delegar"""
+        if self.mode == "x-accel-redirect":
+            target, header = self._accel_uri(path), "X-Accel-Redirect"
+        else:
+            target, header = os.path.abspath(path), "X-Sendfile"
+        try:
+            # Las cabeceras WSGI deben ser latin-1
+            (target or "").encode("latin-1")
+        except UnicodeEncodeError:
+            target = None
+        if target is None:
+            return None
+
+        # El proxy resuelve Range y las peticiones condicionales
+        response = send_file(path, environ, as_attachment=True, download_name=download_name,
+                             use_x_sendfile=True, conditional=False, etag=False)
+        if header != "X-Sendfile":
+            del response.headers["X-Sendfile"]
+            response.content_length = 0
+        response.headers[header] = target
+
+        with self._lock:
+            self.counts["offloaded"] += 1
+        # Un Range o un HEAD no entregan el archivo completo: no se borra
+        full = "HTTP_RANGE" not in environ and environ["REQUEST_METHOD"] != "HEAD"
+        def finish():
+            release()
+            if cleanup is not None and full:
+                self._cleanup(cleanup)
+        self._deferred.schedule(self.offload_grace, finish)
+        return response
+
+    def _send_local(self, environ, path, download_name, release, cleanup, on_close):
+        stat = os.stat(path)
+        size = stat.st_size
+        sent_range = [0, size]
+
+        def on_file_close(position):
+            # El servidor cierra el archivo al terminar, también el file_wrapper de
+            # gunicorn, que no se puede envolver sin perder su sendfile
+            try:
+                finish(position)
+            finally:
+                on_close()
+
+        def finish(position):
+            start, end = sent_range
+            if end == start:
+                # 304, HEAD o archivo vacío: no hubo transferencia
+                release()
+                return
+            # Completa si el cliente tiene ya el final del archivo (también al reanudar)
+            complete = position >= end == size
+            with self._lock:
+                self.bytes_sent += max(0, min(position, end) - start)
+                if complete:
+                    self.completed += 1
+                else:
+                    self.incomplete += 1
+            release()
+            # Solo tras una entrega completa: una interrumpida se puede reanudar
+            if complete and cleanup is not None:
+                self._cleanup(cleanup)
+
+        server_wrapper = environ.get("wsgi.file_wrapper")
+        if self.mode == "python":
+            # Sin el file_wrapper del servidor, que podría usar sendfile
+            environ = {key: value for key, value in environ.items() if key != "wsgi.file_wrapper"}
+
+        file = _TrackedFile(path, on_file_close)
+        response = send_file(file, environ, as_attachment=True, download_name=download_name,
+                             conditional=False, etag=file_etag(path, stat), last_modified=stat.st_mtime)
+        response.content_length = size
+        try:
+            response = response.make_conditional(environ, accept_ranges=True, complete_length=size)
+        except Exception:
+            file.close()
+            raise
+
+        if response.status_code == 206:
+            sent_range[:] = [response.content_range.start, response.content_range.stop]
+        elif response.status_code != 200 or environ["REQUEST_METHOD"] == "HEAD":
+            sent_range[:] = [0, 0]
+            return response
+
+        kind = "python"
+        if self.mode == "sendfile":
+            sock = environ.get("werkzeug.socket")
+            if server_wrapper is not None and response.status_code == 200:
+                # gunicorn y uWSGI envían su file_wrapper con sendfile
+                kind = "file_wrapper"
+            elif server_wrapper is None and sock is not None and not isinstance(sock, ssl.SSLSocket):
+                start, end = sent_range
+                response.response = _SendfileBody(sock, file, start, end - start)
+                kind = "sendfile"
+        with self._lock:
+            self.counts[kind] += 1
+        return response
+
+    def _cleanup(self, cleanup):
+        try:
+            cleanup()
+        finally:
+            with self._lock:
+                self.cleaned += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "responses": dict(self.counts),
+                "completed": self.completed,
+                "incomplete": self.incomplete,
+                "cleaned": self.cleaned,
+                "bytes_sent": self.bytes_sent,
+                "deferred": len(self._deferred),
+            }
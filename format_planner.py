@@ -0,0 +1,179 @@
+import math
+
+# Contenedor de audio preferido para cada contenedor de video al unirlos
+AUDIO_FOR_VIDEO_EXT = {
+    "mp4": "m4a",
+    "webm": "webm",
+}
+
+# Un progresivo hasta un 20 % mayor que la unión más barata de su resolución la
+# sustituye en la lista: se transmite mientras se descarga y no necesita FFmpeg
+PROGRESSIVE_MARGIN = 0.2
+
+def has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none') and bool(fmt.get('height'))
+
+def has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+def estimate_size(fmt, duration):
+    """Estimar el tamaño en bytes a partir de filesize, filesize_approx o tbr"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+
+    # tbr está en kbit/s
+    tbr = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+def estimate_format_size(info, format_id):
+    """Tamaño estimado de un format_id, también de pares "video+audio"; None si se desconoce"""
+    formats = {f.get('format_id'): f for f in info.get('formats') or []}
+    total = 0
+    for part in format_id.split('+'):
+        fmt = formats.get(part)
+        size = estimate_size(fmt, info.get('duration')) if fmt else None
+        if size is None:
+            return None
+        total += size
+    return total
+
+def estimate_audio_size(info):
+    """Tamaño del mayor flujo de solo audio, cota para los modos de audio; None si se desconoce"""
+    sizes = [estimate_size(f, info.get('duration')) for f in info.get('formats') or []
+             if has_audio(f) and not has_video(f)]
+    sizes = [size for size in sizes if size]
+    return max(sizes) if sizes else None
+
+class FormatPlan:
+    """Un formato progresivo o un par video+audio que yt-dlp une al descargar"""
+
+    def __init__(self, video, audio=None, duration=None):
+        self.video = video
+        self.audio = audio
+        self.height = video.get('height') or 0
+        self.fps = video.get('fps') or 0
+        self.ext = video.get('ext', 'mp4')
+
+        sizes = [estimate_size(video, duration)]
+        if audio is not None:
+            sizes.append(estimate_size(audio, duration))
+        self.size = None if None in sizes else sum(sizes)
+
+    @property
+    def merge(self):
+        return self.audio is not None
+
+    @property
+    def format_id(self):
+        if self.audio is None:
+            return self.video['format_id']
+        return f"{self.video['format_id']}+{self.audio['format_id']}"
+
+    def cost_key(self):
+        # Tamaño desconocido al final; a igual tamaño, evitar la fusión
+        return (self.size is None, self.size or 0, self.merge)
+
+def _pick_audio(video, audio_formats):
+    """Elegir el audio de mayor calidad, preferiblemente del mismo contenedor"""
+    preferred_ext = AUDIO_FOR_VIDEO_EXT.get(video.get('ext'))
+    preferred = [a for a in audio_formats if a.get('ext') == preferred_ext]
+    candidates = preferred or audio_formats
+    if not candidates:
+        return None
+    return max(candidates, key=lambda a: a.get('abr') or a.get('tbr') or 0)
+
+def build_plans(info):
+    """Todas las combinaciones descargables: progresivas y pares video+audio"""
+    duration = info.get('duration')
+    formats = info.get('formats') or []
+    audio_only = [f for f in formats if has_audio(f) and f.get('vcodec') == 'none']
+
+    plans = []
+    for f in formats:
+        if not has_video(f):
+            continue
+        if has_audio(f):
+            plans.append(FormatPlan(f, duration=duration))
+        elif f.get('acodec') == 'none':
+            audio = _pick_audio(f, audio_only)
+            if audio is not None:
+                plans.append(FormatPlan(f, audio, duration))
+    return plans
+
+def list_plans(info):
+    """Los planes de cada resolución y fps, de mayor a menor calidad.
+
+    De cada una se ofrece el más barato. Si es una unión, se ofrece también el
+    progresivo más barato, o solo este si no cuesta más de PROGRESSIVE_MARGIN.
+    """
+    tiers = {}
+    for plan in build_plans(info):
+        tiers.setdefault((plan.height, plan.fps), []).append(plan)
+
+    plans = []
+    for tier in sorted(tiers, reverse=True):
+        ranked = sorted(tiers[tier], key=FormatPlan.cost_key)
+        cheapest = ranked[0]
+        progressive = next((plan for plan in ranked if not plan.merge), None)
+        if progressive is None or progressive is cheapest:
+            plans.append(cheapest)
+        elif _close_enough(progressive, cheapest):
+            plans.append(progressive)
+        else:
+            plans.extend([cheapest, progressive])
+    return plans
+
+def _close_enough(progressive, merge):
+    if progressive.size is None or merge.size is None:
+        return merge.size is None
+    return progressive.size <= merge.size * (1 + PROGRESSIVE_MARGIN)
+
+def choose_plan(info, max_height=None, max_fps=None, max_bytes=None):
+    """Elegir el plan más barato de la mayor altura que cumple los límites.
+
+    A igual altura no se prefieren más fps salvo que se pidan con max_fps:
+    60 fps cuesta casi el doble de bytes que 30.
+    """
+    candidates = []
+    for plan in build_plans(info):
+        if max_height and plan.height > max_height:
+            continue
+        if max_fps and plan.fps > max_fps:
+            continue
+        if max_bytes and (plan.size is None or plan.size > max_bytes):
+            continue
+        candidates.append(plan)
+
+    if not candidates:
+        return None
+    height = max(plan.height for plan in candidates)
+    candidates = [plan for plan in candidates if plan.height == height]
+    if max_fps:
+        fps = max(plan.fps for plan in candidates)
+        candidates = [plan for plan in candidates if plan.fps == fps]
+    return min(candidates, key=FormatPlan.cost_key)
+
+def choose_audio_mode(info, accepted):
+    """Elegir el primer modo de audio aceptado que no requiere recodificar"""
+    audio = [f for f in info.get('formats') or [] if has_audio(f) and f.get('vcodec') == 'none']
+    available = {
+        "m4a": any(f.get('ext') == 'm4a' or (f.get('acodec') or '').startswith('mp4a') for f in audio),
+        "opus": any(f.get('acodec') == 'opus' for f in audio),
+    }
+    for mode in accepted:
+        if available.get(mode):
+            return mode
+    return "mp3"
+
+def parse_limit(value, scale=1):
+    """Convertir un límite recibido en el formulario; vacío o inválido es None"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number <= 0 or math.isinf(number) or math.isnan(number):
+        return None
+    return int(number * scale)
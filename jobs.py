@@ -0,0 +1,489 @@
+import os
+import shutil
+import threading
+import time
+import math
+import uuid
+
+from clips import Clip
+from scheduler import PRIORITY_NORMAL, FairQueue, QueueFull
+from state import MemoryBackend, current_owner
+
+# Intervalo de consulta del progreso de trabajos que ejecuta otro proceso
+REMOTE_POLL_SECONDS = 0.5
+
+class Job:
+    """Trabajo de descarga ejecutado en segundo plano.
+
+    Con state, cada cambio de progreso se guarda en el backend para que los
+    demás procesos lo vean. Los trabajos de otro proceso se cargan con
+    from_state() y se actualizan consultando el backend (remote=True).
+    """
+
+    def __init__(self, job_id, url, format_id, work_dir, client=None, priority=PRIORITY_NORMAL, clip=None, state=None,
+                 speculative=False):
+        self.id = job_id
+        self.url = url
+        self.format_id = format_id
+        self.clip = clip
+        self.work_dir = work_dir
+        self.client = client
+        self.priority = priority
+        # Descarga adelantada que nadie ha pedido todavía
+        self.speculative = speculative
+        self.status = "queued"
+        self.filename = None
+        self.cache_key = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self.cancel_requested = threading.Event()
+        self.owner = current_owner()
+        self.state = state
+        self.remote = False
+        
+        # Progreso propio del trabajo; cada cambio incrementa la versión
+        self.progress = {
+            "phase": "queued",
+            "percent": 0,
+            "downloaded_bytes": 0,
+            "total_bytes": None,
+            "speed": None,
+            "eta": None,
+        }
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("finished", "error", "cancelled")
+
+    def update_progress(self, **fields):
+        """Actualizar el progreso y notificar a los suscriptores"""
+        with self._changed:
+            self.progress.update(fields)
+            self.version += 1
+            # Dentro del bloqueo: el backend nunca recibe una versión anterior después de una nueva
+            if self.state is not None:
+                self.state.save_job(self.to_state())
+            self._changed.notify_all()
+
+    def set_status(self, status, **fields):
+        self.status = status
+        self.update_progress(phase=status, **fields)
+
+    def wait_for_update(self, version, timeout=None):
+        """Esperar a que el progreso cambie respecto a la versión indicada"""
+        if self.remote:
+            return self._poll_for_update(version, timeout)
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version, dict(self.progress)
+
+    def _poll_for_update(self, version, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.refresh()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if self.version != version or (remaining is not None and remaining <= 0):
+                with self._changed:
+                    return self.version, dict(self.progress)
+            time.sleep(REMOTE_POLL_SECONDS if remaining is None else min(REMOTE_POLL_SECONDS, remaining))
+
+    def wait(self, timeout=None):
+        """Esperar a que el trabajo termine, lo ejecute este proceso u otro; True si terminó"""
+        if not self.remote:
+            return self.done.wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.refresh()
+            if self.done.is_set():
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            time.sleep(REMOTE_POLL_SECONDS if remaining is None else min(REMOTE_POLL_SECONDS, remaining))
+
+    def refresh(self):
+        """Recargar del backend el estado de un trabajo que ejecuta otro proceso"""
+        data = self.state.load_job(self.id)
+        if data is not None:
+            self._apply_state(data)
+
+    def _apply_state(self, data):
+        with self._changed:
+            self.status = data["status"]
+            self.filename = data["path"]
+            self.cache_key = data["cache_key"]
+            self.error = data["error"]
+            self.created_at = data["created_at"]
+            self.started_at = data["started_at"]
+            self.finished_at = data["finished_at"]
+            self.progress = data["progress"]
+            self.version = data["version"]
+            self.owner = data["owner"]
+            self.speculative = data.get("speculative", False)
+        if self.finished:
+            self.done.set()
+
+    @classmethod
+    def from_state(cls, data, state):
+        """Trabajo de solo lectura a partir de lo guardado por otro proceso"""
+        clip = Clip(**data["clip"]) if data["clip"] else None
+        job = cls(data["job_id"], data["url"], data["format_id"], data["work_dir"], clip=clip, state=state)
+        job.remote = True
+        job._apply_state(data)
+        return job
+
+    def to_state(self):
+        """Representación completa que se guarda en el backend"""
+        data = self.to_dict()
+        data.update(
+            url=self.url,
+            path=self.filename,
+            cache_key=self.cache_key,
+            work_dir=self.work_dir,
+            owner=self.owner,
+            version=self.version,
+        )
+        return data
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "format_id": self.format_id,
+            "clip": self.clip.to_dict() if self.clip else None,
+            "speculative": self.speculative,
+            "filename": os.path.basename(self.filename) if self.filename else None,
+            "error": self.error,
+            "progress": dict(self.progress),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """Cola de descargas con un número limitado de trabajadores.
+
+    Los trabajos esperan en una FairQueue: turnos por cliente, prioridad para
+    los pequeños y un límite de profundidad por encima del cual submit()
+    lanza QueueFull con una estimación de cuándo reintentar.
+
+    Las transmisiones directas, que no pasan por la cola, ocupan un trabajador
+    con reserve_slot() para que DOWNLOAD_WORKERS limite también su número.
+    Con node_slots (un SharedSemaphore) cada trabajo y transmisión ocupa además
+    un hueco común a todos los procesos del nodo, que así no multiplican el límite.
+
+    Las descargas especulativas solo usan trabajadores que nadie necesita: si
+    un trabajo pedido queda esperando, se cancela la especulativa en curso más
+    reciente y sus .part se reanudan cuando alguien la pida.
+
+    El estado de los trabajos se guarda en state; con un backend compartido,
+    get() encuentra también los trabajos de otros procesos y las descargas
+    duplicadas se agrupan aunque las pidan procesos distintos.
+    """
+
+    def __init__(self, base_dir, max_workers=2, retention=3600, max_queued=100, max_queued_per_client=10,
+                 state=None, max_streams_per_client=2, node_slots=None):
+        self.base_dir = base_dir
+        self.max_workers = max_workers
+        self.node_slots = node_slots
+        self.max_streams_per_client = max_streams_per_client
+        self.retention = retention
+        self.state = state if state is not None else MemoryBackend()
+        self._queue = FairQueue(max_depth=max_queued, max_per_client=max_queued_per_client)
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        # Trabajadores ocupados (trabajos y transmisiones) y trabajos que esperan uno
+        self._slot_freed = threading.Condition(self._lock)
+        self._busy = 0
+        self._waiting = 0
+        self._streams = {}
+        self.coalesced = 0
+        self.preempted = 0
+        # Duración media de los trabajos, para estimar Retry-After
+        self.average_seconds = 30.0
+
+        # Trabajos que quedaron a medias cuando su proceso terminó
+        self.state.fail_orphaned_jobs("La descarga se interrumpió al reiniciarse el servidor")
+
+        for i in range(max_workers):
+            threading.Thread(target=self._worker, name=f"download-{i}", daemon=True).start()
+
+    def submit(self, url, format_id, func, cache_key=None, client=None, priority=PRIORITY_NORMAL, clip=None,
+               speculative=False):
+        """Registrar un trabajo y encolarlo; func(job) realiza la descarga.
+
+        Si ya hay un trabajo en curso con la misma cache_key, en este proceso o
+        en otro que comparta el backend, se devuelve ese trabajo, de modo que las
+        peticiones duplicadas comparten descarga y progreso.
+        Con la cola llena lanza QueueFull.
+        """
+        self.prune()
+
+        job_id = uuid.uuid4().hex
+        # Con la misma clave se reutiliza el directorio y sus archivos .part
+        work_dir = os.path.join(self.base_dir, cache_key or job_id)
+        job = Job(job_id, url, format_id, work_dir, client=client, priority=priority, clip=clip, state=self.state,
+                  speculative=speculative)
+        job.cache_key = cache_key
+        holder = None
+        with self._lock:
+            active = self._active.get(cache_key) if cache_key else None
+            if active is not None:
+                self.coalesced += 1
+                return active
+            # Guardado antes de reclamar la clave: quien lo encuentre como activo puede cargarlo
+            self.state.save_job(job.to_state())
+            if cache_key:
+                holder = self.state.claim_active(cache_key, job.id, job.owner)
+            if holder in (None, job.id):
+                try:
+                    self._queue.put((job, func), client, priority)
+                except QueueFull as e:
+                    self._forget(job)
+                    e.retry_after = self.retry_after()
+                    raise
+                self._jobs[job.id] = job
+                if cache_key:
+                    self._active[cache_key] = job
+
+        if holder not in (None, job.id):
+            # Otro proceso ya descarga este resultado
+            self._forget(job)
+            remote = self.get(holder)
+            if remote is not None:
+                self.coalesced += 1
+                return remote
+            # Reclamación sin trabajo guardado (se borró su registro): reintentar sin ella
+            self.state.release_active(cache_key, holder)
+            return self.submit(url, format_id, func, cache_key, client, priority, clip, speculative)
+
+        os.makedirs(work_dir, exist_ok=True)
+        if not speculative:
+            self._preempt_speculative()
+        return job
+
+    def _preempt_speculative(self):
+        """Cancelar la descarga especulativa en curso más reciente si hay trabajos
+        pedidos esperando sin trabajador libre; devuelve el trabajo cancelado o None"""
+        with self._lock:
+            free = self.max_workers - self._busy
+            waiting = sum(1 for job in self._jobs.values() if job.status == "queued" and not job.speculative)
+            running = [job for job in self._jobs.values() if job.speculative and job.status == "running"]
+        # Las que ya se están cancelando liberarán su trabajador enseguida
+        stopping = sum(1 for job in running if job.cancel_requested.is_set())
+        candidates = [job for job in running if not job.cancel_requested.is_set()]
+        if waiting <= free + stopping or not candidates:
+            return None
+        job = max(candidates, key=lambda job: job.started_at)
+        self.cancel(job)
+        with self._lock:
+            self.preempted += 1
+        return job
+
+    def _forget(self, job):
+        """Descartar un trabajo que no llegó a encolarse"""
+        if job.cache_key:
+            self.state.release_active(job.cache_key, job.id)
+        self.state.delete_job(job.id)
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere sitio en la cola"""
+        waves = len(self._queue) / max(1, self.max_workers) + 1
+        return max(1, min(600, math.ceil(self.average_seconds * waves)))
+
+    def _worker(self):
+        while True:
+            job, func = self._queue.get()
+            self._take_slot()
+            try:
+                # Hueco del nodo: otro proceso puede tener ocupados todos
+                lease = self.node_slots.acquire() if self.node_slots else None
+                try:
+                    self._run(job, func)
+                finally:
+                    if lease:
+                        self.node_slots.release(lease)
+            finally:
+                self._free_slot()
+
+    def _take_slot(self):
+        # Una transmisión pudo ocupar el hueco de este trabajador
+        with self._slot_freed:
+            self._waiting += 1
+            self._slot_freed.wait_for(lambda: self._busy < self.max_workers)
+            self._waiting -= 1
+            self._busy += 1
+
+    def _free_slot(self):
+        with self._slot_freed:
+            self._busy -= 1
+            self._slot_freed.notify_all()
+
+    def reserve_slot(self, client):
+        """Ocupar un trabajador para una tarea que no pasa por la cola (una transmisión).
+
+        Solo si hay uno libre, no espera ningún trabajo y el cliente no tiene ya
+        max_streams_per_client; devuelve la función que lo libera, o None.
+        """
+        with self._slot_freed:
+            if self._busy + self._waiting + len(self._queue) >= self.max_workers:
+                return None
+            if self._streams.get(client, 0) >= self.max_streams_per_client:
+                return None
+            self._busy += 1
+            self._streams[client] = self._streams.get(client, 0) + 1
+
+        released = threading.Event()
+        def release():
+            with self._slot_freed:
+                if released.is_set():
+                    return
+                released.set()
+                self._streams[client] -= 1
+                if not self._streams[client]:
+                    del self._streams[client]
+            if lease:
+                self.node_slots.release(lease)
+            self._free_slot()
+
+        lease = None
+        if self.node_slots:
+            lease = self.node_slots.acquire(blocking=False)
+            if lease is None:
+                release()
+                return None
+        return release
+
+    def add_finished(self, url, format_id, filename, cache_key=None, clip=None):
+        """Registrar un trabajo ya resuelto (por ejemplo, desde la caché)"""
+        self.prune()
+
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, url, format_id, os.path.join(self.base_dir, job_id), clip=clip, state=self.state)
+        job.filename = filename
+        job.cache_key = cache_key
+        job.started_at = job.finished_at = time.time()
+        job.set_status("finished", percent=100, cached=True)
+        job.done.set()
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def cancel(self, job):
+        """Cancelar un trabajo de este proceso: se retira de la cola o, si ya se
+        ejecuta, cancel_requested pide a la descarga que pare"""
+        job.cancel_requested.set()
+        if self._queue.remove(lambda item: item[0] is job):
+            self._finish_cancelled(job)
+
+    def _finish_cancelled(self, job):
+        self._deactivate(job)
+        job.error = "Descarga cancelada"
+        job.finished_at = time.time()
+        job.set_status("cancelled")
+        job.done.set()
+
+    def promote(self, job, priority):
+        """Subir la prioridad de un trabajo que aún espera en la cola"""
+        job.priority = priority
+        if self._queue.promote(lambda item: item[0] is job, priority) and not job.speculative:
+            self._preempt_speculative()
+
+    def active(self, cache_key):
+        """Trabajo de este proceso que está descargando cache_key, o None"""
+        with self._lock:
+            return self._active.get(cache_key)
+
+    def idle_workers(self):
+        """Trabajadores libres que no tienen ya un trabajo esperando"""
+        with self._lock:
+            idle = self.max_workers - self._busy - self._waiting - len(self._queue)
+        if self.node_slots and idle > 0:
+            idle = min(idle, self.node_slots.available())
+        return idle
+
+    def _run(self, job, func):
+        if job.cancel_requested.is_set():
+            # Cancelado mientras salía de la cola
+            self._finish_cancelled(job)
+            return
+        job.started_at = time.time()
+        job.set_status("running")
+        try:
+            job.filename = func(job)
+            self._deactivate(job)
+            job.finished_at = time.time()
+            job.set_status("finished", percent=100)
+        except Exception as e:
+            job.error = str(e)
+            self._deactivate(job)
+            job.finished_at = time.time()
+            job.set_status("cancelled" if job.cancel_requested.is_set() else "error")
+        finally:
+            job.done.set()
+            elapsed = time.time() - job.started_at
+            with self._lock:
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * elapsed
+
+    def _deactivate(self, job):
+        """Dejar de agrupar nuevas peticiones en un trabajo que termina"""
+        with self._lock:
+            if job.cache_key and self._active.get(job.cache_key) is job:
+                del self._active[job.cache_key]
+        if job.cache_key:
+            self.state.release_active(job.cache_key, job.id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        data = self.state.load_job(job_id)
+        return Job.from_state(data, self.state) if data is not None else None
+
+    def latest(self):
+        """Obtener el trabajo creado más recientemente"""
+        data = self.state.latest_job()
+        if data is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(data["job_id"])
+        return job if job is not None else Job.from_state(data, self.state)
+
+    def prune(self):
+        """Eliminar trabajos terminados hace más tiempo que la retención"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished and job.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+            in_use = {job.work_dir for job in self._active.values()}
+
+        self.state.prune_jobs(cutoff)
+        for job in expired:
+            if job.work_dir not in in_use:
+                shutil.rmtree(job.work_dir, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {"queued": 0, "running": 0, "finished": 0, "error": 0, "cancelled": 0}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        counts["max_workers"] = self.max_workers
+        with self._lock:
+            counts["streams"] = sum(self._streams.values())
+        if self.node_slots:
+            counts["node_slots"] = self.node_slots.stats()
+        counts["coalesced"] = self.coalesced
+        counts["preempted"] = self.preempted
+        counts["queue"] = self._queue.stats()
+        counts["average_seconds"] = round(self.average_seconds, 2)
+        return counts
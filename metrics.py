@@ -0,0 +1,153 @@
+import math
+import os
+import threading
+import time
+
+# Límites de los histogramas de latencia, en segundos
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for name, value in pairs)
+    return "{" + body + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    label_text = _format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))])
+                    lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+                label_text = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class Gauge:
+    """Valor calculado en el momento de la consulta mediante una función.
+
+    Con max_age el valor se reutiliza durante ese número de segundos, para
+    funciones costosas como recorrer un directorio.
+    """
+
+    def __init__(self, name, help_text, func, labelnames=(), max_age=0):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.labelnames = labelnames
+        self.max_age = max_age
+        self._cached = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def value(self):
+        if not self.max_age:
+            return self.func()
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires:
+                self._cached = self.func()
+                self._expires = now + self.max_age
+            return self._cached
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.value()
+        # Una función puede devolver un número o {etiquetas: valor}
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, item in items:
+            if not isinstance(labels, tuple):
+                labels = (labels,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(item)}")
+        return lines
+
+class Registry:
+    """Métricas en formato de texto de Prometheus, sin dependencias externas"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, func, labelnames=(), max_age=0):
+        metric = Gauge(name, help_text, func, labelnames, max_age)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def directory_size(path):
+    """Bytes ocupados por los archivos de un directorio y sus subdirectorios"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
@@ -0,0 +1,190 @@
+import threading
+import time
+
+from scheduler import PRIORITY_NORMAL, PRIORITY_SPECULATIVE, QueueFull
+
+# Cliente de la cola justa para todos los trabajos especulativos
+PREFETCH_CLIENT = "prefetch"
+
+# Clave en el estado compartido con la que otro proceso avisa de una adopción
+ADOPTED_KEY = "prefetch-adopted:"
+
+class _Prefetch:
+    def __init__(self, job, client, size, expires_at):
+        self.job = job
+        self.client = client
+        self.size = size
+        self.expires_at = expires_at
+
+class Prefetcher:
+    """Descargas especulativas del formato que el usuario probablemente elegirá.
+
+    start() encola el trabajo con PRIORITY_SPECULATIVE si hay un trabajador
+    libre y cabe en el presupuesto de bytes especulativos en curso. Cuando
+    llega la petición real, adopt() lo convierte en un trabajo normal (desde
+    cualquier proceso: el aviso pasa por el estado compartido). Si nadie lo
+    adopta en ttl segundos, o el mismo cliente abre otra página o elige otro
+    formato, se cancela; sus archivos .part quedan en el directorio del
+    trabajo y una descarga posterior los reanuda. JobManager también cancela
+    la especulación en curso cuando una descarga pedida necesita su trabajador.
+    """
+
+    def __init__(self, jobs, state, budget_bytes, ttl=120, poll=1.0):
+        self.jobs = jobs
+        self.state = state
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.poll = poll
+        self._entries = {}
+        self._completed = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counts = {
+            "started": 0,
+            "adopted": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "preempted": 0,
+            "skipped_budget": 0,
+            "skipped_busy": 0,
+            "skipped_unknown_size": 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.budget_bytes > 0
+
+    def in_flight_bytes(self):
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def start(self, client, url, format_id, cache_key, size, func):
+        """Adelantar la descarga; devuelve el trabajo especulativo o None si no se inicia"""
+        # Una página nueva deja sin sentido la especulación anterior del cliente
+        self.abandon(client, keep=cache_key)
+        if not self.enabled or cache_key is None:
+            return None
+        if size is None:
+            self._count("skipped_unknown_size")
+            return None
+
+        with self._lock:
+            if cache_key in self._entries:
+                return self._entries[cache_key].job
+            if sum(entry.size for entry in self._entries.values()) + size > self.budget_bytes:
+                self.counts["skipped_budget"] += 1
+                return None
+        # Solo con trabajadores ociosos; si luego hace falta el suyo, JobManager la cancela
+        if self.jobs.idle_workers() <= 0:
+            self._count("skipped_busy")
+            return None
+        try:
+            job = self.jobs.submit(url, format_id, func, cache_key=cache_key, client=PREFETCH_CLIENT,
+                                   priority=PRIORITY_SPECULATIVE, speculative=True)
+        except QueueFull:
+            self._count("skipped_busy")
+            return None
+        if not job.speculative or job.remote or job.finished:
+            # Ya había una descarga real de ese resultado
+            return None
+
+        with self._lock:
+            self._entries[cache_key] = _Prefetch(job, client, size, time.monotonic() + self.ttl)
+            self.counts["started"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._reap, name="prefetch", daemon=True)
+                self._thread.start()
+        return job
+
+    def adopt(self, job, priority=PRIORITY_NORMAL):
+        """La petición real llegó: el trabajo deja de ser especulativo; True si lo era"""
+        if not job.speculative:
+            return False
+        with self._lock:
+            entry = self._entries.pop(job.cache_key, None)
+            if entry is None and job.cancel_requested.is_set():
+                # Se acaba de cancelar aquí: quien llama espera a que pare y la pide de nuevo
+                return False
+            self.counts["adopted"] += 1
+        if entry is not None:
+            self._promote(entry.job, priority)
+        else:
+            # Lo ejecuta otro proceso: su Prefetcher lo promueve al ver el aviso
+            self.state.set_metadata(ADOPTED_KEY + job.id, priority, time.time() + self.ttl)
+        return True
+
+    def adopt_result(self, cache_key):
+        """Una petición encontró en la caché el resultado de una especulación terminada"""
+        with self._lock:
+            if self._completed.pop(cache_key, None) is not None:
+                self.counts["adopted"] += 1
+
+    def abandon(self, client, keep=None):
+        """Cancelar las especulaciones del cliente salvo la de keep"""
+        with self._lock:
+            abandoned = [entry for key, entry in self._entries.items() if entry.client == client and key != keep]
+            for entry in abandoned:
+                del self._entries[entry.job.cache_key]
+                self.counts["cancelled"] += 1
+                # Marcada antes de soltar el candado para que adopt() no la dé por ajena
+                entry.job.cancel_requested.set()
+        for entry in abandoned:
+            self.jobs.cancel(entry.job)
+
+    def _promote(self, job, priority):
+        job.speculative = False
+        self.jobs.promote(job, priority)
+        # Guardar el cambio para los demás procesos
+        job.update_progress()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _reap(self):
+        """Promover lo adoptado desde otros procesos, cancelar lo abandonado y
+        recordar lo terminado por si se pide después"""
+        while True:
+            time.sleep(self.poll)
+            now = time.monotonic()
+            with self._lock:
+                entries = list(self._entries.values())
+                self._completed = {key: expires_at for key, expires_at in self._completed.items() if expires_at > now}
+
+            for entry in entries:
+                job = entry.job
+                adopted = None if job.finished else self.state.get_metadata(ADOPTED_KEY + job.id)
+                with self._lock:
+                    if self._entries.get(job.cache_key) is not entry:
+                        continue
+                    if job.finished:
+                        del self._entries[job.cache_key]
+                        if job.status == "finished":
+                            self.counts["completed"] += 1
+                            self._completed[job.cache_key] = now + self.ttl
+                        elif job.status == "cancelled":
+                            # Cedió su trabajador a una descarga pedida
+                            self.counts["preempted"] += 1
+                        continue
+                    if adopted is None and entry.expires_at > now:
+                        continue
+                    del self._entries[job.cache_key]
+                    if adopted is None:
+                        self.counts["cancelled"] += 1
+                        job.cancel_requested.set()
+                if adopted is not None:
+                    self.state.pop_metadata(ADOPTED_KEY + job.id)
+                    self._promote(job, adopted[0])
+                else:
+                    self.jobs.cancel(job)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats.update(
+                active=len(self._entries),
+                in_flight_bytes=sum(entry.size for entry in self._entries.values()),
+                budget_bytes=self.budget_bytes,
+                ttl=self.ttl,
+            )
+            return stats
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from state import MemoryBackend
+
+# Opciones de yt-dlp que determinan el contenido del archivo resultante
+RESULT_KEY_OPTIONS = ("format", "postprocessors", "merge_output_format")
+
+# Publicaciones a medias más antiguas que esto se consideran abandonadas
+STALE_TMP_SECONDS = 3600
+
+def result_key(video_id, ydl_opts, **extra):
+    """Calcular la clave de contenido a partir del video y las opciones de salida"""
+    variant = {name: ydl_opts.get(name) for name in RESULT_KEY_OPTIONS}
+    # Ajustes aplicados fuera de yt-dlp (por ejemplo, la conversión a MP3)
+    variant.update({name: value for name, value in extra.items() if value is not None})
+    raw = video_id + ":" + json.dumps(variant, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """Caché en disco de archivos terminados con cuota en bytes y expulsión LRU.
+
+    El índice (ruta, tamaño y último acceso de cada entrada) vive en el
+    backend de estado, así que todos los procesos que comparten el backend y
+    el directorio ven las mismas entradas. Las lecturas en curso se cuentan
+    en el proceso: en POSIX un archivo abierto sigue legible aunque otro
+    proceso lo expulse.
+    """
+
+    def __init__(self, root, quota_bytes, state=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.state = state if state is not None else MemoryBackend()
+        self._readers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    @property
+    def total_bytes(self):
+        return self.state.cache_totals()[1]
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _load(self):
+        """Reconciliar el índice con los archivos publicados en disco"""
+        found = {}
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            if not os.path.isdir(entry_dir):
+                continue
+            # Restos de publicaciones interrumpidas; las recientes pueden ser de otro proceso
+            if ".tmp-" in name:
+                if time.time() - os.path.getmtime(entry_dir) > STALE_TMP_SECONDS:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            files = os.listdir(entry_dir)
+            if len(files) != 1:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            found[name] = os.path.join(entry_dir, files[0])
+
+        # Entradas del índice cuyo archivo ya no existe
+        for key, path, _ in self.state.cache_lru():
+            if found.get(key) != path:
+                self.state.cache_delete(key)
+
+        # Archivos sin entrada: el índice se perdió o se usaba otro backend.
+        # El atime conserva el orden LRU anterior
+        missing = []
+        for key, path in found.items():
+            if self.state.cache_get(key) is None:
+                stat = os.stat(path)
+                missing.append((stat.st_atime, key, path, stat.st_size))
+        for atime, key, path, size in sorted(missing):
+            self.state.cache_put(key, path, size, atime=atime)
+
+        with self._lock:
+            self._evict()
+
+    def _entry(self, key):
+        """Entrada del índice cuyo archivo sigue en disco"""
+        entry = self.state.cache_get(key)
+        if entry is not None and not os.path.exists(entry[0]):
+            # Otro proceso la expulsó o se borró a mano
+            self.state.cache_delete(key)
+            return None
+        return entry
+
+    def lookup(self, key):
+        """Obtener la ruta de un resultado en caché, o None si no existe"""
+        entry = self._entry(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.state.cache_touch(key)
+        path = entry[0]
+
+        # Conservar el orden LRU también en atime por si se pierde el índice;
+        # mtime no cambia para que ETag y Last-Modified sigan siendo válidos
+        try:
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        return path
+
+    def acquire(self, key):
+        """Reservar una entrada mientras se envía; no se expulsa hasta release()"""
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                return None
+            self._readers[key] = self._readers.get(key, 0) + 1
+        self.state.cache_touch(key)
+        return entry[0]
+
+    def release(self, key):
+        with self._lock:
+            readers = self._readers.get(key, 0) - 1
+            if readers > 0:
+                self._readers[key] = readers
+            else:
+                self._readers.pop(key, None)
+            self._evict()
+
+    def publish(self, key, src_path):
+        """Mover un archivo terminado a la caché de forma atómica"""
+        final_dir = self._entry_dir(key)
+        tmp_dir = f"{final_dir}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(tmp_dir)
+        tmp_path = os.path.join(tmp_dir, os.path.basename(src_path))
+        shutil.move(src_path, tmp_path)
+        size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            existing = self._entry(key)
+            if existing is not None:
+                # Otro trabajo publicó el mismo resultado primero
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                self.state.cache_touch(key)
+                return existing[0]
+
+            # El renombrado del directorio publica el archivo completo de una vez
+            try:
+                os.rename(tmp_dir, final_dir)
+            except OSError:
+                # Otro proceso lo publicó entre la consulta y el renombrado
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                files = os.listdir(final_dir)
+                path = os.path.join(final_dir, files[0])
+                self.state.cache_put(key, path, os.path.getsize(path))
+                return path
+            path = os.path.join(final_dir, os.path.basename(src_path))
+            self.state.cache_put(key, path, size)
+            self._evict(exclude=key)
+            return path
+
+    def _evict(self, exclude=None):
+        """Expulsar entradas LRU hasta respetar la cuota, sin tocar las que se están leyendo"""
+        total_bytes = self.total_bytes
+        if total_bytes <= self.quota_bytes:
+            return
+        for key, _, size in self.state.cache_lru():
+            if total_bytes <= self.quota_bytes:
+                break
+            if self._readers.get(key) or key == exclude:
+                continue
+            self.state.cache_delete(key)
+            total_bytes -= size
+            self.evictions += 1
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self):
+        entries, total_bytes = self.state.cache_totals()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": total_bytes,
+                "quota_bytes": self.quota_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
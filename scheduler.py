@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Prioridades: los trabajos pequeños o de audio pasan delante de los de video grandes;
+# los especulativos solo se atienden cuando no espera nada más
+PRIORITY_SMALL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_SPECULATIVE = 2
+
+class QueueFull(Exception):
+    """La cola de descargas está llena; retry_after indica cuándo volver a intentarlo"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class FairQueue:
+    """Cola con reparto equitativo entre clientes y prioridad para trabajos pequeños.
+
+    Cada cliente tiene su propia cola y se sirven por turnos, de modo que
+    quien encola muchas descargas no retrasa a los demás. Dentro de cada
+    turno se prefieren los trabajos pequeños; un trabajo normal que lleva
+    esperando más de aging segundos cuenta como pequeño para no quedarse
+    atrás indefinidamente. Los especulativos no envejecen: se cancelan.
+    """
+
+    def __init__(self, max_depth=100, max_per_client=10, aging=120):
+        self.max_depth = max_depth
+        self.max_per_client = max_per_client
+        self.aging = aging
+        # cliente -> deque de (prioridad, encolado, elemento); el orden es el turno
+        self._clients = OrderedDict()
+        self._depth = 0
+        self._cond = threading.Condition()
+        self.rejected = 0
+
+    def put(self, item, client, priority=PRIORITY_NORMAL):
+        """Encolar o lanzar QueueFull (con retry_after a rellenar por quien llama)"""
+        with self._cond:
+            queue = self._clients.get(client)
+            if self._depth >= self.max_depth:
+                self.rejected += 1
+                raise QueueFull("La cola de descargas está llena", None)
+            if queue is not None and len(queue) >= self.max_per_client:
+                self.rejected += 1
+                raise QueueFull("Demasiadas descargas en cola para este cliente", None)
+            if queue is None:
+                queue = self._clients[client] = deque()
+            queue.append((priority, time.monotonic(), item))
+            self._depth += 1
+            self._cond.notify()
+
+    def get(self):
+        """Esperar y devolver el siguiente elemento según turno y prioridad"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._depth > 0)
+            client, index = self._select()
+            queue = self._clients[client]
+            _, _, item = queue[index]
+            del queue[index]
+            self._depth -= 1
+            # El cliente servido pasa al final del turno
+            del self._clients[client]
+            if queue:
+                self._clients[client] = queue
+            return item
+
+    def _select(self):
+        now = time.monotonic()
+        best = None
+        for client, queue in self._clients.items():
+            for index, (priority, queued_at, _) in enumerate(queue):
+                if priority != PRIORITY_SPECULATIVE and now - queued_at > self.aging:
+                    priority = PRIORITY_SMALL
+                if best is None or priority < best[0]:
+                    best = (priority, client, index)
+                if priority == PRIORITY_SMALL:
+                    break
+            if best[0] == PRIORITY_SMALL:
+                # El primer cliente en el turno con un trabajo pequeño
+                break
+        return best[1], best[2]
+
+    def remove(self, match):
+        """Retirar el primer elemento para el que match(elemento) es cierto; True si estaba"""
+        with self._cond:
+            for client, queue in self._clients.items():
+                for index, (_, _, item) in enumerate(queue):
+                    if match(item):
+                        del queue[index]
+                        self._depth -= 1
+                        if not queue:
+                            del self._clients[client]
+                        return True
+        return False
+
+    def promote(self, match, priority):
+        """Cambiar la prioridad de un elemento que sigue en la cola; True si estaba"""
+        with self._cond:
+            for queue in self._clients.values():
+                for index, (_, queued_at, item) in enumerate(queue):
+                    if match(item):
+                        queue[index] = (priority, queued_at, item)
+                        return True
+        return False
+
+    def __len__(self):
+        with self._cond:
+            return self._depth
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": self._depth,
+                "max_depth": self.max_depth,
+                "max_per_client": self.max_per_client,
+                "clients": len(self._clients),
+                "rejected": self.rejected,
+            }
+
+class BandwidthAllocator:
+    """Cubo de fichas compartido: el caudal total se reparte a partes iguales.
+
+    Cada trabajo activo obtiene una cuota con register() y llama a consume()
+    con los bytes que recibe; si va por delante de su parte de rate bytes/s,
+    consume() espera. Con rate 0 no hay límite.
+    """
+
+    def __init__(self, rate=0, burst_seconds=1.0):
+        self.rate = rate
+        self.burst_seconds = burst_seconds
+        self._lock = threading.Lock()
+        self._shares = set()
+        self.throttled_seconds = 0.0
+
+    def register(self):
+        share = BandwidthShare(self)
+        with self._lock:
+            self._shares.add(share)
+        return share
+
+    def unregister(self, share):
+        with self._lock:
+            self._shares.discard(share)
+
+    def share_rate(self):
+        with self._lock:
+            return self.rate / max(1, len(self._shares))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "active": len(self._shares),
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
+
+class BandwidthShare:
+    """Cuota de un trabajo dentro de un BandwidthAllocator"""
+
+    def __init__(self, allocator):
+        self.allocator = allocator
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+    def consume(self, amount):
+        if not self.allocator.rate:
+            return
+        with self._lock:
+            # La cuota se recalcula en cada llamada: al entrar o salir trabajos cambia
+            rate = self.allocator.share_rate()
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._updated) * rate, rate * self.allocator.burst_seconds)
+            self._updated = now
+            self._tokens -= amount
+            delay = -self._tokens / rate if self._tokens < 0 else 0
+        if delay:
+            with self.allocator._lock:
+                self.allocator.throttled_seconds += delay
+            time.sleep(delay)
+
+    def close(self):
+        self.allocator.unregister(self)
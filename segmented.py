@@ -0,0 +1,258 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import yt_dlp
+from yt_dlp.downloader import get_suitable_downloader
+from yt_dlp.downloader.common import FileDownloader
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.utils import ContentTooShortError
+
+# Tamaño por defecto de cada segmento pedido con Range
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+
+# Cada cuánto se informa el progreso agregado de todos los segmentos
+PROGRESS_INTERVAL = 0.25
+
+READ_SIZE = 64 * 1024
+
+FRAGMENT_PROTOCOLS = ("http_dash_segments", "http_dash_segments_generator", "m3u8_native")
+
+class SegmentedHttpFD(FileDownloader):
+    """Descarga HTTP en segmentos Range paralelos escritos en su posición.
+
+    El archivo .part se reserva con su tamaño final y cada conexión escribe
+    su segmento con pwrite() en el desplazamiento que le corresponde, sin
+    concatenar nada al final. Los segmentos terminados se anotan en el .ytdl
+    para reanudar tras un fallo. Si el origen no admite Range o el archivo
+    es pequeño, se descarga con HttpFD como siempre.
+    """
+
+    FD_NAME = "segmented"
+
+    @classmethod
+    def can_download(cls, info_dict, params):
+        return (
+            params.get("segmented_connections", 1) > 1
+            and info_dict.get("protocol") in ("http", "https")
+            and not info_dict.get("is_live")
+            and not info_dict.get("section_start")
+            and not info_dict.get("section_end")
+            and not params.get("external_downloader")
+        )
+
+    def real_download(self, filename, info_dict):
+        segment_size = self.params.get("segment_size") or DEFAULT_SEGMENT_SIZE
+        total = self._probe_size(info_dict)
+        if not total or total < 2 * segment_size:
+            return self._fallback(filename, info_dict)
+
+        tmpfilename = self.temp_name(filename)
+        state_file = self.ytdl_filename(filename)
+        segments = [(start, min(start + segment_size, total) - 1) for start in range(0, total, segment_size)]
+        done = self._load_state(state_file, total, segment_size, tmpfilename)
+
+        fd = os.open(tmpfilename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Reservar el tamaño final; los huecos se rellenan por segmentos
+            os.ftruncate(fd, total)
+            self._download_segments(fd, info_dict, filename, tmpfilename, state_file, segments, done, total)
+        finally:
+            os.close(fd)
+
+        self.try_rename(tmpfilename, filename)
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        return True
+
+    def _fallback(self, filename, info_dict):
+        fd = HttpFD(self.ydl, self.params)
+        # HttpFD ya añade su propio report_progress
+        for ph in self._progress_hooks:
+            if ph != self.report_progress:
+                fd.add_progress_hook(ph)
+        if self.params.get("bandwidth") is not None:
+            fd.add_progress_hook(_throttle_hook(self.params["bandwidth"]))
+        # Una sola conexión, también dentro del límite global
+        with self.params["connection_limiter"].connection():
+            return fd.real_download(filename, info_dict)
+
+    def _request(self, info_dict, start, end):
+        headers = dict(info_dict.get("http_headers") or {})
+        headers["Range"] = f"bytes={start}-{end}"
+        return self.ydl.urlopen(Request(info_dict["url"], headers=headers))
+
+    def _probe_size(self, info_dict):
+        """Tamaño total según el origen; None si no admite Range"""
+        with self.params["connection_limiter"].connection():
+            with self._request(info_dict, 0, 0) as response:
+                match = re.search(r"/(\d+)$", response.headers.get("Content-Range", ""))
+                if response.status != 206 or not match:
+                    return None
+                return int(match.group(1))
+
+    def _load_state(self, state_file, total, segment_size, tmpfilename):
+        """Segmentos ya completos de un intento anterior con el mismo tamaño"""
+        if not self.params.get("continuedl", True) or not os.path.exists(tmpfilename):
+            return set()
+        try:
+            with open(state_file) as f:
+                state = json.load(f)["segmented"]
+        except (OSError, ValueError, KeyError):
+            return set()
+        if state.get("total") != total or state.get("segment_size") != segment_size:
+            return set()
+        return set(state.get("done", []))
+
+    def _save_state(self, state_file, total, segment_size, done):
+        tmp = state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segmented": {"total": total, "segment_size": segment_size, "done": sorted(done)}}, f)
+        os.replace(tmp, state_file)
+
+    def _download_segments(self, fd, info_dict, filename, tmpfilename, state_file, segments, done, total):
+        segment_size = segments[0][1] - segments[0][0] + 1
+        limiter = self.params["connection_limiter"]
+        bandwidth = self.params.get("bandwidth")
+        retries = self.params.get("fragment_retries", 10)
+        sleep_function = (self.params.get("retry_sleep_functions") or {}).get("fragment")
+        lock = threading.Lock()
+        stop = threading.Event()
+        resumed = sum(end - start + 1 for index, (start, end) in enumerate(segments) if index in done)
+        counters = {"downloaded": resumed}
+
+        def fetch(index):
+            start, end = segments[index]
+            for attempt in range(retries + 1):
+                position = start
+                try:
+                    with limiter.connection(), self._request(info_dict, start, end) as response:
+                        if response.status != 206:
+                            raise ContentTooShortError(0, end - start + 1)
+                        while position <= end and not stop.is_set():
+                            chunk = response.read(min(READ_SIZE, end - position + 1))
+                            if not chunk:
+                                break
+                            os.pwrite(fd, chunk, position)
+                            position += len(chunk)
+                            with lock:
+                                counters["downloaded"] += len(chunk)
+                            if bandwidth is not None:
+                                bandwidth.consume(len(chunk))
+                    if stop.is_set():
+                        return
+                    if position <= end:
+                        raise ContentTooShortError(position - start, end - start + 1)
+                    with lock:
+                        done.add(index)
+                        self._save_state(state_file, total, segment_size, done)
+                    return
+                except Exception:
+                    # Descontar lo leído: el segmento se pide entero de nuevo
+                    with lock:
+                        counters["downloaded"] -= position - start
+                    if attempt >= retries or stop.is_set():
+                        raise
+                    if sleep_function:
+                        time.sleep(sleep_function(attempt))
+
+        pending = [index for index in range(len(segments)) if index not in done]
+        started = time.time()
+        connections = self.params.get("segmented_connections", 1)
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="segment") as executor:
+            futures = [executor.submit(fetch, index) for index in pending]
+            not_done = futures
+            try:
+                while not_done:
+                    finished, not_done = wait(not_done, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                    failed = [future for future in finished if future.exception()]
+                    if failed:
+                        raise failed[0].exception()
+                    with lock:
+                        downloaded = counters["downloaded"]
+                    speed = self.calc_speed(started, time.time(), downloaded - resumed)
+                    self._hook_progress({
+                        "status": "downloading",
+                        "downloaded_bytes": downloaded,
+                        "total_bytes": total,
+                        "filename": filename,
+                        "tmpfilename": tmpfilename,
+                        "speed": speed,
+                        "eta": self.calc_eta(speed, total - downloaded),
+                        "elapsed": time.time() - started,
+                    }, info_dict)
+            except BaseException:
+                # Un segmento falló o un hook de progreso canceló la descarga
+                stop.set()
+                for future in not_done:
+                    future.cancel()
+                raise
+
+        if len(done) != len(segments):
+            raise ContentTooShortError(counters["downloaded"], total)
+
+        self._hook_progress({
+            "status": "finished",
+            "downloaded_bytes": total,
+            "total_bytes": total,
+            "filename": filename,
+            "elapsed": time.time() - started,
+        }, info_dict)
+
+class SegmentedYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL que descarga los formatos HTTP por segmentos paralelos.
+
+    Los formatos por fragmentos (DASH, HLS) siguen en el descargador nativo de
+    yt-dlp con concurrent_fragment_downloads; sus conexiones también se
+    reservan en el límite global mientras dura la descarga. Si las opciones
+    incluyen bandwidth, todas las descargas consumen de esa cuota.
+    """
+
+    def dl(self, name, info, subtitle=False, test=False):
+        limiter = self.params.get("connection_limiter")
+        connections = self.params.get("segmented_connections", 1)
+        if subtitle or test or limiter is None or name == "-":
+            return super().dl(name, info, subtitle, test)
+
+        info["protocol"] = info.get("protocol") or yt_dlp.utils.determine_protocol(info)
+        if SegmentedHttpFD.can_download(info, self.params):
+            return self._download_with(SegmentedHttpFD, self.params, name, info)
+        if info["protocol"] in FRAGMENT_PROTOCOLS:
+            with limiter.reserve(connections) as granted:
+                params = dict(self.params, concurrent_fragment_downloads=granted)
+                return self._download_with(get_suitable_downloader(info, params), params, name, info)
+        with limiter.connection():
+            return self._download_with(get_suitable_downloader(info, self.params), self.params, name, info)
+
+    def _download_with(self, fd_class, params, name, info):
+        fd = fd_class(self, params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        bandwidth = params.get("bandwidth")
+        if bandwidth is not None and fd_class is not SegmentedHttpFD:
+            fd.add_progress_hook(_throttle_hook(bandwidth))
+        new_info = self._copy_infodict(info)
+        if new_info.get("http_headers") is None:
+            new_info["http_headers"] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle=False)
+
+def _throttle_hook(bandwidth):
+    """Hook que descuenta de la cuota los bytes nuevos de cada aviso de progreso"""
+    lock = threading.Lock()
+    last = {"downloaded": 0}
+
+    def hook(d):
+        if d["status"] != "downloading":
+            return
+        downloaded = d.get("downloaded_bytes") or 0
+        with lock:
+            amount = max(0, downloaded - last["downloaded"])
+            last["downloaded"] = downloaded
+        if amount:
+            bandwidth.consume(amount)
+
+    return hook
@@ -0,0 +1,512 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+def process_token(pid):
+    """Arranque del sistema e instante de inicio del proceso, o None si no se conocen.
+
+    Distingue un proceso de otro que reciba después el mismo PID, algo habitual
+    en contenedores o al reiniciar con el estado guardado en disco.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # El nombre del programa va entre paréntesis y puede contener espacios;
+            # starttime es el campo 22
+            start_time = f.read().rpartition(")")[2].split()[19]
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+    except (OSError, IndexError):
+        return None
+    return f"{boot_id}-{start_time}"
+
+_owners = {}
+
+def current_owner():
+    """Dueño de los trabajos en curso de este proceso; tras un fork cambia el PID"""
+    pid = os.getpid()
+    owner = _owners.get(pid)
+    if owner is None:
+        token = process_token(pid)
+        owner = _owners[pid] = f"{socket.gethostname()}:{pid}" + (f":{token}" if token else "")
+    return owner
+
+def owner_alive(owner):
+    """Comprobar si el proceso dueño sigue vivo; los de otro nodo se dan por vivos"""
+    host, pid, *token = owner.split(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    # Mismo PID pero otro proceso: el dueño terminó y el PID se reutilizó
+    current = process_token(pid)
+    return not token or current is None or current == token[0]
+
+class StateBackend:
+    """Estado compartido entre procesos: trabajos, metadatos e índice de la caché.
+
+    Las implementaciones guardan valores serializables en JSON y deben ser
+    seguras entre hilos. Un backend en red (Redis, Postgres) implementa los
+    mismos métodos; el resto de la aplicación no depende del almacenamiento.
+    """
+
+    shared = False
+
+    # Trabajos: data es Job.to_state()
+    def save_job(self, data):
+        raise NotImplementedError
+
+    def load_job(self, job_id):
+        raise NotImplementedError
+
+    def latest_job(self):
+        raise NotImplementedError
+
+    def delete_job(self, job_id):
+        raise NotImplementedError
+
+    def prune_jobs(self, cutoff):
+        """Eliminar trabajos terminados antes de cutoff"""
+        raise NotImplementedError
+
+    def fail_orphaned_jobs(self, message):
+        """Marcar como fallidos los trabajos en curso cuyo proceso ya no existe"""
+        raise NotImplementedError
+
+    def claim_active(self, cache_key, job_id, owner):
+        """Registrar job_id como descarga en curso de cache_key; devuelve el que la tiene"""
+        raise NotImplementedError
+
+    def release_active(self, cache_key, job_id):
+        raise NotImplementedError
+
+    # Metadatos con caducidad (segundos de reloj, comparables entre procesos)
+    def get_metadata(self, key):
+        """(valor, expires_at) si la entrada no ha caducado, o None"""
+        raise NotImplementedError
+
+    def set_metadata(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def pop_metadata(self, key):
+        raise NotImplementedError
+
+    # Índice de la caché de resultados, ordenado por último acceso
+    def cache_get(self, key):
+        """(ruta, tamaño) de la entrada, o None"""
+        raise NotImplementedError
+
+    def cache_put(self, key, path, size, atime=None):
+        raise NotImplementedError
+
+    def cache_touch(self, key):
+        raise NotImplementedError
+
+    def cache_delete(self, key):
+        raise NotImplementedError
+
+    def cache_lru(self):
+        """Entradas (clave, ruta, tamaño) de la menos a la más usada"""
+        raise NotImplementedError
+
+    def cache_totals(self):
+        """(número de entradas, bytes)"""
+        raise NotImplementedError
+
+    # Huecos de un límite común a los procesos (descargas, conversiones)
+    def acquire_slot(self, name, limit, holder, owner):
+        """Ocupar un hueco de name para holder si hay menos de limit; True si se concedió.
+
+        Los huecos de procesos que ya no existen se liberan antes de contar.
+        """
+        raise NotImplementedError
+
+    def release_slot(self, name, holder):
+        raise NotImplementedError
+
+    def slots_in_use(self, name):
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": type(self).__name__, "shared": self.shared}
+
+class MemoryBackend(StateBackend):
+    """Estado en memoria del proceso, como antes de existir los backends"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._metadata = {}
+        self._cache = OrderedDict()
+        self._slots = {}
+
+    def save_job(self, data):
+        with self._lock:
+            self._jobs[data["job_id"]] = data
+
+    def load_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest_job(self):
+        with self._lock:
+            return next(reversed(self._jobs.values()), None)
+
+    def delete_job(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def prune_jobs(self, cutoff):
+        with self._lock:
+            expired = [job_id for job_id, data in self._jobs.items()
+                       if data["finished_at"] and data["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def fail_orphaned_jobs(self, message):
+        return 0
+
+    def claim_active(self, cache_key, job_id, owner):
+        with self._lock:
+            return self._active.setdefault(cache_key, job_id)
+
+    def release_active(self, cache_key, job_id):
+        with self._lock:
+            if self._active.get(cache_key) == job_id:
+                del self._active[cache_key]
+
+    def get_metadata(self, key):
+        with self._lock:
+            entry = self._metadata.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1], entry[0]
+
+    def set_metadata(self, key, value, expires_at):
+        with self._lock:
+            self._metadata[key] = (expires_at, value)
+
+    def pop_metadata(self, key):
+        with self._lock:
+            self._metadata.pop(key, None)
+
+    def cache_get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def cache_put(self, key, path, size, atime=None):
+        with self._lock:
+            self._cache[key] = (path, size)
+            if atime is None:
+                self._cache.move_to_end(key)
+
+    def cache_touch(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+
+    def cache_delete(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def cache_lru(self):
+        with self._lock:
+            return [(key, path, size) for key, (path, size) in self._cache.items()]
+
+    def cache_totals(self):
+        with self._lock:
+            return len(self._cache), sum(size for _, size in self._cache.values())
+
+    def acquire_slot(self, name, limit, holder, owner):
+        with self._lock:
+            holders = self._slots.setdefault(name, set())
+            if len(holders) >= limit:
+                return False
+            holders.add(holder)
+            return True
+
+    def release_slot(self, name, holder):
+        with self._lock:
+            self._slots.get(name, set()).discard(holder)
+
+    def slots_in_use(self, name):
+        with self._lock:
+            return len(self._slots.get(name, ()))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at);
+CREATE TABLE IF NOT EXISTS active (
+    cache_key TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    owner TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    atime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_atime ON cache_entries (atime);
+CREATE TABLE IF NOT EXISTS slots (
+    name TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    PRIMARY KEY (name, holder)
+);
+"""
+
+class SQLiteBackend(StateBackend):
+    """Estado en un archivo SQLite en modo WAL, compartido por los procesos de un nodo.
+
+    WAL permite leer mientras otro proceso escribe; cada hilo usa su propia
+    conexión y, tras un fork, el proceso hijo abre conexiones nuevas.
+    """
+
+    shared = True
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect(write=False) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self, write=True):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return _Transaction(conn, write)
+
+    def save_job(self, data):
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO jobs (id, owner, status, created_at, finished_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (data["job_id"], data["owner"], data["status"], data["created_at"], data["finished_at"],
+                 json.dumps(data, default=str)),
+            )
+
+    def load_job(self, job_id):
+        with self._connect(write=False) as db:
+            row = db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest_job(self):
+        with self._connect(write=False) as db:
+            row = db.execute("SELECT data FROM jobs ORDER BY created_at DESC LIMIT 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_job(self, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def prune_jobs(self, cutoff):
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+
+    def fail_orphaned_jobs(self, message):
+        with self._connect() as db:
+            rows = db.execute("SELECT data FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            orphaned = [data for data in (json.loads(row[0]) for row in rows) if not owner_alive(data["owner"])]
+            now = time.time()
+            for data in orphaned:
+                data.update(status="error", error=message, finished_at=now)
+                data["progress"]["phase"] = "error"
+                db.execute("UPDATE jobs SET status = 'error', finished_at = ?, data = ? WHERE id = ?",
+                           (now, json.dumps(data, default=str), data["job_id"]))
+            owners = {row[0] for row in db.execute("SELECT DISTINCT owner FROM active")}
+            for owner in owners:
+                if not owner_alive(owner):
+                    db.execute("DELETE FROM active WHERE owner = ?", (owner,))
+            self._release_dead_slots(db)
+        return len(orphaned)
+
+    def _release_dead_slots(self, db):
+        owners = {row[0] for row in db.execute("SELECT DISTINCT owner FROM slots")}
+        for owner in owners:
+            if not owner_alive(owner):
+                db.execute("DELETE FROM slots WHERE owner = ?", (owner,))
+
+    def claim_active(self, cache_key, job_id, owner):
+        with self._connect() as db:
+            row = db.execute("SELECT job_id, owner FROM active WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row is not None and not owner_alive(row[1]):
+                row = None
+            if row is not None:
+                return row[0]
+            db.execute("INSERT OR REPLACE INTO active (cache_key, job_id, owner) VALUES (?, ?, ?)",
+                       (cache_key, job_id, owner))
+            return job_id
+
+    def release_active(self, cache_key, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM active WHERE cache_key = ? AND job_id = ?", (cache_key, job_id))
+
+    def get_metadata(self, key):
+        with self._connect(write=False) as db:
+            row = db.execute("SELECT expires_at, value FROM metadata WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] <= time.time():
+            return None
+        return json.loads(row[1]), row[0]
+
+    def set_metadata(self, key, value, expires_at):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO metadata (key, expires_at, value) VALUES (?, ?, ?)",
+                       (key, expires_at, json.dumps(value, default=str)))
+            db.execute("DELETE FROM metadata WHERE expires_at <= ?", (time.time(),))
+
+    def pop_metadata(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+
+    def cache_get(self, key):
+        with self._connect(write=False) as db:
+            row = db.execute("SELECT path, size FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def cache_put(self, key, path, size, atime=None):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO cache_entries (key, path, size, atime) VALUES (?, ?, ?, ?)",
+                       (key, path, size, time.time() if atime is None else atime))
+
+    def cache_touch(self, key):
+        with self._connect() as db:
+            db.execute("UPDATE cache_entries SET atime = ? WHERE key = ?", (time.time(), key))
+
+    def cache_delete(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def cache_lru(self):
+        with self._connect(write=False) as db:
+            return db.execute("SELECT key, path, size FROM cache_entries ORDER BY atime").fetchall()
+
+    def cache_totals(self):
+        with self._connect(write=False) as db:
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        return count, total
+
+    def acquire_slot(self, name, limit, holder, owner):
+        with self._connect() as db:
+            used = db.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            if used >= limit:
+                # Solo al estar lleno: comprobar los dueños cuesta una llamada por proceso
+                self._release_dead_slots(db)
+                used = db.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            if used >= limit:
+                return False
+            db.execute("INSERT INTO slots (name, holder, owner) VALUES (?, ?, ?)", (name, holder, owner))
+            return True
+
+    def release_slot(self, name, holder):
+        with self._connect() as db:
+            db.execute("DELETE FROM slots WHERE name = ? AND holder = ?", (name, holder))
+
+    def slots_in_use(self, name):
+        with self._connect(write=False) as db:
+            return db.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+
+    def stats(self):
+        stats = super().stats()
+        stats["path"] = self.path
+        with self._connect(write=False) as db:
+            stats["jobs"] = db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            stats["metadata"] = db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        return stats
+
+class SharedSemaphore:
+    """Semáforo de limit huecos para todos los procesos que comparten el backend.
+
+    Con un backend compartido, DOWNLOAD_WORKERS o el número de conversiones
+    limitan el nodo y no cada proceso. acquire() espera turno: una liberación
+    del mismo proceso despierta al instante y las de otros se ven consultando
+    cada poll segundos.
+    """
+
+    def __init__(self, state, name, limit, poll=0.25):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.poll = poll
+        self._freed = threading.Condition()
+        self.waits = 0
+
+    def acquire(self, blocking=True):
+        """Ocupar un hueco; devuelve el identificador que lo libera, o None sin blocking"""
+        holder = uuid.uuid4().hex
+        waited = False
+        with self._freed:
+            while not self.state.acquire_slot(self.name, self.limit, holder, current_owner()):
+                if not blocking:
+                    return None
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                self._freed.wait(self.poll)
+        return holder
+
+    def release(self, holder):
+        self.state.release_slot(self.name, holder)
+        with self._freed:
+            self._freed.notify()
+
+    def available(self):
+        return self.limit - self.state.slots_in_use(self.name)
+
+    def stats(self):
+        return {"limit": self.limit, "in_use": self.state.slots_in_use(self.name), "waits": self.waits}
+
+class _Transaction:
+    """Bloque de escritura en una transacción IMMEDIATE, atómico entre procesos.
+
+    Las lecturas (write=False) no abren transacción: en WAL cada consulta ve
+    una instantánea coherente sin bloquear a los escritores.
+    """
+
+    def __init__(self, conn, write):
+        self.conn = conn
+        self.write = write
+
+    def __enter__(self):
+        if self.write:
+            self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.write:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def open_backend(url):
+    """Crear el backend a partir de una URL: memory:// o sqlite:///ruta/al/archivo.db"""
+    if url in ("memory", "memory://"):
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        # Como en SQLAlchemy: sqlite:///relativa.db y sqlite:////absoluta.db
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Backend de estado no soportado: {url}")
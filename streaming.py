@@ -0,0 +1,141 @@
+import os
+import queue
+import re
+import threading
+from contextlib import nullcontext
+
+# Tamaño de cada bloque enviado al cliente
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Tamaño de cada petición Range al origen, como hace yt-dlp para evitar la limitación
+STREAM_RANGE_SIZE = 10 * 1024 * 1024
+
+_DONE = object()
+
+def is_streamable(fmt):
+    """Un formato se puede transmitir directamente si ya contiene video y audio"""
+    return (
+        fmt.get('vcodec') not in (None, 'none')
+        and fmt.get('acodec') not in (None, 'none')
+        and fmt.get('protocol', 'https') in ('http', 'https')
+        and bool(fmt.get('url'))
+    )
+
+def find_format(info, format_id):
+    for f in info.get("formats", []):
+        if f.get("format_id") == format_id:
+            return f
+    return None
+
+def _fetch_ranges(ydl, fmt, cancelled, connections=None):
+    """Leer el formato del origen en peticiones Range sucesivas, cada una dentro del
+    límite global de conexiones si se indica connections"""
+    from yt_dlp.networking import Request
+
+    headers = dict(fmt.get("http_headers") or {})
+    total = fmt.get("filesize")
+    start = 0
+
+    while not cancelled.is_set():
+        end = start + STREAM_RANGE_SIZE - 1
+        if total:
+            end = min(end, total - 1)
+        headers["Range"] = f"bytes={start}-{end}"
+
+        received = 0
+        limit = connections.connection() if connections is not None else nullcontext()
+        with limit, ydl.urlopen(Request(fmt["url"], headers=headers)) as response:
+            # Sin soporte de Range el origen envía el archivo completo
+            full_body = response.status == 200
+            if total is None:
+                match = re.search(r'/(\d+)$', response.headers.get("Content-Range", ""))
+                if match:
+                    total = int(match.group(1))
+
+            while not cancelled.is_set():
+                chunk = response.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                yield chunk
+
+        requested = end - start + 1
+        start += received
+        if cancelled.is_set() or (total and start >= total):
+            return
+        if full_body or received < requested:
+            # El origen entregó menos de lo pedido: no quedan más bytes
+            if total and start < total:
+                raise IOError(f"Transferencia incompleta: {start} de {total} bytes")
+            return
+
+def iter_stream(pool, ydl_opts, fmt, spool_path=None, on_complete=None, buffer_chunks=32, bandwidth=None,
+                connections=None):
+    """Generador que envía los bytes al cliente mientras se descargan.
+
+    Un hilo productor lee del origen y llena una cola acotada; si el cliente
+    lee más despacio, la cola se llena y el productor se detiene (contrapresión).
+    Si se indica spool_path, los bytes se guardan también en disco y al terminar
+    se llama a on_complete(spool_path). Con bandwidth (un BandwidthAllocator) la
+    transmisión recibe su cuota del caudal como una descarga más, y con
+    connections (un ConnectionLimiter) cuenta sus conexiones al origen.
+    """
+    buffer = queue.Queue(maxsize=buffer_chunks)
+    cancelled = threading.Event()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        spool = open(spool_path, "wb") if spool_path else None
+        share = bandwidth.register() if bandwidth is not None else None
+        completed = False
+        try:
+            with pool.checkout(ydl_opts) as ydl:
+                for chunk in _fetch_ranges(ydl, fmt, cancelled, connections):
+                    if share:
+                        share.consume(len(chunk))
+                    if spool:
+                        spool.write(chunk)
+                    if not put(chunk):
+                        return
+            completed = not cancelled.is_set()
+            if spool:
+                spool.close()
+                spool = None
+                if completed and on_complete:
+                    try:
+                        on_complete(spool_path)
+                    except Exception:
+                        # El cliente ya recibió todo; solo se pierde la copia en disco
+                        completed = False
+            put(_DONE)
+        except Exception as e:
+            put(e)
+        finally:
+            if share:
+                share.close()
+            if spool:
+                spool.close()
+            if spool_path and not completed and os.path.exists(spool_path):
+                os.remove(spool_path)
+
+    threading.Thread(target=producer, name="stream", daemon=True).start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # El cliente se desconectó o la transferencia terminó
+        cancelled.set()
@@ -0,0 +1,102 @@
+import io
+import zipfile
+from contextlib import contextmanager
+
+import pytest
+
+from batch import BatchEntry, iter_zip, list_entries, start_entries
+from scheduler import QueueFull
+
+class FinishedJob:
+    def __init__(self, path):
+        self.path = path
+        self.status = "finished"
+        self.error = None
+
+    def wait(self, timeout=None):
+        return True
+
+class FakeQueue:
+    """start_job que admite hasta capacity trabajos sin terminar"""
+
+    def __init__(self, tmp_path, capacity):
+        self.tmp_path = tmp_path
+        self.capacity = capacity
+        self.in_flight = 0
+        self.started = []
+
+    def start_job(self, url):
+        if self.in_flight >= self.capacity:
+            raise QueueFull("La cola de descargas está llena", 5)
+        self.in_flight += 1
+        self.started.append(url)
+        path = self.tmp_path / f"{url}.mp3"
+        path.write_bytes(url.encode())
+        return FinishedJob(str(path))
+
+    def open_result(self, job):
+        def release():
+            self.in_flight -= 1
+        return job.path, release
+
+def entries(count):
+    return [BatchEntry(index, f"video{index}") for index in range(1, count + 1)]
+
+def read_zip(chunks):
+    return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+def test_start_entries_starts_first_entries(tmp_path):
+    queue = FakeQueue(tmp_path, capacity=10)
+    batch = entries(5)
+    start_entries(batch, queue.start_job, max_parallel=2)
+    assert queue.started == ["video1", "video2"]
+    assert batch[2].job is None
+
+def test_start_entries_rejects_batch_when_nothing_is_admitted(tmp_path):
+    queue = FakeQueue(tmp_path, capacity=0)
+    with pytest.raises(QueueFull):
+        start_entries(entries(3), queue.start_job)
+
+def test_start_entries_stops_at_queue_limit(tmp_path):
+    queue = FakeQueue(tmp_path, capacity=1)
+    batch = entries(3)
+    start_entries(batch, queue.start_job, max_parallel=3)
+    assert queue.started == ["video1"]
+    assert batch[1].error is None
+
+def test_zip_retries_rejected_entries_as_others_finish(tmp_path):
+    queue = FakeQueue(tmp_path, capacity=1)
+    batch = entries(4)
+    start_entries(batch, queue.start_job, max_parallel=4)
+    archive = read_zip(iter_zip(batch, queue.start_job, queue.open_result, max_parallel=4))
+    assert archive.namelist() == [f"{index:03d} - video{index}.mp3" for index in range(1, 5)]
+    assert archive.read("003 - video3.mp3") == b"video3"
+
+def test_zip_reports_entries_rejected_with_nothing_in_flight(tmp_path):
+    queue = FakeQueue(tmp_path, capacity=0)
+    archive = read_zip(iter_zip(entries(2), queue.start_job, queue.open_result))
+    assert archive.namelist() == ["errores.txt"]
+    assert "llena" in archive.read("errores.txt").decode()
+
+class RecordingPool:
+    def __init__(self, info):
+        self.info = info
+        self.opts = []
+
+    @contextmanager
+    def checkout(self, opts):
+        self.opts.append(opts)
+        info = self.info
+
+        class Ydl:
+            def extract_info(self, url, download=False):
+                return info
+        yield Ydl()
+
+def test_list_entries_limits_flat_playlist():
+    info = {"entries": [{"id": f"vid{index:08d}", "title": str(index)} for index in range(5)]}
+    pool = RecordingPool(info)
+    found = list_entries(["https://www.youtube.com/playlist?list=PL1"], pool, {"quiet": True}, max_entries=3)
+    assert pool.opts == [{"quiet": True, "extract_flat": "in_playlist", "playlistend": 3}]
+    assert [entry.index for entry in found] == [1, 2, 3]
+    assert found[0].url == "https://www.youtube.com/watch?v=vid00000000"
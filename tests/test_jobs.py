@@ -0,0 +1,166 @@
+import threading
+import time
+
+import pytest
+
+from jobs import Job, JobManager
+from scheduler import PRIORITY_NORMAL, PRIORITY_SPECULATIVE, QueueFull
+from state import SQLiteBackend, current_owner
+
+def blocking(release):
+    def func(job):
+        release.wait(5)
+        return "video.mp4"
+    return func
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+def manager(tmp_path, state_path=None, **kwargs):
+    state = SQLiteBackend(state_path) if state_path else None
+    return JobManager(str(tmp_path / "jobs"), state=state, **kwargs)
+
+def test_same_key_is_coalesced(tmp_path, release):
+    jobs = manager(tmp_path)
+    first = jobs.submit("url", "18", blocking(release), cache_key="k")
+    second = jobs.submit("url", "18", blocking(release), cache_key="k")
+    other = jobs.submit("url", "22", blocking(release), cache_key="other")
+    assert second is first
+    assert other is not first
+    assert jobs.coalesced == 1
+
+    release.set()
+    assert first.wait(5)
+    assert first.status == "finished"
+    assert first.filename == "video.mp4"
+    # Terminado, la clave ya no agrupa
+    assert jobs.submit("url", "18", blocking(release), cache_key="k") is not first
+
+def test_key_claimed_by_other_process_is_coalesced(tmp_path, state_path, release):
+    first_process = manager(tmp_path, state_path)
+    second_process = manager(tmp_path, state_path)
+    job = first_process.submit("url", "18", blocking(release), cache_key="k")
+
+    remote = second_process.submit("url", "18", blocking(release), cache_key="k")
+    assert remote.remote
+    assert remote.id == job.id
+    assert second_process.coalesced == 1
+
+    release.set()
+    assert remote.wait(5)
+    assert remote.status == "finished"
+
+def test_claim_without_saved_job_is_dropped(tmp_path, state_path, release):
+    state = SQLiteBackend(state_path)
+    state.claim_active("k", "missing", current_owner())
+    jobs = manager(tmp_path, state_path)
+
+    job = jobs.submit("url", "18", blocking(release), cache_key="k")
+    assert not job.remote
+    assert state.claim_active("k", "other", current_owner()) == job.id
+
+def wait_running(job):
+    deadline = time.monotonic() + 5
+    while job.status != "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == "running"
+
+def test_queue_full_releases_claim(tmp_path, state_path, release):
+    jobs = manager(tmp_path, state_path, max_workers=1, max_queued=1)
+    wait_running(jobs.submit("url", "18", blocking(release), cache_key="running"))
+    jobs.submit("url", "18", blocking(release), cache_key="queued")
+
+    with pytest.raises(QueueFull) as excinfo:
+        jobs.submit("url", "18", blocking(release), cache_key="rejected")
+    assert excinfo.value.retry_after >= 1
+    state = SQLiteBackend(state_path)
+    assert state.claim_active("rejected", "other", current_owner()) == "other"
+
+def test_orphaned_jobs_fail_on_start(tmp_path, state_path, dead_owner):
+    state = SQLiteBackend(state_path)
+    job = Job("orphan", "url", "18", str(tmp_path / "orphan"), state=state)
+    job.owner = dead_owner
+    job.set_status("running")
+
+    jobs = manager(tmp_path, state_path)
+    orphan = jobs.get("orphan")
+    assert orphan.status == "error"
+    assert orphan.error
+
+def test_reserve_slot(tmp_path, release):
+    jobs = manager(tmp_path, max_workers=2, max_streams_per_client=1)
+    first = jobs.reserve_slot("a")
+    assert first is not None
+    # Un cliente no pasa de max_streams_per_client
+    assert jobs.reserve_slot("a") is None
+    second = jobs.reserve_slot("b")
+    assert jobs.reserve_slot("c") is None
+    assert jobs.idle_workers() == 0
+
+    first()
+    first()
+    assert jobs.idle_workers() == 1
+    second()
+    assert jobs.stats()["streams"] == 0
+
+def test_queued_job_waits_for_reserved_slot(tmp_path, release):
+    jobs = manager(tmp_path, max_workers=1)
+    release_slot = jobs.reserve_slot("a")
+    job = jobs.submit("url", "18", blocking(release), cache_key="k")
+    release.set()
+    assert not job.wait(0.3)
+    assert job.status == "queued"
+    release_slot()
+    assert job.wait(5)
+
+def speculate(jobs, format_id, cache_key, func):
+    return jobs.submit("url", format_id, func, cache_key=cache_key, priority=PRIORITY_SPECULATIVE, speculative=True)
+
+def until_cancelled(job):
+    # Como el hook de progreso de una descarga: para al pedir la cancelación
+    job.cancel_requested.wait(5)
+    raise RuntimeError("cancelada")
+
+def test_requested_job_preempts_speculative(tmp_path, release):
+    jobs = manager(tmp_path, max_workers=1)
+    older = speculate(jobs, "18", "older", until_cancelled)
+    wait_running(older)
+    queued_guess = speculate(jobs, "22", "guess", until_cancelled)
+
+    job = jobs.submit("url", "18", blocking(release), cache_key="wanted")
+    assert older.wait(5)
+    assert older.status == "cancelled"
+    wait_running(job)
+    assert jobs.stats()["preempted"] == 1
+    # La especulativa en cola sigue esperando detrás
+    assert queued_guess.status == "queued"
+
+def test_no_preemption_with_idle_worker(tmp_path, release):
+    jobs = manager(tmp_path, max_workers=2)
+    guess = speculate(jobs, "18", "guess", until_cancelled)
+    wait_running(guess)
+    wait_running(jobs.submit("url", "22", blocking(release), cache_key="wanted"))
+    assert guess.status == "running"
+    assert jobs.stats()["preempted"] == 0
+    guess.cancel_requested.set()
+
+def test_promoted_speculative_preempts_newest(tmp_path, release):
+    jobs = manager(tmp_path, max_workers=1)
+    running = speculate(jobs, "18", "running", until_cancelled)
+    wait_running(running)
+    queued = speculate(jobs, "22", "queued", blocking(release))
+    assert jobs.stats()["preempted"] == 0
+
+    # Adopción: deja de ser especulativa y pasa a esperar como pedida
+    queued.speculative = False
+    jobs.promote(queued, PRIORITY_NORMAL)
+    assert running.wait(5)
+    assert running.status == "cancelled"
+    wait_running(queued)
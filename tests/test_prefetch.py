@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager
+from prefetch import ADOPTED_KEY, Prefetcher
+from state import MemoryBackend
+
+def until_cancelled(job):
+    job.cancel_requested.wait(5)
+    raise RuntimeError("cancelada")
+
+@pytest.fixture
+def state():
+    return MemoryBackend()
+
+def prefetcher(tmp_path, state, ttl=120):
+    jobs = JobManager(str(tmp_path / "jobs"), max_workers=1, state=state)
+    return Prefetcher(jobs, state, budget_bytes=1000, ttl=ttl, poll=0.02)
+
+def test_adopt_promotes_speculative_job(tmp_path, state):
+    prefetch = prefetcher(tmp_path, state)
+    job = prefetch.start("client", "url", "18", "key", 100, until_cancelled)
+    assert prefetch.adopt(job)
+    assert not job.speculative
+    assert prefetch.stats()["adopted"] == 1
+    job.cancel_requested.set()
+
+def test_expired_speculation_is_marked_before_adopt_can_see_it(tmp_path, state):
+    prefetch = prefetcher(tmp_path, state, ttl=0)
+    job = prefetch.start("client", "url", "18", "key", 100, until_cancelled)
+    assert job.wait(5)
+    assert job.status == "cancelled"
+
+    # Sin entrada y cancelada: no se adopta ni se avisa a otros procesos
+    assert not prefetch.adopt(job)
+    assert state.get_metadata(ADOPTED_KEY + job.id) is None
+    assert prefetch.stats()["adopted"] == 0
+    assert prefetch.stats()["cancelled"] == 1
+
+def test_adopt_in_reaper_gap_is_refused(tmp_path, state):
+    prefetch = prefetcher(tmp_path, state)
+    job = prefetch.start("client", "url", "18", "key", 100, until_cancelled)
+    entered = threading.Event()
+    proceed = threading.Event()
+    cancel = prefetch.jobs.cancel
+
+    def slow_cancel(job):
+        # El reaper ya quitó la entrada y soltó el candado
+        entered.set()
+        proceed.wait(5)
+        cancel(job)
+
+    prefetch.jobs.cancel = slow_cancel
+    prefetch._entries["key"].expires_at = time.monotonic()
+    assert entered.wait(5)
+    assert not prefetch.adopt(job)
+    assert state.get_metadata(ADOPTED_KEY + job.id) is None
+    proceed.set()
+    assert job.wait(5)
+
+def test_abandon_marks_job_cancelled(tmp_path, state):
+    prefetch = prefetcher(tmp_path, state)
+    job = prefetch.start("client", "url", "18", "key", 100, until_cancelled)
+    prefetch.abandon("client")
+    assert not prefetch.adopt(job)
+    assert job.wait(5)
@@ -0,0 +1,117 @@
+import os
+import time
+
+import pytest
+
+from result_cache import STALE_TMP_SECONDS, ResultCache
+from state import MemoryBackend, SQLiteBackend
+
+def make_file(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+@pytest.fixture
+def incoming(tmp_path):
+    path = tmp_path / "incoming"
+    path.mkdir()
+    return str(path)
+
+def test_lru_eviction(tmp_path, incoming):
+    cache = ResultCache(str(tmp_path / "cache"), quota_bytes=250)
+    cache.publish("a", make_file(incoming, "a.mp4", 100))
+    cache.publish("b", make_file(incoming, "b.mp4", 100))
+    assert cache.lookup("a") is not None
+    cache.publish("c", make_file(incoming, "c.mp4", 100))
+
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") is not None
+    assert cache.lookup("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert not os.path.exists(os.path.join(cache.root, "b"))
+
+def test_pinned_entry_is_evicted_on_release(tmp_path, incoming):
+    cache = ResultCache(str(tmp_path / "cache"), quota_bytes=150)
+    cache.publish("a", make_file(incoming, "a.mp4", 100))
+    path = cache.acquire("a")
+
+    # Sobre la cuota, pero "a" se está enviando y "b" se acaba de publicar
+    cache.publish("b", make_file(incoming, "b.mp4", 100))
+    assert os.path.exists(path)
+    assert cache.total_bytes == 200
+
+    cache.release("a")
+    assert not os.path.exists(path)
+    assert cache.lookup("a") is None
+    assert cache.lookup("b") is not None
+    assert cache.total_bytes == 100
+
+def test_entry_stays_pinned_until_last_reader(tmp_path, incoming):
+    cache = ResultCache(str(tmp_path / "cache"), quota_bytes=150)
+    cache.publish("a", make_file(incoming, "a.mp4", 100))
+    path = cache.acquire("a")
+    cache.acquire("a")
+    cache.publish("b", make_file(incoming, "b.mp4", 100))
+    cache.acquire("b")
+
+    cache.release("a")
+    assert os.path.exists(path)
+    cache.release("a")
+    assert not os.path.exists(path)
+    assert cache.lookup("b") is not None
+
+def test_duplicate_publish_keeps_first(tmp_path, incoming):
+    cache = ResultCache(str(tmp_path / "cache"), quota_bytes=1000)
+    first = cache.publish("a", make_file(incoming, "a.mp4", 100))
+    second = cache.publish("a", make_file(incoming, "a2.mp4", 50))
+    assert second == first
+    assert cache.total_bytes == 100
+    assert not os.path.exists(os.path.join(incoming, "a2.mp4"))
+
+def test_load_reconciles_index_with_disk(tmp_path, incoming):
+    root = str(tmp_path / "cache")
+    state = SQLiteBackend(str(tmp_path / "state.db"))
+    cache = ResultCache(root, quota_bytes=1000, state=state)
+    kept = cache.publish("kept", make_file(incoming, "kept.mp4", 100))
+    removed = cache.publish("removed", make_file(incoming, "removed.mp4", 100))
+    os.remove(removed)
+
+    # Publicado con otro índice: archivo sin entrada
+    orphan_dir = os.path.join(root, "orphan")
+    os.makedirs(orphan_dir)
+    orphan = make_file(orphan_dir, "orphan.mp4", 50)
+    # Restos de publicaciones: uno abandonado y otro que puede estar en curso
+    stale_tmp = os.path.join(root, "x.tmp-old")
+    fresh_tmp = os.path.join(root, "y.tmp-new")
+    os.makedirs(stale_tmp)
+    os.makedirs(fresh_tmp)
+    old = time.time() - STALE_TMP_SECONDS - 60
+    os.utime(stale_tmp, (old, old))
+    # Directorio con más de un archivo: publicación incompleta
+    broken_dir = os.path.join(root, "broken")
+    os.makedirs(broken_dir)
+    make_file(broken_dir, "one", 10)
+    make_file(broken_dir, "two", 10)
+
+    cache = ResultCache(root, quota_bytes=1000, state=state)
+    assert cache.lookup("kept") == kept
+    assert cache.lookup("removed") is None
+    assert cache.lookup("orphan") == orphan
+    assert cache.total_bytes == 150
+    assert not os.path.exists(stale_tmp)
+    assert os.path.exists(fresh_tmp)
+    assert not os.path.exists(broken_dir)
+
+def test_load_rebuilds_lost_index_in_atime_order(tmp_path, incoming):
+    root = str(tmp_path / "cache")
+    cache = ResultCache(root, quota_bytes=1000)
+    older = cache.publish("older", make_file(incoming, "older.mp4", 100))
+    newer = cache.publish("newer", make_file(incoming, "newer.mp4", 100))
+    os.utime(older, (time.time() - 100, os.stat(older).st_mtime))
+    os.utime(newer, (time.time(), os.stat(newer).st_mtime))
+
+    # Índice nuevo y cuota menor: se expulsa la entrada usada hace más tiempo
+    cache = ResultCache(root, quota_bytes=150, state=MemoryBackend())
+    assert cache.lookup("older") is None
+    assert cache.lookup("newer") == newer
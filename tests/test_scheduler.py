@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from scheduler import PRIORITY_NORMAL, PRIORITY_SMALL, PRIORITY_SPECULATIVE, BandwidthAllocator, FairQueue, QueueFull
+
+def drain(queue):
+    return [queue.get() for _ in range(len(queue))]
+
+def test_clients_are_served_in_turns():
+    queue = FairQueue()
+    for item in ("a1", "a2", "a3"):
+        queue.put(item, "a")
+    queue.put("b1", "b")
+    assert drain(queue) == ["a1", "b1", "a2", "a3"]
+
+def test_small_jobs_go_first():
+    queue = FairQueue()
+    queue.put("a-big", "a", PRIORITY_NORMAL)
+    queue.put("a-small", "a", PRIORITY_SMALL)
+    queue.put("b-big", "b", PRIORITY_NORMAL)
+    queue.put("b-small", "b", PRIORITY_SMALL)
+    assert drain(queue) == ["a-small", "b-small", "a-big", "b-big"]
+
+def test_speculative_jobs_wait_for_everything_else():
+    queue = FairQueue()
+    queue.put("guess", "a", PRIORITY_SPECULATIVE)
+    queue.put("real", "b", PRIORITY_NORMAL)
+    assert drain(queue) == ["real", "guess"]
+
+def test_waiting_normal_job_ages_into_small():
+    queue = FairQueue(aging=0.05)
+    queue.put("old", "a", PRIORITY_NORMAL)
+    time.sleep(0.1)
+    queue.put("new", "b", PRIORITY_SMALL)
+    assert drain(queue) == ["old", "new"]
+
+def test_speculative_jobs_do_not_age():
+    queue = FairQueue(aging=0.05)
+    queue.put("guess", "a", PRIORITY_SPECULATIVE)
+    time.sleep(0.1)
+    queue.put("real", "b", PRIORITY_NORMAL)
+    assert drain(queue) == ["real", "guess"]
+
+def test_queue_limits():
+    queue = FairQueue(max_depth=3, max_per_client=2)
+    queue.put(1, "a")
+    queue.put(2, "a")
+    with pytest.raises(QueueFull):
+        queue.put(3, "a")
+    queue.put(3, "b")
+    with pytest.raises(QueueFull):
+        queue.put(4, "c")
+    assert queue.stats()["rejected"] == 2
+
+def test_remove_and_promote():
+    queue = FairQueue()
+    queue.put("x", "a")
+    queue.put("y", "a")
+    queue.put("z", "b", PRIORITY_SPECULATIVE)
+    assert queue.remove(lambda item: item == "x")
+    assert not queue.remove(lambda item: item == "x")
+    assert queue.promote(lambda item: item == "z", PRIORITY_SMALL)
+    assert drain(queue) == ["z", "y"]
+    assert queue.stats()["clients"] == 0
+
+def test_bandwidth_is_split_between_shares():
+    allocator = BandwidthAllocator(rate=1000)
+    first = allocator.register()
+    assert allocator.share_rate() == 1000
+    second = allocator.register()
+    assert allocator.share_rate() == 500
+    first.close()
+    second.close()
+    assert allocator.share_rate() == 1000
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+import pytest
+
+from connections import ConnectionLimiter
+from fake_origin import MediaOrigin, synthetic_bytes
+from segmented import SegmentedHttpFD, SegmentedYoutubeDL
+
+SEGMENT = 64 * 1024
+TOTAL = 10 * SEGMENT + 1000
+
+@pytest.fixture(scope="module")
+def origin():
+    origin = MediaOrigin().start()
+    yield origin
+    origin.stop()
+
+def download(origin, tmp_path, expected, size=TOTAL, **params):
+    """Descargar, comprobar el archivo y que el origen sirvió expected bytes"""
+    sent = origin.bytes_sent
+    params = dict(quiet=True, noprogress=True, connection_limiter=ConnectionLimiter(4),
+                  segmented_connections=2, segment_size=SEGMENT, **params)
+    info = {"id": "x", "ext": "mp4", "protocol": "http", "url": f"{origin.base_url}/media/{size}/x.mp4"}
+    filename = str(tmp_path / "x.mp4")
+    with SegmentedYoutubeDL(params) as ydl:
+        assert SegmentedHttpFD(ydl, ydl.params).download(filename, info)
+    with open(filename, "rb") as f:
+        assert f.read() == synthetic_bytes(0, size)
+    # El origen suma los bytes al terminar cada respuesta, quizá después de que se lean
+    deadline = time.monotonic() + 2
+    while origin.bytes_sent - sent != expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert origin.bytes_sent - sent == expected
+
+def write_partial(tmp_path, done, segment_size=SEGMENT, total=TOTAL):
+    """.part con los segmentos done completos y el resto vacío, y su .ytdl"""
+    data = bytearray(total)
+    for index in done:
+        start = index * segment_size
+        end = min(start + segment_size, total)
+        data[start:end] = synthetic_bytes(start, end - start)
+    (tmp_path / "x.mp4.part").write_bytes(bytes(data))
+    state = {"segmented": {"total": total, "segment_size": segment_size, "done": sorted(done)}}
+    (tmp_path / "x.mp4.ytdl").write_text(json.dumps(state))
+
+def test_full_download(origin, tmp_path):
+    # El sondeo de tamaño pide un byte
+    download(origin, tmp_path, TOTAL + 1)
+    assert not os.path.exists(tmp_path / "x.mp4.part")
+    assert not os.path.exists(tmp_path / "x.mp4.ytdl")
+
+def test_resume_skips_completed_segments(origin, tmp_path):
+    done = {0, 1, 4, 10}
+    write_partial(tmp_path, done)
+    skipped = 3 * SEGMENT + 1000
+    download(origin, tmp_path, TOTAL - skipped + 1)
+    assert not os.path.exists(tmp_path / "x.mp4.ytdl")
+
+def test_state_for_other_segment_size_is_ignored(origin, tmp_path):
+    write_partial(tmp_path, {0, 1}, segment_size=SEGMENT // 2)
+    download(origin, tmp_path, TOTAL + 1)
+
+def test_state_without_part_file_is_ignored(origin, tmp_path):
+    write_partial(tmp_path, {0, 1})
+    os.remove(tmp_path / "x.mp4.part")
+    download(origin, tmp_path, TOTAL + 1)
+
+def test_no_resume_without_continuedl(origin, tmp_path):
+    write_partial(tmp_path, {0, 1})
+    download(origin, tmp_path, TOTAL + 1, continuedl=False)
+
+def test_small_file_falls_back_to_single_connection(origin, tmp_path):
+    download(origin, tmp_path, SEGMENT + 1, size=SEGMENT)
+
+def test_fallback_holds_a_connection(origin, tmp_path):
+    limiter = ConnectionLimiter(1)
+    peaks = []
+    info = {"id": "x", "ext": "mp4", "protocol": "http", "url": f"{origin.base_url}/media/{SEGMENT}/x.mp4"}
+    params = dict(quiet=True, noprogress=True, connection_limiter=limiter, segmented_connections=2,
+                  segment_size=SEGMENT)
+    with SegmentedYoutubeDL(params) as ydl:
+        fd = SegmentedHttpFD(ydl, ydl.params)
+        fd.add_progress_hook(lambda d: peaks.append(limiter.active))
+        assert fd.download(str(tmp_path / "x.mp4"), info)
+    assert peaks and all(active == 1 for active in peaks)
+    assert limiter.active == 0
@@ -0,0 +1,128 @@
+import json
+import time
+
+import pytest
+
+from state import MemoryBackend, SharedSemaphore, SQLiteBackend, current_owner, owner_alive
+
+def job_data(job_id, owner, status="running"):
+    return {
+        "job_id": job_id,
+        "owner": owner,
+        "status": status,
+        "created_at": time.time(),
+        "finished_at": None,
+        "error": None,
+        "progress": {"phase": status},
+    }
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / "state.db"))
+
+def test_claim_active_returns_live_holder(backend):
+    assert backend.claim_active("key", "a", current_owner()) == "a"
+    assert backend.claim_active("key", "b", current_owner()) == "a"
+    backend.release_active("key", "a")
+    assert backend.claim_active("key", "b", current_owner()) == "b"
+
+def test_claim_active_takes_over_dead_owner(backend, dead_owner):
+    assert backend.claim_active("key", "a", dead_owner) == "a"
+    assert backend.claim_active("key", "b", current_owner()) == "b"
+
+def test_release_active_ignores_other_job(backend):
+    backend.claim_active("key", "a", current_owner())
+    backend.release_active("key", "b")
+    assert backend.claim_active("key", "c", current_owner()) == "a"
+
+def test_fail_orphaned_jobs(backend, dead_owner):
+    backend.save_job(job_data("orphan", dead_owner))
+    backend.save_job(job_data("alive", current_owner()))
+    backend.save_job(job_data("done", dead_owner, status="finished"))
+    backend.claim_active("orphan-key", "orphan", dead_owner)
+
+    assert backend.fail_orphaned_jobs("interrumpida") == 1
+
+    orphan = backend.load_job("orphan")
+    assert orphan["status"] == "error"
+    assert orphan["error"] == "interrumpida"
+    assert orphan["progress"]["phase"] == "error"
+    assert orphan["finished_at"] is not None
+    assert backend.load_job("alive")["status"] == "running"
+    assert backend.load_job("done")["status"] == "finished"
+    # La clave del huérfano queda libre
+    assert backend.claim_active("orphan-key", "new", current_owner()) == "new"
+
+def test_jobs_are_visible_to_other_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    SQLiteBackend(path).save_job(job_data("a", current_owner()))
+    assert SQLiteBackend(path).load_job("a")["job_id"] == "a"
+
+@pytest.fixture(params=["memory", "sqlite"])
+def any_backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "state.db"))
+
+def test_slots_respect_limit(any_backend):
+    backend = any_backend
+    owner = current_owner()
+    assert backend.acquire_slot("downloads", 2, "a", owner)
+    assert backend.acquire_slot("downloads", 2, "b", owner)
+    assert not backend.acquire_slot("downloads", 2, "c", owner)
+    # Cada nombre es un límite distinto
+    assert backend.acquire_slot("transcodes", 1, "a", owner)
+    assert backend.slots_in_use("downloads") == 2
+    backend.release_slot("downloads", "a")
+    assert backend.acquire_slot("downloads", 2, "c", owner)
+
+def test_slots_of_dead_owner_are_reclaimed(backend, dead_owner):
+    assert backend.acquire_slot("downloads", 1, "a", dead_owner)
+    assert backend.acquire_slot("downloads", 1, "b", current_owner())
+    assert backend.slots_in_use("downloads") == 1
+
+def test_fail_orphaned_jobs_releases_dead_slots(backend, dead_owner):
+    backend.acquire_slot("downloads", 4, "a", dead_owner)
+    backend.fail_orphaned_jobs("interrumpida")
+    assert backend.slots_in_use("downloads") == 0
+
+def test_shared_semaphore_across_backends(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = SharedSemaphore(SQLiteBackend(path), "downloads", 1, poll=0.01)
+    second = SharedSemaphore(SQLiteBackend(path), "downloads", 1, poll=0.01)
+
+    holder = first.acquire()
+    assert second.acquire(blocking=False) is None
+    assert second.available() == 0
+    first.release(holder)
+    assert second.acquire(blocking=False) is not None
+    assert second.stats() == {"limit": 1, "in_use": 1, "waits": 0}
+
+def test_metadata_expires(backend):
+    backend.set_metadata("info", {"id": "x"}, time.time() + 60)
+    backend.set_metadata("old", {"id": "y"}, time.time() - 1)
+    assert backend.get_metadata("info")[0] == {"id": "x"}
+    assert backend.get_metadata("old") is None
+    assert json.dumps(backend.stats())
+
+@pytest.fixture
+def reused_pid_owner():
+    """Dueño con el PID de este proceso pero de un arranque anterior"""
+    host, pid, *_ = current_owner().split(":")
+    return f"{host}:{pid}:otro-arranque"
+
+def test_owner_with_reused_pid_is_dead(reused_pid_owner):
+    assert owner_alive(current_owner())
+    assert not owner_alive(reused_pid_owner)
+    # Dueños guardados sin marca de arranque: solo se comprueba el PID
+    host, pid, *_ = current_owner().split(":")
+    assert owner_alive(f"{host}:{pid}")
+
+def test_reused_pid_does_not_keep_claims_or_slots(backend, reused_pid_owner):
+    backend.save_job(job_data("stale", reused_pid_owner))
+    assert backend.claim_active("key", "stale", reused_pid_owner) == "stale"
+    assert backend.acquire_slot("downloads", 1, "a", reused_pid_owner)
+
+    assert backend.claim_active("key", "new", current_owner()) == "new"
+    assert backend.acquire_slot("downloads", 1, "b", current_owner())
+    assert backend.fail_orphaned_jobs("interrumpida") == 1
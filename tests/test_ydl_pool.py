@@ -0,0 +1,70 @@
+import threading
+
+from ydl_pool import YoutubeDLPool
+
+class FakeYDL:
+    def __init__(self, opts):
+        self.opts = opts
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakePool(YoutubeDLPool):
+    def _create(self, ydl_opts):
+        return FakeYDL(ydl_opts)
+
+def use(pool, **opts):
+    with pool.checkout(opts) as ydl:
+        return ydl
+
+def test_instances_are_reused_per_options():
+    pool = FakePool()
+    first = use(pool, quiet=True)
+    assert use(pool, quiet=True) is first
+    assert use(pool, quiet=False) is not first
+    assert pool.stats()["reused"] == 1
+    assert pool.stats()["variants"] == 2
+
+def test_idle_instances_are_capped_across_options():
+    pool = FakePool(max_idle=4, max_total_idle=2)
+    old = use(pool, job=1)
+    kept = use(pool, job=2)
+    use(pool, job=1)
+    newest = use(pool, job=3)
+
+    # La clave 2 es la usada hace más tiempo
+    assert kept.closed
+    assert not old.closed and not newest.closed
+    stats = pool.stats()
+    assert stats["idle"] == 2
+    assert stats["variants"] == 2
+    assert stats["discarded"] == 1
+
+def test_idle_instances_are_capped_per_options():
+    pool = FakePool(max_idle=1)
+    barrier = threading.Barrier(2)
+    instances = []
+
+    def borrow():
+        with pool.checkout({"quiet": True}) as ydl:
+            instances.append(ydl)
+            barrier.wait(5)
+
+    threads = [threading.Thread(target=borrow) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(ydl.closed for ydl in instances) == 1
+    assert pool.stats()["idle"] == 1
+
+def test_failed_instance_is_discarded():
+    pool = FakePool()
+    try:
+        with pool.checkout({}) as ydl:
+            raise RuntimeError("roto")
+    except RuntimeError:
+        pass
+    assert ydl.closed
+    assert pool.stats()["idle"] == 0
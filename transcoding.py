@@ -0,0 +1,102 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class TranscodeError(Exception):
+    pass
+
+class TranscodeResult:
+    def __init__(self, path, cpu_seconds, wait_seconds, wall_seconds):
+        self.path = path
+        self.cpu_seconds = cpu_seconds
+        self.wait_seconds = wait_seconds
+        self.wall_seconds = wall_seconds
+
+class TranscodePool:
+    """Conversiones de FFmpeg limitadas a un número fijo de procesos simultáneos.
+
+    Cada codificación ocupa un núcleo, así que el pool se dimensiona con el
+    número de CPUs; las conversiones de más esperan en cola en lugar de
+    sobrecargar la máquina. Con varios procesos, node_slots (un SharedSemaphore
+    del mismo tamaño) reparte esos núcleos entre todos. El tiempo de CPU se
+    mide por proceso con wait4().
+    """
+
+    def __init__(self, max_workers=None, ffmpeg="ffmpeg", node_slots=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.ffmpeg = ffmpeg
+        self.node_slots = node_slots
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcode")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.cpu_seconds = 0.0
+
+    def transcode(self, src, dst, codec_args, on_start=None):
+        """Convertir src en dst esperando turno en el pool; devuelve un TranscodeResult"""
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(self._run_with_slot, src, dst, codec_args, submitted, on_start)
+        return future.result()
+
+    def _run_with_slot(self, src, dst, codec_args, submitted, on_start):
+        # Los núcleos se comparten con las conversiones de los demás procesos
+        lease = self.node_slots.acquire() if self.node_slots else None
+        try:
+            return self._run(src, dst, codec_args, submitted, on_start)
+        finally:
+            if lease:
+                self.node_slots.release(lease)
+
+    def _run(self, src, dst, codec_args, submitted, on_start):
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        if on_start:
+            on_start()
+
+        cmd = [self.ffmpeg, "-y", "-nostdin", "-loglevel", "error", "-i", src, "-vn", *codec_args, dst]
+        try:
+            with tempfile.TemporaryFile() as stderr:
+                proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr)
+                # wait4 devuelve el uso de CPU de este proceso en concreto
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                cpu = usage.ru_utime + usage.ru_stime
+
+                if proc.returncode != 0:
+                    stderr.seek(0)
+                    message = stderr.read().decode("utf-8", "replace").strip()
+                    raise TranscodeError(f"FFmpeg falló ({proc.returncode}): {message[-500:]}")
+        except Exception:
+            with self._lock:
+                self.active -= 1
+                self.failed += 1
+            if os.path.exists(dst):
+                os.remove(dst)
+            raise
+
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+            self.cpu_seconds += cpu
+        return TranscodeResult(dst, cpu, started - submitted, time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cpu_seconds": round(self.cpu_seconds, 3),
+                "node_slots": self.node_slots.stats() if self.node_slots else None,
+            }
@@ -0,0 +1,112 @@
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+def options_key(ydl_opts):
+    """Clave estable para un conjunto de opciones de yt-dlp"""
+    return json.dumps(ydl_opts, sort_keys=True, default=repr)
+
+class YoutubeDLPool:
+    """Instancias de YoutubeDL reutilizables, agrupadas por opciones.
+
+    Crear un YoutubeDL inicializa extractores, el cliente HTTP y el cookiejar;
+    reutilizarlo conserva las conexiones abiertas y ese estado. Cada instancia
+    la usa un solo hilo a la vez (checkout/devolución). Solo es apto para
+    operaciones sin descarga: las descargas llevan hooks, plantillas de salida
+    y contadores propios de cada trabajo.
+
+    max_idle limita las instancias libres de cada conjunto de opciones y
+    max_total_idle las de todos; al superarlo se cierran las de las opciones
+    usadas hace más tiempo.
+    """
+
+    def __init__(self, max_idle=4, max_total_idle=16):
+        self.max_idle = max_idle
+        self.max_total_idle = max_total_idle
+        # clave -> instancias libres; el orden es el del último uso
+        self._idle = OrderedDict()
+        self._total_idle = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _create(self, ydl_opts):
+        import yt_dlp
+        return yt_dlp.YoutubeDL(dict(ydl_opts))
+
+    @contextmanager
+    def checkout(self, ydl_opts):
+        """Prestar una instancia con estas opciones y devolverla al terminar"""
+        import yt_dlp
+
+        key = options_key(ydl_opts)
+        with self._lock:
+            idle = self._idle.get(key)
+            ydl = idle.pop() if idle else None
+            if ydl is None:
+                self.created += 1
+            else:
+                self.reused += 1
+                self._total_idle -= 1
+                if not idle:
+                    del self._idle[key]
+
+        if ydl is None:
+            ydl = self._create(ydl_opts)
+
+        healthy = True
+        try:
+            yield ydl
+        except yt_dlp.utils.YoutubeDLError:
+            # Errores de extracción normales: la instancia sigue siendo válida
+            raise
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            self._return(key, ydl, healthy)
+
+    def _return(self, key, ydl, healthy):
+        evicted = []
+        with self._lock:
+            idle = self._idle.get(key, [])
+            if healthy and len(idle) < self.max_idle:
+                idle.append(ydl)
+                self._idle[key] = idle
+                self._idle.move_to_end(key)
+                self._total_idle += 1
+                # Cerrar las libres de las opciones usadas hace más tiempo
+                while self._total_idle > self.max_total_idle:
+                    oldest_key, oldest = next(iter(self._idle.items()))
+                    evicted.append(oldest.pop(0))
+                    self._total_idle -= 1
+                    if not oldest:
+                        del self._idle[oldest_key]
+                self.discarded += len(evicted)
+            else:
+                self.discarded += 1
+                evicted.append(ydl)
+        for instance in evicted:
+            instance.close()
+
+    def clear(self):
+        """Cerrar todas las instancias libres (por ejemplo, al cambiar las cookies)"""
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+            self._total_idle = 0
+        for ydl in instances:
+            ydl.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "idle": self._total_idle,
+                "max_total_idle": self.max_total_idle,
+                "variants": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+            }